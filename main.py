@@ -1,18 +1,24 @@
 import argparse
+import copy
 import os
 import sys
 import json
-from pipeline.ingest import EpiubLoader
-from pipeline.cleaner import CleanText
 from pipeline.segmenter import Segmenter
 from pipeline.summarizer import Summarizer
 from pipeline.output import JSONFormatter
-from pipeline.sanity_uploader import SanityUploader
+from pipeline.outbox import Outbox
+from pipeline.ledger import Ledger
+from pipeline.provenance import HighlightIndex
+from pipeline.journal import ChapterJournal
+from pipeline.cover import normalize_cover
+from pipeline.instrument import RunRecorder, stage
+from pipeline import metrics, profiling
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import itertools
 import re
-from pipeline.utils import should_skip_chapter
+from pipeline.utils import should_skip_chapter, chapter_fingerprint, match_by_fingerprint, STATE_DIR
 
 
 
@@ -32,12 +38,15 @@ class Spinner:
         sys.stdout.flush()
 
     def __enter__(self):
-        self.thread.start()
+        # Only animate on a terminal; in logs (batch runs, daemons) the frames are just noise
+        if sys.stdout.isatty():
+            self.thread.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop_event.set()
-        self.thread.join()
+        if self.thread.is_alive():
+            self.thread.join()
 
 def extract_text_from_portable_text(blocks):
     """Simple extractor for Sanity Portable Text to plain text."""
@@ -53,19 +62,24 @@ def extract_text_from_portable_text(blocks):
     return "\n\n".join(text_parts)
 
 def load_existing_progress(output_path):
-    """Loads existing summaries and metadata from a JSON output file if it exists."""
+    """
+    Loads existing summaries and metadata from a JSON output file if it exists.
+    Summaries are [(title, summary)] in flattened bookStructure order (a part, then its
+    chapters), which is the chapter index the fingerprint sidecar records.
+    """
     if not os.path.exists(output_path):
-        return {}, "", None, None, []
+        return [], "", None, None, []
     try:
         with open(output_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
-            summaries = {}
+            summaries = []
             for item in data.get('bookStructure', []):
                 if item.get('_type') == 'chapter':
-                    summaries[item.get('chapterTitle')] = extract_text_from_portable_text(item.get('chapterSummary', []))
+                    summaries.append((item.get('chapterTitle'), extract_text_from_portable_text(item.get('chapterSummary', []))))
                 elif item.get('_type') == 'part':
+                    summaries.append((item.get('partTitle'), extract_text_from_portable_text(item.get('partDescription', []))))
                     for ch_item in item.get('chapters', []):
-                        summaries[ch_item.get('chapterTitle')] = extract_text_from_portable_text(ch_item.get('chapterSummary', []))
+                        summaries.append((ch_item.get('chapterTitle'), extract_text_from_portable_text(ch_item.get('chapterSummary', []))))
             
             # Extract existing meta info
             rating = data.get('yourRating')
@@ -81,9 +95,152 @@ def load_existing_progress(output_path):
             return summaries, data.get('bookDescription', ""), rating, affiliate_link, existing_highlights
     except Exception as e:
         print(f"Warning: Could not load existing progress: {e}")
-        return {}, "", None, None, []
+        return [], "", None, None, []
 
-def main():
+def previous_summaries(chapters, existing_summaries, existing_fingerprints):
+    """
+    {chapter index: summary} reusable from an earlier output JSON. Chapters are matched by
+    fingerprint to their previous position, so retitled chapters are reused, edited ones
+    redone, and repeated titles ("Introduction" in every part) never share a summary.
+    Outputs written before fingerprints existed fall back to matching by title.
+    """
+    by_title = {title: summary for title, summary in existing_summaries if summary}
+    if not existing_fingerprints:
+        return {i: by_title[ch.get('title')] for i, ch in enumerate(chapters) if ch.get('title') in by_title}
+    found = {}
+    matches = match_by_fingerprint(chapters, {key: key for key in existing_fingerprints})
+    for i, (prev_index, fp) in matches.items():
+        title = existing_fingerprints[(prev_index, fp)]
+        if prev_index is None:
+            # Sidecar from before positions were recorded
+            summary = by_title.get(title, "")
+        elif prev_index < len(existing_summaries) and existing_summaries[prev_index][0] == title:
+            summary = existing_summaries[prev_index][1]
+        else:
+            summary = ""  # Output and sidecar disagree (edited by hand?): redo the chapter
+        if summary:
+            found[i] = summary
+    return found
+
+def find_cover(book_dir, slug, loader):
+    """Finds the cover: <slug>.<ext> next to the EPUB, then any image there, then the EPUB's own cover."""
+    cover_bytes = None
+    cover_mimetype = "image/jpeg"
+    local_cover_found = False
+    valid_exts = ['.jpg', '.jpeg', '.png', '.webp']
+    
+    if os.path.exists(book_dir):
+        # 1. Look for slug.jpg, slug.png, etc.
+        for ext in valid_exts:
+            local_path = os.path.join(book_dir, f"{slug}{ext}")
+            if os.path.exists(local_path):
+                print(f"  - Found local thumbnail matching slug: {local_path}")
+                with open(local_path, 'rb') as f:
+                    cover_bytes = f.read()
+                if ext == '.png': cover_mimetype = "image/png"
+                elif ext == '.webp': cover_mimetype = "image/webp"
+                local_cover_found = True
+                break
+        
+        # 2. If not found by slug, look for ANY image file in that folder
+        if not local_cover_found:
+            images = [f for f in os.listdir(book_dir) if os.path.splitext(f)[1].lower() in valid_exts]
+            if images:
+                # If multiple, we just take the first one found
+                chosen_image = images[0]
+                local_path = os.path.join(book_dir, chosen_image)
+                print(f"  - Found local thumbnail (no slug match, using first image): {local_path}")
+                with open(local_path, 'rb') as f:
+                    cover_bytes = f.read()
+                ext = os.path.splitext(chosen_image)[1].lower()
+                if ext == '.png': cover_mimetype = "image/png"
+                elif ext == '.webp': cover_mimetype = "image/webp"
+                local_cover_found = True
+    
+    if not local_cover_found:
+        # Extract cover image from EPUB if available
+        cover_data = loader.get_cover()
+        if isinstance(cover_data, tuple) and len(cover_data) == 2:
+            cover_bytes, extracted_mimetype = cover_data
+            if cover_bytes:
+                cover_mimetype = extracted_mimetype
+                print(f"  - Found cover image in EPUB ({len(cover_bytes)} bytes, {cover_mimetype}).")
+            else:
+                print("  - No cover image found in EPUB.")
+        else:
+            print("  - No cover image found in EPUB or thumbnail folder.")
+    return cover_bytes, cover_mimetype
+
+def prepare_sanity_upload(uploader, loader, input_path, slug, args):
+    """
+    Sanity work that doesn't depend on the summaries: cover discovery/upload and the
+    existing-document fetch. Runs on a background thread while chapters are summarized.
+    Returns {'asset_doc', 'pending_cover'} plus 'existing_doc' when the fetch succeeded.
+    """
+    prepared = {'asset_doc': None, 'pending_cover': None}
+    with stage("sanity.cover"):
+        cover_bytes, cover_mimetype = find_cover(os.path.dirname(input_path), slug, loader)
+
+    with stage("sanity.cover_upload"):
+        if cover_bytes and args.cover_max_dim:
+            cover_bytes, cover_mimetype, saved = normalize_cover(cover_bytes, cover_mimetype, max_dim=args.cover_max_dim,
+                                                                 fmt=args.cover_format, quality=args.cover_quality)
+            print(f"  - Normalized cover image ({len(cover_bytes)} bytes, saved {saved} bytes).")
+
+        if cover_bytes and uploader.defer:
+            prepared['pending_cover'] = (cover_bytes, cover_mimetype)
+        elif cover_bytes:
+            print(f"  - Uploading cover image to Sanity...")
+            asset_doc = uploader.upload_image_asset(cover_bytes, mimetype=cover_mimetype)
+            if asset_doc:
+                print(f"  - Cover uploaded successfully: {asset_doc['_id']}")
+                prepared['asset_doc'] = asset_doc
+            else:
+                print("  - Failed to upload cover image.")
+                prepared['pending_cover'] = (cover_bytes, cover_mimetype)
+
+    if not uploader.defer:
+        try:
+            with stage("sanity.prefetch"):
+                prepared['existing_doc'] = uploader.fetch_document(f"book-review-{slug}")
+        except Exception as e:
+            # Left out, so the final upload fetches again (or falls back to the outbox)
+            print(f"  - Could not prefetch the Sanity document: {e}")
+    return prepared
+
+def upload_review(uploader, book_data, prefetched, minimal_patch=False):
+    """
+    Sends the review and its update log together as a single transaction. When the review
+    was merged against a prefetched document that has been edited since (its ifRevisionID
+    guard fails with 409), the document is fetched again, merged again and resent once.
+    Returns (upload_book_review result, batch results).
+    """
+    def send(existing):
+        # Merged into a copy, so a resend merges against the new document from scratch
+        batch = uploader.batch()
+        res = uploader.upload_book_review(copy.deepcopy(book_data), minimal_patch=minimal_patch, batch=batch, **existing)
+        results = []
+        if res:
+            uploader.create_update_log(book_data['title'], book_data['slug']['current'], batch=batch)
+            results = batch.flush()
+        return res, results
+
+    res, results = send(prefetched)
+    if prefetched and any(r.get('status') == 409 for r in results):
+        print("  - The Sanity document changed since it was fetched. Merging with the latest version and resending...")
+        try:
+            refetched = {'existing_doc': uploader.fetch_document(book_data['_id'])}
+        except Exception as e:
+            print(f"  - Could not refetch the Sanity document: {e}")
+            refetched = {}
+        res, results = send(refetched)
+    return res, results
+
+class BookError(Exception):
+    """A book that can't be processed at all (unreadable EPUB etc.); other books in a batch carry on."""
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="EPUB to Novel-Style Chapter Summaries JSON Pipeline")
     parser.add_argument("input_file", nargs="?", help="Path to the input EPUB file. If omitted, checks 'book' folder.")
     parser.add_argument("--output-dir", default="output", help="Directory to save the output JSON")
@@ -93,106 +250,37 @@ def main():
     parser.add_argument("--rating", type=float, default=None, help="Rating for the book (0-5)")
     parser.add_argument("--affiliate-link", default=None, help="Amazon affiliate link")
     parser.add_argument("--restart", action="store_true", help="Restart processing from scratch, ignoring existing progress")
+    parser.add_argument("--plan", action="store_true", help="Only estimate the work: chunks, prompt tokens, LLM calls by type and projected time (no LLM, no upload)")
+    parser.add_argument("--non-interactive", action="store_true", help="Never prompt: resume existing progress, rating defaults to the saved one or 0")
+    parser.add_argument("--result-json", default=None, help="Write a JSON summary of the run (status, chapters, upload) to this file")
+    parser.add_argument("--patch", action="store_true", help="Upload only the changes to an existing Sanity document instead of replacing it")
+    parser.add_argument("--defer-upload", action="store_true", help="Queue Sanity writes in the local outbox instead of sending them (send later with scripts/replay_outbox.py)")
+    parser.add_argument("--no-ledger", action="store_true", help="Don't record LLM calls in output/llm_ledger.sqlite")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--trace-memory", action="store_true", help="Record Python memory peaks per stage in the run report (slower)")
+    parser.add_argument("--cover-max-dim", type=int, default=None, help="Downsize the cover to fit within N pixels and re-encode it before upload")
+    parser.add_argument("--cover-format", default="JPEG", choices=["JPEG", "WEBP"], help="Format used when re-encoding the cover (default: JPEG)")
+    parser.add_argument("--cover-quality", type=int, default=85, help="Encoder quality used when re-encoding the cover (default: 85)")
     
-    args = parser.parse_args()
+    profiling.add_arguments(parser)
+    return parser
 
-    input_path = args.input_file
-    
-    # 1. Resolve Input File Early
-    if not input_path:
-        book_dir = "book"
-        if not os.path.exists(book_dir):
-            os.makedirs(book_dir)
-            print(f"Created '{book_dir}' folder. Please place an EPUB file inside and run again.")
-            sys.exit(0)
-            
-        epubs = [f for f in os.listdir(book_dir) if f.lower().endswith(".epub")]
-        if not epubs:
-            print(f"No EPUB files found in '{book_dir}' folder. Please add one.")
-            sys.exit(1)
-            
-        input_path = os.path.join(book_dir, epubs[0])
-
-    if not os.path.exists(input_path):
-        print(f"Error: File not found: {input_path}")
-        sys.exit(1)
-        
-    print(f"Processing: {input_path}")
-
-    # 2. Ingest Metadata to determine Output Filename
-    print("Step 1: Ingesting EPUB Metadata...")
-    loader = EpiubLoader(input_path)
-    try:
-        loader.load()
-    except Exception as e:
-        print(f"Critical Error: {e}")
-        sys.exit(1)
-        
-    metadata = loader.get_metadata()
-    print(f"  - Title: {metadata.get('title')}")
-
-    # 3. Determine output filename and check for existing progress
+def output_path_for(metadata, output_dir):
+    """Where the summaries JSON of a book goes, derived from its title."""
     book_title_clean = metadata.get('title', 'book').replace(' ', '_').lower()
     book_title_clean = "".join(c for c in book_title_clean if c.isalnum() or c in ('_', '-'))
-    output_filename = f"{book_title_clean}_chapter_summaries.json"
-    output_file_path = os.path.join(args.output_dir, output_filename)
-    
-    if not os.path.exists(args.output_dir):
-        os.makedirs(args.output_dir)
+    return os.path.join(output_dir, f"{book_title_clean}_chapter_summaries.json")
 
-    existing_summaries, existing_description, existing_rating, existing_link, existing_highlights = load_existing_progress(output_file_path)
-
-    # 4. Handle Resume/Restart Logic
-    if existing_summaries and not args.restart:
-        choice = input(f"Existing progress found for '{metadata.get('title')}'. Resume? (Y/n): ").strip().lower()
-        if choice == 'n':
-            print("  - Restarting from scratch (ignoring existing progress).")
-            existing_summaries = {}
-            existing_description = ""
-            existing_rating = None
-            existing_link = None
-            existing_highlights = []
-        else:
-            print(f"  - Resuming: Skipping {len(existing_summaries)} previously summarized chapters.")
-    elif args.restart:
-        print("  - Restart flag detected: Starting from scratch.")
-        existing_summaries = {}
-        existing_description = ""
-        existing_rating = None
-        existing_link = None
-        existing_highlights = []
-
-    # 4. Handle Inputs (Prioritize CLI > Existing File > Interactive)
-    rating = args.rating
-    if rating is None:
-        if existing_rating is not None:
-            print(f"  - Using existing rating from {output_filename}: {existing_rating}")
-            rating = existing_rating
-        else:
-            try:
-                r_input = input("Enter your rating for this book (0-5, default 0): ").strip()
-                if r_input:
-                    rating = float(r_input)
-                else:
-                    rating = 0
-            except ValueError:
-                print("Invalid input. Defaulting rating to 0.")
-                rating = 0
-            
-    affiliate_link = args.affiliate_link
-    if affiliate_link is None:
-        if existing_link:
-            print(f"  - Using existing affiliate link from {output_filename}")
-            affiliate_link = existing_link
-        else:
-            l_input = input("Enter Amazon Affiliate Link (press Enter to auto-generate): ").strip()
-            if l_input:
-                affiliate_link = l_input
-            else:
-                affiliate_link = None # Let JSONFormatter handle the default
+def load_chapters(loader, args):
+    """
+    Full ingest of a loaded EPUB, then cleaning, segmentation and filtering: the
+    chapters that will be summarized, each with its content fingerprint.
+    """
+    from pipeline.cleaner import CleanText
 
     # 5. Full Ingest
-    raw_chapters = loader.get_chapters()
+    with stage("ingest.get_chapters"):
+        raw_chapters = loader.get_chapters()
     parts_count = sum(1 for ch in raw_chapters if JSONFormatter.is_part(ch.get('title', ''), ch.get('level', 0), ch.get('is_parent', False), ch.get('semantic_type')))
     chapters_count = len(raw_chapters) - parts_count
     print(f"  - Found {len(raw_chapters)} sections ({parts_count} parts, {chapters_count} chapters).")
@@ -203,14 +291,16 @@ def main():
     segmenter = Segmenter()
     
     cleaned_chapters = []
-    for ch in raw_chapters:
-        text = cleaner.clean(ch['content'])
-        # Keep everything except explicitly skipped items.
-        # This ensures that empty pages (only images) can still be structural markers.
-        ch['content'] = text
-        cleaned_chapters.append(ch)
+    with stage("clean"):
+        for ch in raw_chapters:
+            text = cleaner.clean(ch['content'])
+            # Keep everything except explicitly skipped items.
+            # This ensures that empty pages (only images) can still be structural markers.
+            ch['content'] = text
+            cleaned_chapters.append(ch)
             
-    final_chapters = segmenter.segment(cleaned_chapters)
+    with stage("segment"):
+        final_chapters = segmenter.segment(cleaned_chapters)
     
     if args.limit:
         print(f"  - Limiting to first {args.limit} chapters.")
@@ -230,157 +320,286 @@ def main():
     
     print(f"  - Processing {len(final_chapters)} chapters to summarize.")
 
-    # 8. Resume Context
-    book_description = existing_description
+    # 7.6 Content fingerprints (cleaned text + model + prompt version)
+    for ch in final_chapters:
+        ch['fingerprint'] = chapter_fingerprint(ch.get('content', ''), args.model_name, Summarizer.PROMPT_VERSION)
+    return final_chapters
 
-    # 9 & 10. Chunking & Summarization
-    print(f"Step 4 & 5: Summarizing with {args.model_name}...")
-    summarizer = Summarizer(model_url=args.model_url, model_name=args.model_name)
-    
-    for i, ch in enumerate(final_chapters):
-        title = ch['title']
-        content = ch.get('content', '').strip()
-        content_len = len(content)
-        is_parent = ch.get('is_parent', False)
-        
-        # 8.5 Filter Skip List (Redundant check but safe)
-        if should_skip_chapter(title):
-            continue
+def process_book(input_path, args, interactive=True, on_state=None):
+    """
+    Runs the whole pipeline for one EPUB: ingest, summarize (resuming saved progress),
+    save, validate and upload. With interactive=False nothing is asked: existing
+    progress is resumed, the rating falls back to the saved one (or 0) and the
+    affiliate link to the generated default.
+    on_state(state) is called as the book reaches each stage: ingested, summarizing,
+    summarized, validated and (once the review is live) uploaded.
+    Returns a summary dict (title, output, chapters, chapters_failed, upload, seconds);
+    raises BookError when the book can't be processed at all.
+    """
+    # Imported here rather than at the top so --help and --plan don't pay for requests
+    from pipeline.ingest import EpiubLoader
+    from pipeline.sanity_uploader import SanityUploader
+
+    on_state = on_state or (lambda state: None)
+    started = time.perf_counter()
+    result = {"input": input_path, "title": None, "output": None, "chapters": 0, "chapters_failed": 0, "upload": "disabled"}
+    print(f"Processing: {input_path}")
 
-        if content_len < 100:
-             print(f"  - Warning: Chapter {i+1} ({title}) has very little content ({content_len} chars).")
+    # Metrics are process-wide (a jobs worker serves them across books); the report only gets this book's share
+    metrics_start = metrics.REGISTRY.checkpoint()
+    # Per-stage timings (and memory with --trace-memory) for the run report
+    recorder = RunRecorder(trace_memory=args.trace_memory, input=input_path, model=args.model_name,
+                           model_url=args.model_url).activate()
+    profiler = profiling.from_args(args, args.output_dir, prefix="run")
+    if profiler:
+        recorder.add_hook(profiler.hook)
 
+    try:
+        # 2. Ingest Metadata to determine Output Filename
+        print("Step 1: Ingesting EPUB Metadata...")
+        loader = EpiubLoader(input_path)
         try:
-            if title in existing_summaries and existing_summaries[title].strip():
-                print(f"  - Skipping Chapter {i+1}: {title} (Already summarized)")
-                ch['summary'] = existing_summaries[title]
-                # If we're resuming, we might still need to extract highlights if they're missing
-                # For simplicity, we'll check if we have any highlights in the global list
-                # If the user is resuming a half-finished book, we'll just re-extract for now 
-                # or skip if we have enough. Let's just always extract if they're not there.
-                if existing_highlights and i < len(existing_highlights):
-                     ch['highlights'] = [existing_highlights[i]] # This is a weak mapping, but works if sequential
-                else:
-                     print(f"  - Extracting Highlights for Chapter {i+1}: {title}")
-                     with Spinner("Analyzing highlights"):
-                         ch['highlights'] = summarizer.extract_highlights(ch['content'])
-            else:
-                print(f"  - Summarizing Chapter {i+1}: {title}")
-                with Spinner("Generating summary"):
-                    summary = summarizer.summarize_chapter(ch['content'])
-                ch['summary'] = summary
-                print(f"  - Extracting Highlights for Chapter {i+1}: {title}")
-                with Spinner("Analyzing highlights"):
-                    ch['highlights'] = summarizer.extract_highlights(ch['content'])
+            with stage("ingest.load"):
+                loader.load()
         except Exception as e:
-            print(f"\n  ! Error processing Chapter {i+1} ({title}): {e}")
-            ch['summary'] = "Summary generation failed (Error)."
-            ch['highlights'] = []
-        
-        JSONFormatter.save(metadata, final_chapters, output_file_path, 
-                           book_description=book_description, rating=rating, affiliate_link=affiliate_link)
-
-    # 11. Finalize Description
-    if not book_description:
-        print("Step 5.5: Generating Overall Book Description...")
-        with Spinner("Crafting book description"):
-            book_description = summarizer.generate_book_description(final_chapters)
-        if book_description:
-            print("  - Book description generated successfully.")
-            final_json_data = JSONFormatter.save(metadata, final_chapters, output_file_path, 
-                                               book_description=book_description, rating=rating, affiliate_link=affiliate_link)
-        else:
-            print("  - Failed to generate book description.")
-            final_json_data = JSONFormatter.save(metadata, final_chapters, output_file_path, 
-                                               book_description=None, rating=rating, affiliate_link=affiliate_link)
-    else:
-        print("  - Book description already exists. Skipping generation.")
-        final_json_data = JSONFormatter.save(metadata, final_chapters, output_file_path, 
-                                           book_description=book_description, rating=rating, affiliate_link=affiliate_link)
-
-    # 11.5 Final Validation & Cleanup
-    print("Step 6: Validating and Cleaning Output...")
-    from pipeline.validator import OutputValidator
-    was_modified, final_json_data = OutputValidator.validate_and_clean(final_json_data)
-    if was_modified:
-        # Save the cleaned version back to disk
-        final_json_data = JSONFormatter.save(metadata, final_chapters, output_file_path,
-                                           book_description=book_description, rating=rating, affiliate_link=affiliate_link,
-                                           # Note: JSONFormatter.save reconstructs the object from args.
-                                           # If we simply modified final_json_data in place, we might be desynced from the args
-                                           # passed to save(). Ideally, we should just dump final_json_data to disk directly here
-                                           # to ensure our in-memory changes persist.
-                                           )
-        # Actually, JSONFormatter.save builds the structure from inputs. 
-        # OutputValidator modified 'final_json_data' in place, but JSONFormatter.save re-creates it.
-        # So we MUST perform the save using the *modified data object*, OR we just dump it directly.
-        # Since 'final_chapters' and 'metadata' weren't explicitly modified by Validator (it modifies the dict),
-        # but 'final_json_data' IS the dict.
-        # A safer approach is to just write the cleaned dict to disk.
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-             json.dump(final_json_data, f, indent=2)
-        print(f"  - Cleaned output saved to {output_file_path}")
-
-    # 12. Upload to Sanity
-    print("Step 7: Uploading to Sanity...")
-    uploader = SanityUploader()
-    if uploader.enabled and final_json_data:
-        # 12.1 Determine Cover Image (Local vs EPUB)
-        cover_bytes = None
-        cover_mimetype = "image/jpeg"
-        
-        # Check the same directory as the EPUB file
-        slug = final_json_data['slug']['current']
-        book_dir_local = os.path.dirname(input_path)
-        local_cover_found = False
-        valid_exts = ['.jpg', '.jpeg', '.png', '.webp']
-        
-        if os.path.exists(book_dir_local):
-            # 1. Look for slug.jpg, slug.png, etc.
-            for ext in valid_exts:
-                local_path = os.path.join(book_dir_local, f"{slug}{ext}")
-                if os.path.exists(local_path):
-                    print(f"  - Found local thumbnail matching slug: {local_path}")
-                    with open(local_path, 'rb') as f:
-                        cover_bytes = f.read()
-                    if ext == '.png': cover_mimetype = "image/png"
-                    elif ext == '.webp': cover_mimetype = "image/webp"
-                    local_cover_found = True
-                    break
+            print(f"Critical Error: {e}")
+            raise BookError(str(e)) from e
             
-            # 2. If not found by slug, look for ANY image file in that folder
-            if not local_cover_found:
-                images = [f for f in os.listdir(book_dir_local) if os.path.splitext(f)[1].lower() in valid_exts]
-                if images:
-                    # If multiple, we just take the first one found
-                    chosen_image = images[0]
-                    local_path = os.path.join(book_dir_local, chosen_image)
-                    print(f"  - Found local thumbnail (no slug match, using first image): {local_path}")
-                    with open(local_path, 'rb') as f:
-                        cover_bytes = f.read()
-                    ext = os.path.splitext(chosen_image)[1].lower()
-                    if ext == '.png': cover_mimetype = "image/png"
-                    elif ext == '.webp': cover_mimetype = "image/webp"
-                    local_cover_found = True
+        metadata = loader.get_metadata()
+        result["title"] = metadata.get('title')
+        on_state("ingested")
+        print(f"  - Title: {metadata.get('title')}")
+
+        # Writes that can't be sent now (offline, 5xx, --defer-upload) are kept in the outbox.
+        outbox = Outbox(os.path.join(args.output_dir, "sanity_outbox.sqlite"))
+        metrics.OUTBOX_PENDING.set_function(lambda: outbox.stats()['pending'])
+        uploader = SanityUploader(outbox=outbox, defer=args.defer_upload,
+                                  asset_map_path=os.path.join(args.output_dir, STATE_DIR, "sanity_assets.json"))
+
+        # 3. Determine output filename and check for existing progress
+        output_file_path = output_path_for(metadata, args.output_dir)
+        output_filename = os.path.basename(output_file_path)
+        result["output"] = output_file_path
+        if profiler:
+            profiler.prefix = os.path.splitext(output_filename)[0]
         
-        if not local_cover_found:
-            # Extract and upload cover image from EPUB if available
-            cover_data = loader.get_cover()
-            if isinstance(cover_data, tuple) and len(cover_data) == 2:
-                cover_bytes, extracted_mimetype = cover_data
-                if cover_bytes:
-                    cover_mimetype = extracted_mimetype
-                    print(f"  - Found cover image in EPUB ({len(cover_bytes)} bytes, {cover_mimetype}).")
+        if not os.path.exists(args.output_dir):
+            os.makedirs(args.output_dir)
+
+        existing_summaries, existing_description, existing_rating, existing_link, existing_highlights = load_existing_progress(output_file_path)
+        existing_fingerprints = JSONFormatter.load_fingerprints(output_file_path)
+
+        # The journal holds per-chapter checkpoints and takes priority over the output JSON
+        journal = ChapterJournal(ChapterJournal.path_for(output_file_path))
+        journal_book, journal_chapters = journal.load()
+        if journal_book:
+            existing_description = journal_book.get('bookDescription') or existing_description
+            if journal_book.get('rating') is not None:
+                existing_rating = journal_book['rating']
+            existing_link = journal_book.get('affiliateLink') or existing_link
+
+        # 4. Handle Resume/Restart Logic
+        if (existing_summaries or journal_chapters) and not args.restart:
+            choice = ""
+            if interactive:
+                choice = input(f"Existing progress found for '{metadata.get('title')}'. Resume? (Y/n): ").strip().lower()
+            if choice == 'n':
+                print("  - Restarting from scratch (ignoring existing progress).")
+                existing_summaries = []
+                existing_description = ""
+                existing_rating = None
+                existing_link = None
+                existing_highlights = []
+                existing_fingerprints = {}
+                journal_chapters = {}
+                journal.reset()
+            else:
+                print(f"  - Resuming: Skipping {max(len(existing_summaries), len(journal_chapters))} previously summarized chapters.")
+        elif args.restart:
+            print("  - Restart flag detected: Starting from scratch.")
+            existing_summaries = []
+            existing_description = ""
+            existing_rating = None
+            existing_link = None
+            existing_highlights = []
+            existing_fingerprints = {}
+            journal_chapters = {}
+            journal.reset()
+
+        # 4. Handle Inputs (Prioritize CLI > Existing File > Interactive)
+        rating = args.rating
+        if rating is None:
+            if existing_rating is not None:
+                print(f"  - Using existing rating from {output_filename}: {existing_rating}")
+                rating = existing_rating
+            elif not interactive:
+                print("  - No rating given. Defaulting rating to 0.")
+                rating = 0
+            else:
+                try:
+                    r_input = input("Enter your rating for this book (0-5, default 0): ").strip()
+                    if r_input:
+                        rating = float(r_input)
+                    else:
+                        rating = 0
+                except ValueError:
+                    print("Invalid input. Defaulting rating to 0.")
+                    rating = 0
+                
+        affiliate_link = args.affiliate_link
+        if affiliate_link is None:
+            if existing_link:
+                print(f"  - Using existing affiliate link from {output_filename}")
+                affiliate_link = existing_link
+            elif interactive:
+                l_input = input("Enter Amazon Affiliate Link (press Enter to auto-generate): ").strip()
+                if l_input:
+                    affiliate_link = l_input
                 else:
-                    print("  - No cover image found in EPUB.")
+                    affiliate_link = None # Let JSONFormatter handle the default
+
+        # Start Sanity I/O that only needs metadata, so it overlaps with summarization.
+        # Started after the prompts so its progress lines don't land in the middle of them.
+        sanity_pool = ThreadPoolExecutor(max_workers=1)
+        sanity_prefetch = None
+        if uploader.enabled:
+            sanity_prefetch = sanity_pool.submit(prepare_sanity_upload, uploader, loader, input_path,
+                                                 JSONFormatter.slugify(metadata.get("title", "unknown")), args)
+
+        # 5-7. Full Ingest, Clean, Segment, Filter
+        final_chapters = load_chapters(loader, args)
+
+        # 8. Resume Context
+        book_description = existing_description
+        journal.append_book(metadata, rating=rating, affiliate_link=affiliate_link, book_description=book_description)
+
+        # 9 & 10. Chunking & Summarization
+        print(f"Step 4 & 5: Summarizing with {args.model_name}...")
+        on_state("summarizing")
+        ledger = None if args.no_ledger else Ledger(os.path.join(args.output_dir, "llm_ledger.sqlite"))
+        summarizer = Summarizer(model_url=args.model_url, model_name=args.model_name, ledger=ledger)
+
+        # Map previously saved highlights back to the chapters they came from
+        recovered_highlights = {}
+        if existing_highlights:
+            index = HighlightIndex([ch.get('content', '') for ch in final_chapters])
+            recovered_highlights, unmatched = index.assign(existing_highlights)
+            print(f"  - Recovered highlights for {len(recovered_highlights)} chapters from existing output.")
+            if unmatched:
+                print(f"  - {len(unmatched)} existing highlights could not be matched to a chapter.")
+        
+        # Previous work per chapter position: journal checkpoints first, then the output JSON
+        journal_matches = match_by_fingerprint(final_chapters, journal_chapters)
+        output_summaries = previous_summaries(final_chapters, existing_summaries, existing_fingerprints)
+
+        for i, ch in enumerate(final_chapters):
+            title = ch['title']
+            content = ch.get('content', '').strip()
+            content_len = len(content)
+            is_parent = ch.get('is_parent', False)
+            
+            # 8.5 Filter Skip List (Redundant check but safe)
+            if should_skip_chapter(title):
+                continue
+
+            if content_len < 100:
+                 print(f"  - Warning: Chapter {i+1} ({title}) has very little content ({content_len} chars).")
+
+            summarizer.set_context(book=metadata.get('title'), chapter=title)
+            with stage("chapter", index=i, title=title, chars=content_len) as chapter_stage:
+                record = journal_matches.get(i)
+                if record and not record.get('failed'):
+                    print(f"  - Skipping Chapter {i+1}: {title} (Already summarized)")
+                    chapter_stage['cached'] = True
+                    metrics.CACHE.inc(result="hit")
+                    metrics.CHAPTERS.inc(status="cached")
+                    ch['summary'] = record.get('summary', '')
+                    ch['highlights'] = record.get('highlights', [])
+                    continue
+
+                existing_summary = output_summaries.get(i, "")
+
+                metrics.CACHE.inc(result="hit" if existing_summary.strip() else "miss")
+                try:
+                    if existing_summary.strip():
+                        print(f"  - Skipping Chapter {i+1}: {title} (Already summarized)")
+                        ch['summary'] = existing_summary
+                        # If we're resuming, only re-extract highlights for chapters that have none
+                        if recovered_highlights.get(i):
+                             ch['highlights'] = recovered_highlights[i]
+                        else:
+                             print(f"  - Extracting Highlights for Chapter {i+1}: {title}")
+                             with Spinner("Analyzing highlights"), stage("highlights"):
+                                 ch['highlights'] = summarizer.extract_highlights(ch['content'])
+                    else:
+                        print(f"  - Summarizing Chapter {i+1}: {title}")
+                        with Spinner("Generating summary"), stage("summarize"):
+                            summary = summarizer.summarize_chapter(ch['content'])
+                        ch['summary'] = summary
+                        print(f"  - Extracting Highlights for Chapter {i+1}: {title}")
+                        with Spinner("Analyzing highlights"), stage("highlights"):
+                            ch['highlights'] = summarizer.extract_highlights(ch['content'])
+                except Exception as e:
+                    print(f"\n  ! Error processing Chapter {i+1} ({title}): {e}")
+                    ch['summary'] = "Summary generation failed (Error)."
+                    ch['highlights'] = []
+                    ch['failed'] = True
+                    chapter_stage['failed'] = True
+
+                metrics.CHAPTERS.inc(status="failed" if ch.get('failed') else "cached" if existing_summary.strip() else "summarized")
+
+                # Checkpoint just this chapter; the full JSON is only materialized at the end
+                journal.append_chapter(i, ch)
+
+        # 11. Finalize Description
+        if not book_description:
+            print("Step 5.5: Generating Overall Book Description...")
+            summarizer.set_context(book=metadata.get('title'))
+            with Spinner("Crafting book description"), stage("description"):
+                book_description = summarizer.generate_book_description(final_chapters)
+            if book_description:
+                print("  - Book description generated successfully.")
+                journal.append_book(metadata, rating=rating, affiliate_link=affiliate_link, book_description=book_description)
             else:
-                print("  - No cover image found in EPUB or thumbnail folder.")
+                print("  - Failed to generate book description.")
+        else:
+            print("  - Book description already exists. Skipping generation.")
 
-        if cover_bytes:
-            print(f"  - Uploading cover image to Sanity...")
-            asset_doc = uploader.upload_image_asset(cover_bytes, mimetype=cover_mimetype)
+        with stage("save"):
+            final_json_data = JSONFormatter.save(metadata, final_chapters, output_file_path, 
+                                               book_description=book_description or None, rating=rating, affiliate_link=affiliate_link)
+        result["chapters"] = len(final_chapters)
+        result["chapters_failed"] = sum(1 for ch in final_chapters if ch.get('failed'))
+        on_state("summarized")
+
+        # 11.5 Final Validation & Cleanup
+        print("Step 6: Validating and Cleaning Output...")
+        from pipeline.validator import OutputValidator
+        with stage("validate"):
+            was_modified, final_json_data = OutputValidator.validate_and_clean(final_json_data)
+        if was_modified:
+            # OutputValidator cleans the dict in place; JSONFormatter.save would rebuild it
+            # from the chapters and lose those changes, so write the cleaned dict directly.
+            with open(output_file_path, 'w', encoding='utf-8') as f:
+                 json.dump(final_json_data, f, indent=2)
+            print(f"  - Cleaned output saved to {output_file_path}")
+        on_state("validated")
+
+        # 12. Upload to Sanity
+        print("Step 7: Uploading to Sanity...")
+        sanity_pool.shutdown(wait=False)
+        if uploader.enabled and final_json_data:
+            result["upload"] = "failed"
+            # Cover upload and existing-document fetch ran in the background during summarization
+            try:
+                with stage("sanity.wait_prefetch"):
+                    prepared = sanity_prefetch.result()
+            except Exception as e:
+                print(f"  - Background Sanity preparation failed: {e}")
+                prepared = {}
+            asset_doc = prepared.get('asset_doc')
+            pending_cover = prepared.get('pending_cover')
             if asset_doc:
-                print(f"  - Cover uploaded successfully: {asset_doc['_id']}")
                 final_json_data['coverImage'] = {
                     "_type": "image",
                     "asset": {
@@ -388,20 +607,126 @@ def main():
                         "_ref": asset_doc['_id']
                     }
                 }
-            else:
-                print("  - Failed to upload cover image.")
 
-        # Upload Book Review
-        slug = final_json_data['slug']['current']
-        doc_id = f"book-review-{slug}"
-        final_json_data['_id'] = doc_id
-        
-        res = uploader.upload_book_review(final_json_data)
-        
-        if res:
-            # Create Log
-            uploader.create_update_log(final_json_data['title'], slug)
-            print(f"Done! Summary of '{final_json_data['title']}' is live.")
+            # Upload Book Review
+            slug = final_json_data['slug']['current']
+            doc_id = f"book-review-{slug}"
+            final_json_data['_id'] = doc_id
+            
+            prefetched = {'existing_doc': prepared['existing_doc']} if 'existing_doc' in prepared else {}
+            with stage("sanity.upload"):
+                res, results = upload_review(uploader, final_json_data, prefetched, minimal_patch=args.patch)
+            
+            if res:
+                if pending_cover:
+                    # Queued after the review so replay creates the document before attaching its cover
+                    uploader.outbox.enqueue_cover(doc_id, *pending_cover)
+                    print("  - Cover image queued in the outbox.")
+                if results and all(r['ok'] for r in results):
+                    result["upload"] = "live"
+                    on_state("uploaded")
+                    print(f"Done! Summary of '{final_json_data['title']}' is live.")
+                elif any(r.get('queued') for r in results) or pending_cover:
+                    result["upload"] = "queued"
+                    print(f"Summary of '{final_json_data['title']}' is queued. Run scripts/replay_outbox.py to publish it.")
+
+        recorder.save(RunRecorder.report_path(output_file_path), output=output_file_path,
+                      chapters_total=result["chapters"], chapters_failed=result["chapters_failed"],
+                      cache_hit_ratio=metrics.cache_hit_ratio(since=metrics_start),
+                      metrics=metrics.REGISTRY.snapshot(since=metrics_start))
+    finally:
+        recorder.close()
+        # Also on errors and Ctrl+C, so profiles of a run that stops early are kept too
+        if profiler:
+            profiler.close()
+
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+def plan_book(input_path, args):
+    """
+    Dry run for --plan: ingests, cleans, segments and chunks the book as process_book
+    would, then estimates the LLM work with pipeline.planner. Nothing is sent to the
+    LLM or Sanity and no output is written. Returns the plan dict.
+    """
+    from pipeline.ingest import EpiubLoader
+    from pipeline.chunker import Chunker
+    from pipeline.planner import CallHistory, plan_book as estimate, format_plan
+
+    print(f"Planning: {input_path}")
+    loader = EpiubLoader(input_path)
+    try:
+        loader.load()
+    except Exception as e:
+        print(f"Critical Error: {e}")
+        raise BookError(str(e)) from e
+    metadata = loader.get_metadata()
+    print(f"  - Title: {metadata.get('title')}")
+    output_file_path = output_path_for(metadata, args.output_dir)
+    chapters = load_chapters(loader, args)
+
+    # A resumed run skips chapters checkpointed in the journal and an existing description
+    cached, has_description = set(), False
+    if not args.restart:
+        journal_book, journal_chapters = ChapterJournal(ChapterJournal.path_for(output_file_path)).load()
+        cached = {i for i, record in match_by_fingerprint(chapters, journal_chapters).items() if not record.get('failed')}
+        has_description = bool(journal_book.get('bookDescription') or load_existing_progress(output_file_path)[1])
+
+    history = CallHistory.from_ledger(os.path.join(args.output_dir, "llm_ledger.sqlite"), model=args.model_name)
+    plan = estimate(chapters, Chunker(), cached=cached, needs_description=not has_description, history=history)
+    print()
+    print(format_plan(plan))
+    plan.update(input=input_path, title=metadata.get('title'), model=args.model_name)
+    return plan
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    input_path = args.input_file
+    
+    # 1. Resolve Input File Early
+    if not input_path:
+        book_dir = "book"
+        if not os.path.exists(book_dir):
+            os.makedirs(book_dir)
+            print(f"Created '{book_dir}' folder. Please place an EPUB file inside and run again.")
+            sys.exit(0)
+            
+        epubs = [f for f in os.listdir(book_dir) if f.lower().endswith(".epub")]
+        if not epubs:
+            print(f"No EPUB files found in '{book_dir}' folder. Please add one.")
+            sys.exit(1)
+        if len(epubs) > 1:
+            print(f"  - {len(epubs)} EPUBs in '{book_dir}'; processing {epubs[0]} (use scripts/batch_process.py for all of them).")
+            
+        input_path = os.path.join(book_dir, epubs[0])
+
+    if not os.path.exists(input_path):
+        print(f"Error: File not found: {input_path}")
+        sys.exit(1)
+
+    if args.metrics_port is not None and not args.plan:
+        try:
+            metrics.start_http_server(args.metrics_port)
+            print(f"Metrics: http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"Warning: Could not start the metrics server on port {args.metrics_port}: {e}")
+
+    try:
+        if args.plan:
+            result = plan_book(input_path, args)
+        else:
+            result = process_book(input_path, args, interactive=not args.non_interactive)
+        result["status"] = "ok"
+    except BookError as e:
+        result = {"input": input_path, "status": "failed", "error": str(e)}
+
+    if args.result_json:
+        with open(args.result_json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if result["status"] != "ok":
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
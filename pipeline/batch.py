@@ -0,0 +1,143 @@
+import csv
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+# Accepted manifest column names for each field
+PATH_KEYS = ("path", "file", "epub")
+RATING_KEYS = ("rating", "yourRating")
+LINK_KEYS = ("affiliate_link", "affiliateLink", "link")
+
+
+def _first(entry, keys):
+    for key in keys:
+        value = entry.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _book(entry, base_dir):
+    path = _first(entry, PATH_KEYS)
+    if not path:
+        raise ValueError(f"Manifest entry without a path: {entry}")
+    rating = _first(entry, RATING_KEYS)
+    return {
+        "path": path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path)),
+        "rating": float(rating) if rating is not None else None,
+        "affiliate_link": _first(entry, LINK_KEYS),
+    }
+
+
+def load_books(source):
+    """
+    Books to process from a directory (every *.epub in it, sorted) or a manifest:
+    CSV with a header row, or JSON (a list, or {"books": [...]}), with a path column
+    and optional rating / affiliate_link. Relative paths are resolved against the
+    manifest's folder.
+    """
+    if os.path.isdir(source):
+        names = sorted(f for f in os.listdir(source) if f.lower().endswith(".epub"))
+        return [{"path": os.path.join(source, name), "rating": None, "affiliate_link": None} for name in names]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    if source.lower().endswith(".json"):
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get("books", []) if isinstance(data, dict) else data
+        return [_book(e if isinstance(e, dict) else {"path": e}, base_dir) for e in entries]
+    if source.lower().endswith(".csv"):
+        with open(source, 'r', encoding='utf-8-sig', newline='') as f:
+            return [_book({k.strip(): (v or "").strip() for k, v in row.items() if k}, base_dir)
+                    for row in csv.DictReader(f)]
+    raise ValueError(f"Expected a directory, .csv or .json manifest: {source}")
+
+
+def log_name(path):
+    base = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", base)[:80] + ".log"
+
+
+def run_book(book, output_dir, log_dir, main_args=(), env=None):
+    """
+    Runs main.py for one book in its own process, without prompts, logging to
+    <log_dir>/<epub name>.log. Never raises: a crash or error is reported in the result.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, log_name(book["path"]))
+    fd, result_path = tempfile.mkstemp(prefix="book_result_", suffix=".json")
+    os.close(fd)
+    cmd = [sys.executable, MAIN_PATH, book["path"], "--non-interactive", "--output-dir", output_dir,
+           "--result-json", result_path] + list(main_args)
+    if book.get("rating") is not None:
+        cmd += ["--rating", str(book["rating"])]
+    if book.get("affiliate_link"):
+        cmd += ["--affiliate-link", book["affiliate_link"]]
+
+    start = time.perf_counter()
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log:
+            proc = subprocess.run(cmd, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        returncode = proc.returncode
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = {}
+    except Exception as e:
+        returncode, result = None, {"error": str(e)}
+    finally:
+        if os.path.exists(result_path):
+            os.remove(result_path)
+
+    result.update(input=book["path"], log=log_path, returncode=returncode,
+                  seconds=round(time.perf_counter() - start, 2))
+    if returncode != 0:
+        result["status"] = "failed"
+        result.setdefault("error", f"exit code {returncode}, see {log_path}")
+    elif result.get("chapters_failed"):
+        result["status"] = "partial"
+    else:
+        result["status"] = "ok"
+    return result
+
+
+def run_batch(books, output_dir="output", log_dir=None, workers=1, main_args=(), env=None, on_result=None):
+    """Processes books with up to `workers` running at once; returns results in input order."""
+    log_dir = log_dir or os.path.join(output_dir, "logs")
+    results = [None] * len(books)
+
+    def run(idx):
+        results[idx] = run_book(books[idx], output_dir, log_dir, main_args, env)
+        if on_result:
+            on_result(results[idx])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(run, range(len(books))))
+    return results
+
+
+def format_summary(results):
+    """Plain-text table of a batch: one row per book plus a totals line."""
+    rows = [("Book", "Status", "Chapters", "Failed", "Upload", "Time")]
+    for r in results:
+        name = r.get("title") or os.path.basename(r["input"])
+        rows.append((name if len(name) <= 40 else name[:37] + "...", r["status"], str(r.get("chapters", "-")),
+                     str(r.get("chapters_failed", "-")), r.get("upload", "-"), f"{r['seconds']:.1f}s"))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(row, widths)))
+             for row in rows]
+    lines.insert(1, "-" * len(lines[0]))
+    counts = {s: sum(1 for r in results if r["status"] == s) for s in ("ok", "partial", "failed")}
+    lines.append(f"{len(results)} books: {counts['ok']} ok, {counts['partial']} with failed chapters, {counts['failed']} failed.")
+    for r in results:
+        if r["status"] == "failed":
+            lines.append(f"  ! {os.path.basename(r['input'])}: {r.get('error')}")
+    return "\n".join(lines)
@@ -0,0 +1,80 @@
+import io
+import os
+
+FORMAT_MIMETYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def normalize_cover(image_bytes, mimetype="image/jpeg", max_dim=1600, fmt="JPEG", quality=85):
+    """
+    Downsizes a cover to fit within max_dim and re-encodes it as progressive JPEG or WebP.
+    Returns (bytes, mimetype, bytes_saved). The original is returned unchanged if Pillow
+    is not installed, the image can't be decoded, or re-encoding wouldn't make it smaller.
+    """
+    fmt = fmt.upper()
+    if fmt not in FORMAT_MIMETYPES:
+        raise ValueError(f"Unsupported cover format: {fmt}. Use JPEG or WEBP.")
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Warning: Pillow is not installed (pip install pillow). Uploading the cover as-is.")
+        return image_bytes, mimetype, 0
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+        # Camera/scanner covers store rotation in EXIF, which is not kept on save
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        print(f"Warning: Could not decode cover image ({e}). Uploading as-is.")
+        return image_bytes, mimetype, 0
+
+    if img.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white; JPEG has no alpha channel
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if max_dim:
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(out, format="WEBP", quality=quality, method=6)
+    data = out.getvalue()
+
+    if len(data) >= len(image_bytes):
+        return image_bytes, mimetype, 0
+    return data, FORMAT_MIMETYPES[fmt], len(image_bytes) - len(data)
+
+
+def _normalize_file(args):
+    path, output_dir, max_dim, fmt, quality = args
+    try:
+        with open(path, 'rb') as f:
+            original = f.read()
+        data, mimetype, saved = normalize_cover(original, max_dim=max_dim, fmt=fmt, quality=quality)
+        name = os.path.splitext(os.path.basename(path))[0]
+        ext = FORMAT_EXTENSIONS[fmt.upper()] if saved else os.path.splitext(path)[1]
+        out_path = os.path.join(output_dir, name + ext)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        return {"path": path, "output": out_path, "before": len(original), "after": len(data), "saved": saved}
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+
+
+def normalize_cover_files(paths, output_dir, max_dim=1600, fmt="JPEG", quality=85, workers=None):
+    """Normalizes several cover files in a process pool. Returns one result dict per file."""
+    from concurrent.futures import ProcessPoolExecutor  # Pulls in multiprocessing; only needed here
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(path, output_dir, max_dim, fmt, quality) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_normalize_file, jobs))
@@ -0,0 +1,62 @@
+import re
+
+# Highlights shorter than this (after normalization) are compared as a single shingle.
+SHINGLE_SIZE = 5
+# A highlight must be at least this long (normalized chars) to be dropped for being contained
+# in a longer one; shorter ones ("Be kind.") are distinct ideas far more often than fragments.
+MIN_CONTAINED_CHARS = 30
+
+
+def normalize_highlight(text):
+    """Lowercases and strips punctuation so quoting/spacing differences don't matter."""
+    text = re.sub(r'[^a-z0-9]+', ' ', (text or '').lower())
+    return text.strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Returns the set of character n-grams of an already normalized string."""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def similarity(a, b):
+    """
+    Overlap score between two shingle sets.
+    Uses the larger of Jaccard and containment so a highlight that was cut short
+    by a chunk boundary still matches its complete version. Containment only counts
+    when the shorter highlight is at least MIN_CONTAINED_CHARS long, so a short quote
+    that happens to appear inside a longer, different highlight isn't dropped.
+    """
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    if not inter:
+        return 0.0
+    jaccard = inter / len(a | b)
+    # n-char shingles of a string of length L number L - n + 1
+    if min(len(a), len(b)) + SHINGLE_SIZE - 1 < MIN_CONTAINED_CHARS:
+        return jaccard
+    containment = inter / min(len(a), len(b))
+    return max(jaccard, containment)
+
+
+def dedupe_highlights(highlights, threshold=0.8):
+    """
+    Collapses near-verbatim repeats (e.g. from the chunk overlap) locally.
+    Keeps the first occurrence's position but the longest wording of each group.
+    """
+    kept = []  # [text, shingle set]
+    for h in highlights:
+        if not isinstance(h, str) or not h.strip():
+            continue
+        sh = shingles(normalize_highlight(h))
+        for entry in kept:
+            if similarity(sh, entry[1]) >= threshold:
+                if len(h.strip()) > len(entry[0]):
+                    entry[0] = h.strip()
+                    entry[1] = sh
+                break
+        else:
+            kept.append([h.strip(), sh])
+    return [text for text, _ in kept]
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from functools import wraps
+
+from .utils import state_path
+
+try:
+    import resource  # Unix only; used for the process RSS high-water mark
+except ImportError:
+    resource = None
+
+_active = None
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RunRecorder:
+    """
+    Records wall time, CPU time and (optionally) tracemalloc peaks for nested stages.
+    Stages opened on other threads (e.g. the background Sanity worker) are kept as
+    separate top-level entries. Python memory tracing slows allocation-heavy code
+    noticeably, so it is off unless trace_memory=True; the process RSS high-water
+    mark is always recorded where the platform provides it.
+    """
+
+    def __init__(self, trace_memory=False, **info):
+        self.info = dict(info)
+        self.trace_memory = trace_memory
+        self.records = []
+        self.hooks = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_at = datetime.utcnow().isoformat() + "Z"
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name, **attrs):
+        """Times the enclosed block. Extra keyword arguments are stored with the record."""
+        stack = self._stack()
+        record = {"name": name, **attrs, "start": round(time.perf_counter() - self._t0, 4)}
+        if threading.current_thread() is not threading.main_thread():
+            record["thread"] = threading.current_thread().name
+        # tracemalloc's peak is process-wide, so only main-thread stages measure it
+        tracing = self.trace_memory and tracemalloc.is_tracing() and "thread" not in record
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), peak)
+            tracemalloc.reset_peak()
+            record["_base"] = current
+            record["_peak"] = current
+
+        if stack:
+            stack[-1].setdefault("children", []).append(record)
+        else:
+            with self._lock:
+                self.records.append(record)
+        stack.append(record)
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            if self.hooks:
+                with ExitStack() as hooks:
+                    for hook in self.hooks:
+                        hooks.enter_context(hook(name, attrs))
+                    yield record
+            else:
+                yield record
+        except BaseException as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["wall"] = round(time.perf_counter() - wall0, 4)
+            record["cpu"] = round(time.thread_time() - cpu0, 4)
+            stack.pop()
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(record.pop("_peak"), peak)
+                base = record.pop("_base")
+                record["py_peak_kb"] = round((peak - base) / 1024, 1)
+                record["py_delta_kb"] = round((current - base) / 1024, 1)
+                if stack:
+                    stack[-1]["_peak"] = max(stack[-1].get("_peak", 0), peak)
+                tracemalloc.reset_peak()
+
+    def timed(self, name=None, **attrs):
+        """Decorator form of stage()."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or fn.__name__, **attrs):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_hook(self, hook):
+        """hook(name, attrs) returns a context manager entered around every stage (e.g. Profiler.hook)."""
+        self.hooks.append(hook)
+        return self
+
+    def activate(self):
+        """Makes this the recorder used by the module-level stage() helper."""
+        global _active
+        _active = self
+        return self
+
+    def close(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self, **extra):
+        """The run report: overall totals, per-stage-name aggregates, per-chapter rows and the stage tree."""
+        totals = {}
+        chapters = []
+
+        def visit(records):
+            for r in records:
+                t = totals.setdefault(r["name"], {"count": 0, "wall": 0.0, "cpu": 0.0})
+                t["count"] += 1
+                t["wall"] = round(t["wall"] + r.get("wall", 0.0), 4)
+                t["cpu"] = round(t["cpu"] + r.get("cpu", 0.0), 4)
+                if "py_peak_kb" in r:
+                    t["py_peak_kb"] = max(t.get("py_peak_kb", 0.0), r["py_peak_kb"])
+                if r["name"] == "chapter":
+                    row = {k: v for k, v in r.items() if k != "children"}
+                    row["stages"] = {c["name"]: c.get("wall") for c in r.get("children", [])}
+                    chapters.append(row)
+                visit(r.get("children", []))
+
+        visit(self.records)
+        return {
+            **self.info,
+            **extra,
+            "started_at": self._started_at,
+            "finished_at": datetime.utcnow().isoformat() + "Z",
+            "wall_seconds": round(time.perf_counter() - self._t0, 3),
+            "cpu_seconds": round(time.process_time() - self._cpu0, 3),
+            "max_rss_kb": _max_rss_kb(),
+            "trace_memory": self.trace_memory,
+            "totals": totals,
+            "chapters": chapters,
+            "stages": self.records,
+        }
+
+    @staticmethod
+    def report_path(output_path):
+        """<output dir>/.state/<base>.run_report.json, out of the way of the reviews in output/*.json."""
+        return state_path(output_path, ".run_report.json")
+
+    def save(self, path, **extra):
+        report = self.report(**extra)
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"Run report saved to {path}")
+        except Exception as e:
+            print(f"Warning: Could not write run report {path}: {e}")
+        return report
+
+
+@contextmanager
+def stage(name, **attrs):
+    """Times a block on the active recorder; does nothing when none is active."""
+    recorder = _active
+    if recorder is None:
+        yield None
+        return
+    with recorder.stage(name, **attrs) as record:
+        yield record
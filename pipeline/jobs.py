@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Books waiting to be (or being) processed by scripts/jobs.py workers
+JOBS_PATH = os.path.join("output", "jobs.sqlite")
+
+# Pipeline progress, in order. A job finishes at "uploaded", or at "validated" when uploads are off.
+STATES = ["queued", "ingested", "summarizing", "summarized", "validated", "uploaded"]
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    rating REAL,
+    affiliate_link TEXT,
+    options TEXT NOT NULL DEFAULT '[]',   -- JSON list of extra main.py arguments
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    last_error TEXT,
+    result TEXT,                          -- JSON summary from process_book
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    finished_at TEXT
+)
+"""
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker may have claimed it."""
+
+
+class JobQueue:
+    """
+    SQLite job table shared by any number of worker processes. A worker claims a job
+    by taking a time-limited lease, renews it while the job runs, and records each
+    pipeline stage as it is reached. A job whose lease expires (crashed worker) is
+    claimed again; failures are retried with exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, path=JOBS_PATH, backoff_base=30.0, backoff_max=3600.0, clock=time.time):
+        self.path = path
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (finished_at, next_attempt_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _write(self, sql, params):
+        with self._lock:
+            conn = self._connect()
+            try:
+                return conn.execute(sql, params).rowcount
+            finally:
+                conn.close()
+
+    def enqueue(self, path, rating=None, affiliate_link=None, options=(), max_attempts=3):
+        """
+        Adds a book and returns its job id. A book that is already queued or running
+        keeps its existing job (same id returned), so dropping a file twice is harmless.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT id FROM jobs WHERE path = ? AND finished_at IS NULL", (path,)).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row["id"]
+                cursor = conn.execute(
+                    "INSERT INTO jobs (path, rating, affiliate_link, options, max_attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, rating, affiliate_link, json.dumps(list(options)), max_attempts, _now(), _now()),
+                )
+                conn.execute("COMMIT")
+                return cursor.lastrowid
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def claim(self, worker, lease_seconds=300):
+        """Leases the oldest runnable job to `worker`; returns its row, or None when there is nothing to do."""
+        now = self.clock()
+        with self._lock:
+            conn = self._connect()
+            try:
+                # IMMEDIATE takes the write lock up front, so two workers can't pick the same row
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE finished_at IS NULL AND next_attempt_at <= ? "
+                    "AND (lease_owner IS NULL OR lease_expires_at < ?) ORDER BY next_attempt_at, id LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute("UPDATE jobs SET lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                             (worker, now + lease_seconds, _now(), row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        return self.get(row["id"])
+
+    def _owned(self, sql, params, job_id, worker):
+        """Runs an UPDATE that only applies while `worker` holds the lease."""
+        changed = self._write(f"{sql} WHERE id = ? AND lease_owner = ?", params + (job_id, worker))
+        if not changed:
+            raise LeaseLost(f"Job {job_id} is no longer leased to {worker}")
+
+    def heartbeat(self, job_id, worker, lease_seconds=300):
+        self._owned("UPDATE jobs SET lease_expires_at = ?, updated_at = ?",
+                    (self.clock() + lease_seconds, _now()), job_id, worker)
+
+    def advance(self, job_id, worker, state):
+        if state not in STATES:
+            raise ValueError(f"Unknown job state: {state}")
+        self._owned("UPDATE jobs SET state = ?, updated_at = ?", (state, _now()), job_id, worker)
+
+    def complete(self, job_id, worker, result=None):
+        """Marks the job finished in whatever stage it reached and releases the lease."""
+        self._owned("UPDATE jobs SET finished_at = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                    "last_error = NULL, result = ?, updated_at = ?",
+                    (_now(), json.dumps(result, ensure_ascii=False) if result is not None else None, _now()),
+                    job_id, worker)
+
+    def fail(self, job_id, worker, error, retry=True, result=None):
+        """
+        Records a failed attempt. The job is retried after an exponential backoff
+        (backoff_base * 2^(attempts-1), capped at backoff_max) until max_attempts;
+        after that, or with retry=False, it ends in the failed state.
+        Returns True if another attempt is scheduled.
+        """
+        job = self.get(job_id)
+        attempts = job["attempts"] + 1
+        result_json = json.dumps(result, ensure_ascii=False) if result is not None else job["result"]
+        if retry and attempts < job["max_attempts"]:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+            self._owned("UPDATE jobs SET attempts = ?, next_attempt_at = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                        "last_error = ?, result = ?, updated_at = ?",
+                        (attempts, self.clock() + delay, str(error)[:1000], result_json, _now()), job_id, worker)
+            return True
+        self._owned("UPDATE jobs SET attempts = ?, state = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                    "last_error = ?, result = ?, updated_at = ?",
+                    (attempts, FAILED, _now(), str(error)[:1000], result_json, _now()), job_id, worker)
+        return False
+
+    def retry(self, job_id):
+        """Puts a finished (or failed) job back in the queue, keeping its last reached stage."""
+        return bool(self._write(
+            "UPDATE jobs SET state = CASE state WHEN ? THEN 'queued' ELSE state END, attempts = 0, next_attempt_at = 0, "
+            "finished_at = NULL, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+            (FAILED, _now(), job_id)))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def latest(self, path):
+        """The most recent job for an EPUB path, or None if it was never queued."""
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE path = ? ORDER BY id DESC LIMIT 1",
+                                (os.path.abspath(path),)).fetchone()
+
+    def jobs(self, state=None, limit=None):
+        sql, params = "SELECT * FROM jobs", []
+        if state:
+            sql += " WHERE state = ?"
+            params.append(state)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def counts(self):
+        """{'pending': unfinished jobs, 'running': leased now, '<state>': jobs in that state}."""
+        now = self.clock()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE finished_at IS NULL").fetchone()[0]
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE finished_at IS NULL AND lease_expires_at >= ?",
+                                   (now,)).fetchone()[0]
+        counts = {state: 0 for state in STATES + [FAILED]}
+        counts.update({row["state"]: row["n"] for row in rows})
+        counts.update(pending=pending, running=running)
+        return counts
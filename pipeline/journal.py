@@ -0,0 +1,144 @@
+import json
+import os
+from datetime import datetime
+from .utils import has_meaningful_content
+
+
+class ChapterJournal:
+    """
+    Append-only JSONL checkpoint journal: one fsync'd record per completed chapter.
+    Resume reads from here; the final JSON is materialized once from the chapters.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tail_checked = False
+
+    @staticmethod
+    def path_for(output_path):
+        """Path of the journal stored next to an output JSON."""
+        base, _ = os.path.splitext(output_path)
+        return f"{base}.journal.jsonl"
+
+    def _truncate_torn_tail(self):
+        """
+        Cuts a partial last line (a crash mid-write) back to the last complete record, so
+        the next append starts on its own line instead of being glued onto the fragment.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = end
+            while pos > 0:
+                start = max(0, pos - 4096)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b"\n")
+                if newline != -1:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            print(f"Warning: Dropping a torn record at the end of {self.path}")
+            f.truncate(pos)
+
+    def _append(self, record):
+        record["ts"] = datetime.utcnow().isoformat() + "Z"
+        line = json.dumps(record, ensure_ascii=False)
+        if not self._tail_checked:
+            self._truncate_torn_tail()
+            self._tail_checked = True
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append_book(self, metadata, rating=None, affiliate_link=None, book_description=None):
+        """Records book-level information. Later records override earlier ones."""
+        self._append({
+            "type": "book",
+            "metadata": metadata,
+            "rating": rating,
+            "affiliateLink": affiliate_link,
+            "bookDescription": book_description or "",
+        })
+
+    def append_chapter(self, index, ch):
+        """Records a completed (or failed) chapter."""
+        self._append({
+            "type": "chapter",
+            "index": index,
+            "title": ch.get('title', 'Untitled'),
+            "level": ch.get('level', 1),
+            "is_parent": ch.get('is_parent', False),
+            "meaningful_content": ch['meaningful_content'] if 'meaningful_content' in ch else has_meaningful_content(ch.get('content', '')),
+            "fingerprint": ch.get('fingerprint'),
+            "summary": ch.get('summary', ''),
+            "highlights": ch.get('highlights', []),
+            "failed": bool(ch.get('failed')),
+        })
+
+    def load(self):
+        """
+        Replays the journal.
+        Returns (book record or {}, {(index, fingerprint): chapter record}) using the last
+        record of each, ordered by when that record was appended; identical chapters
+        (same fingerprint) keep separate checkpoints.
+        A torn trailing line (e.g. from a crash mid-write) is ignored.
+        """
+        book = {}
+        chapters = {}
+        if not os.path.exists(self.path):
+            return book, chapters
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Warning: Ignoring corrupt journal line in {self.path}")
+                    continue
+                if record.get('type') == 'book':
+                    book = record
+                elif record.get('type') == 'chapter' and record.get('fingerprint'):
+                    key = (record.get('index'), record['fingerprint'])
+                    chapters.pop(key, None)  # Keep the dict in the order records were last appended
+                    chapters[key] = record
+        return book, chapters
+
+    def chapters_in_order(self):
+        """
+        Chapter records ordered by their position in the book (for on-demand materialization).
+        Only the last record appended for each position counts: an edited chapter (or a model
+        or prompt change) leaves its old fingerprint's record behind in the journal.
+        """
+        _, chapters = self.load()
+        latest = {}
+        for record in chapters.values():
+            latest[record.get('index', 0)] = record
+        ordered = [latest[i] for i in sorted(latest)]
+        return [
+            {
+                "title": r.get('title', 'Untitled'),
+                "level": r.get('level', 1),
+                "is_parent": r.get('is_parent', False),
+                "meaningful_content": r.get('meaningful_content', False),
+                "fingerprint": r.get('fingerprint'),
+                "summary": r.get('summary', ''),
+                "highlights": r.get('highlights', []),
+                "failed": r.get('failed', False),
+            }
+            for r in ordered
+        ]
+
+    def reset(self):
+        """Discards all recorded progress."""
+        self._tail_checked = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,120 @@
+import math
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+# Every LLM chat call, with its token usage and latency
+LEDGER_PATH = os.path.join("output", "llm_ledger.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    book TEXT,
+    chapter TEXT,
+    call_type TEXT NOT NULL,         -- summary, merge, highlights, consolidate, description
+    model TEXT,
+    endpoint TEXT,
+    prompt_chars INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency REAL,                    -- seconds, including retries
+    retries INTEGER NOT NULL DEFAULT 0,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+CALL_TYPES = ["summary", "merge", "highlights", "consolidate", "description"]
+GROUPS = {"book": "book", "model": "model", "call": "call_type", "run": "run_id", "endpoint": "endpoint"}
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+class Ledger:
+    """
+    Append-only SQLite log of LLM calls. One row per chat request (after retries), so
+    token cost per book and slow call types can be answered after the fact.
+    """
+
+    def __init__(self, path=LEDGER_PATH, run_id=None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS calls_book ON calls (book)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, call_type, book=None, chapter=None, model=None, endpoint=None, prompt_chars=None,
+               prompt_tokens=None, completion_tokens=None, latency=None, retries=0, cache_hit=False, error=None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO calls (run_id, created_at, book, chapter, call_type, model, endpoint, prompt_chars, "
+                "prompt_tokens, completion_tokens, latency, retries, cache_hit, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, _now(), book, chapter, call_type, model, endpoint, prompt_chars,
+                 prompt_tokens, completion_tokens, latency, retries, int(bool(cache_hit)),
+                 error[:500] if error else None),
+            )
+
+    def rows(self, book=None, model=None, run_id=None):
+        clauses, params = [], []
+        for column, value in (("book", book), ("model", model), ("run_id", run_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            return conn.execute(f"SELECT * FROM calls{where} ORDER BY id", params).fetchall()
+
+    def aggregate(self, by="book", **filters):
+        """
+        Per-group totals: calls, errors, retries, cache hits, tokens, and latency
+        mean/p50/p90/p99 over the successful calls. `by` is one of GROUPS.
+        """
+        column = GROUPS[by]
+        groups = {}
+        for row in self.rows(**filters):
+            key = row[column] if row[column] is not None else "-"
+            g = groups.setdefault(key, {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+                                        "prompt_tokens": 0, "completion_tokens": 0, "_latencies": []})
+            g["calls"] += 1
+            g["retries"] += row["retries"] or 0
+            g["cache_hits"] += row["cache_hit"] or 0
+            if row["error"]:
+                g["errors"] += 1
+                continue
+            g["prompt_tokens"] += row["prompt_tokens"] or 0
+            g["completion_tokens"] += row["completion_tokens"] or 0
+            if row["latency"] is not None:
+                g["_latencies"].append(row["latency"])
+
+        for g in groups.values():
+            latencies = sorted(g.pop("_latencies"))
+            g["latency_total"] = round(sum(latencies), 3)
+            g["latency_mean"] = round(sum(latencies) / len(latencies), 3) if latencies else None
+            for pct in (50, 90, 99):
+                value = percentile(latencies, pct)
+                g[f"latency_p{pct}"] = round(value, 3) if value is not None else None
+        return groups
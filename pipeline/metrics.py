@@ -0,0 +1,287 @@
+import bisect
+import copy
+import math
+import threading
+
+# Latency buckets (seconds): LLM calls run from sub-second to minutes, HTTP calls to Sanity far less
+LLM_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+HTTP_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def checkpoint(self):
+        """Copy of the current values, for snapshot(since=...)."""
+        with self._lock:
+            return copy.deepcopy(self._values)
+
+    def _subtract(self, value, before):
+        return value - (before or 0)
+
+    def _items(self, since=None):
+        """Sorted (labels, value) pairs; with `since`, only what was added after that checkpoint."""
+        with self._lock:
+            items = sorted(copy.deepcopy(self._values).items())
+        if since is None or self.kind == "gauge":
+            return items
+        deltas = [(key, self._subtract(value, since.get(key))) for key, value in items]
+        return [(key, value) for key, value in deltas if value]
+
+    def samples(self):
+        """[(suffix, labels, value)] for the text exposition."""
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self, since=None):
+        items = self._items(since)
+        if not self.labelnames:
+            return items[0][1] if items else 0
+        return {",".join(v for _, v in key): value for key, value in items}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn):
+        """Reads the (unlabelled) value from fn() at scrape/snapshot time, e.g. a queue's length."""
+        self._function = fn
+
+    def _refresh(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return
+            with self._lock:
+                self._values[()] = value
+
+    def samples(self):
+        self._refresh()
+        return super().samples()
+
+    def snapshot(self, since=None):
+        self._refresh()
+        return super().snapshot(since)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LLM_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                state["counts"][idx] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items())
+        out = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                out.append(("_bucket", key + (("le", _format_value(bound)),), cumulative))
+            out.append(("_bucket", key + (("le", "+Inf"),), state["count"]))
+            out.append(("_sum", key, state["sum"]))
+            out.append(("_count", key, state["count"]))
+        return out
+
+    def _subtract(self, state, before):
+        if not before:
+            return state if state["count"] else None
+        if state["count"] == before["count"]:
+            return None
+        return {"counts": [a - b for a, b in zip(state["counts"], before["counts"])],
+                "sum": state["sum"] - before["sum"], "count": state["count"] - before["count"]}
+
+    def snapshot(self, since=None):
+        result = {}
+        for key, state in self._items(since):
+            result[",".join(v for _, v in key) or "all"] = {
+                "count": state["count"],
+                "sum": round(state["sum"], 4),
+                "mean": round(state["sum"] / state["count"], 4) if state["count"] else None,
+            }
+        return result
+
+
+class Registry:
+    """A set of metrics, rendered in the Prometheus text format or as a plain dict."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LLM_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def checkpoint(self):
+        """Current values of every metric; pass to snapshot(since=...) to get what happened after."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.checkpoint() for metric in metrics}
+
+    def snapshot(self, since=None):
+        """
+        Plain dict of every metric. With `since` (from checkpoint()), counters and histograms
+        only count what was added after it, e.g. one book in a long-running worker; gauges
+        are always current.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot(None if since is None else since.get(metric.name, {}))
+                for metric in metrics}
+
+    def clear(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+CHAPTERS = REGISTRY.counter("epub_chapters_processed_total", "Chapters finished, by outcome (summarized, cached, failed)", ["status"])
+LLM_IN_FLIGHT = REGISTRY.gauge("epub_llm_in_flight", "LLM requests currently waiting for a response")
+LLM_CALLS = REGISTRY.counter("epub_llm_calls_total", "LLM chat calls, by call type and outcome", ["call", "outcome"])
+LLM_TOKENS = REGISTRY.counter("epub_llm_tokens_total", "Tokens reported by the LLM server", ["kind"])
+LLM_TOKENS_PER_SECOND = REGISTRY.gauge("epub_llm_completion_tokens_per_second", "Completion tokens per second of the latest LLM call")
+LLM_LATENCY = REGISTRY.histogram("epub_llm_latency_seconds", "LLM call latency including retries", ["call"])
+CACHE = REGISTRY.counter("epub_chapter_cache_total", "Chapters looked up in saved progress (hit = summary reused)", ["result"])
+SANITY_LATENCY = REGISTRY.histogram("epub_sanity_request_seconds", "Sanity API response time", ["endpoint", "status"], buckets=HTTP_BUCKETS)
+OUTBOX_PENDING = REGISTRY.gauge("epub_outbox_pending", "Sanity writes waiting in the outbox")
+JOBS_PENDING = REGISTRY.gauge("epub_jobs_pending", "Books in the job queue that haven't finished")
+
+
+def cache_hit_ratio(since=None):
+    """Share of chapter lookups answered from saved progress (None before the first lookup), optionally since a checkpoint."""
+    counts = CACHE.snapshot(None if since is None else since.get(CACHE.name, {}))
+    total = sum(counts.values())
+    return round(counts.get("hit", 0) / total, 4) if total else None
+
+
+def start_http_server(port, address="127.0.0.1", registry=REGISTRY):
+    """Serves /metrics from a daemon thread; returns the server (call .shutdown() to stop it)."""
+    # http.server (and the email package behind it) is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would otherwise interleave with the pipeline's progress output
+
+    server = ThreadingHTTPServer((address, port), _Handler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
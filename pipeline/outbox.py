@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Failed or deferred Sanity writes waiting to be replayed
+OUTBOX_PATH = os.path.join("output", "sanity_outbox.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,              -- 'mutations' or 'cover'
+    label TEXT,                      -- usually the document id; entries per label replay in order
+                                     -- (space-separated ids for a transaction spanning several)
+    payload TEXT NOT NULL,           -- JSON
+    blob BLOB,                       -- image bytes for 'cover' entries
+    created_at TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    sent_at TEXT
+)
+"""
+
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def join_labels(labels):
+    """Outbox label of one transaction spanning several labels (Sanity ids never contain spaces)."""
+    return " ".join(sorted({str(l) for l in labels if l is not None})) or None
+
+
+def is_duplicate_transaction(exc, transaction_id):
+    """
+    True when Sanity refused a transaction because its ID was already used, i.e. an earlier
+    attempt committed it. Other 409s (revision mismatch, document exists) are real conflicts.
+    """
+    response = getattr(exc, 'response', None)
+    if response is None or response.status_code != 409 or not transaction_id:
+        return False
+    text = response.text or ""
+    return transaction_id in text and "already" in text.lower()
+
+
+class Outbox:
+    """
+    Durable on-disk queue of Sanity writes (SQLite), so generation never depends on the
+    network. Every entry has an idempotency key that doubles as the Sanity transactionId,
+    making a replay of an already-applied transaction harmless.
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _insert(self, kind, label, payload, blob=None, key=None):
+        payload_json = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        key = key or f"outbox-{uuid.uuid4().hex}"
+        with self._lock, self._connect() as conn:
+            # Repeating the label's latest pending write changes nothing, so it's stored once.
+            # An identical write queued after a different one (A, B, A) must replay again.
+            last = conn.execute(
+                "SELECT idempotency_key, kind, payload, blob FROM outbox WHERE sent_at IS NULL AND label IS ? ORDER BY id DESC LIMIT 1",
+                (label,),
+            ).fetchone()
+            if last and (last["kind"], last["payload"], last["blob"]) == (kind, payload_json, blob):
+                return last["idempotency_key"]
+            conn.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, kind, label, payload, blob, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, label, payload_json, blob, _now()),
+            )
+        return key
+
+    def enqueue(self, mutations, label=None, key=None):
+        """
+        Queues one transaction; `key` is the transactionId of an attempt that already
+        went out (and may have committed). A repeat of the label's latest pending write is
+        stored once.
+        """
+        return self._insert("mutations", label, {"mutations": mutations}, key=key)
+
+    def enqueue_cover(self, doc_id, image_bytes, mimetype="image/jpeg"):
+        """Queues a cover upload; on replay the asset is uploaded and set on the document if it has none."""
+        return self._insert("cover", doc_id, {"doc_id": doc_id, "mimetype": mimetype}, blob=image_bytes)
+
+    def pending(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM outbox WHERE sent_at IS NULL ORDER BY id").fetchall()
+
+    def stats(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS total, SUM(sent_at IS NULL) AS pending, SUM(sent_at IS NULL AND attempts > 0) AS failing FROM outbox"
+            ).fetchone()
+        return {"total": row["total"], "pending": row["pending"] or 0, "failing": row["failing"] or 0}
+
+    def _mark(self, entry_id, error=None):
+        with self._lock, self._connect() as conn:
+            if error is None:
+                conn.execute("UPDATE outbox SET sent_at = ?, attempts = attempts + 1, last_error = NULL WHERE id = ?", (_now(), entry_id))
+            else:
+                conn.execute("UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?", (error[:500], entry_id))
+
+    def _replay_entry(self, uploader, row):
+        payload = json.loads(row["payload"])
+        if row["kind"] == "cover":
+            asset_doc = uploader.upload_image_asset(row["blob"], mimetype=payload.get("mimetype", "image/jpeg"))
+            if not asset_doc:
+                raise RuntimeError("cover upload failed")
+            mutations = [{"patch": {"id": payload["doc_id"], "setIfMissing": {"coverImage": {
+                "_type": "image", "asset": {"_type": "reference", "_ref": asset_doc["_id"]}}}}}]
+        else:
+            mutations = payload["mutations"]
+        # A 409 "transaction ID already used" (an earlier attempt committed it) counts as
+        # sent there; any other conflict raises and keeps the entry pending
+        uploader._post_mutations(mutations, transaction_id=row["idempotency_key"])
+
+    def _replay_label(self, uploader, rows):
+        sent = 0
+        for idx, row in enumerate(rows):
+            try:
+                self._replay_entry(uploader, row)
+            except Exception as e:
+                detail = str(e)
+                if getattr(e, 'response', None) is not None:
+                    detail += f" ({e.response.text[:200]})"
+                self._mark(row["id"], error=detail)
+                # Later writes for the same document stay queued behind the failed one
+                return sent, len(rows) - idx
+            self._mark(row["id"])
+            sent += 1
+        return sent, 0
+
+    def replay(self, uploader, concurrency=4):
+        """
+        Drains pending entries. Different labels replay concurrently (bounded); entries
+        sharing a label replay in order and stop at the first failure. An entry spanning
+        several labels joins their chains into one.
+        Returns (sent, failed).
+        """
+        if not uploader.enabled:
+            print("Sanity Uploader not enabled. Cannot replay outbox.")
+            return 0, 0
+        chains = {}  # chain id -> rows
+        owner = {}   # label -> chain id
+        for row in self.pending():
+            labels = row["label"].split(" ") if row["label"] else []
+            joined = {owner[l] for l in labels if l in owner}
+            chain = min(joined) if joined else row["id"]
+            rows = chains.setdefault(chain, [])
+            for other in joined - {chain}:
+                rows.extend(chains.pop(other))
+                owner.update({l: chain for l, c in owner.items() if c == other})
+            rows.append(row)
+            owner.update({l: chain for l in labels})
+        if not chains:
+            return 0, 0
+
+        chains = [sorted(rows, key=lambda row: row["id"]) for rows in chains.values()]
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(lambda rows: self._replay_label(uploader, rows), chains))
+        return sum(r[0] for r in results), sum(r[1] for r in results)
@@ -1,8 +1,8 @@
 import json
-import uuid
+import os
 import re
 from datetime import date
-from .utils import text_to_portable_text, has_meaningful_content
+from .utils import text_to_portable_text, has_meaningful_content, stable_key, state_path
 
 class JSONFormatter:
     @staticmethod
@@ -38,107 +38,61 @@ class JSONFormatter:
         - Those become Parts, their children become Chapters
         - Everything above them becomes standalone Chapters
         """
-        if not chapters:
-            return []
-        
-        # Step 1: Analyze the structure to find which items should be Parts
-        # An item is a Part if:
-        # - It has children (is_parent=True)
-        # - Its children do NOT have children (children are leaves)
-        # - There's no sibling with is_parent=True that also has leaf children
-        
-        part_indices = set()
-        
-        for i, ch in enumerate(chapters):
-            if not ch.get('is_parent', False):
-                continue
-            
-            current_level = ch.get('level', 1)
-            
-            # Check if this item has actual children (items at level + 1)
-            # AND those children are leaves (not parents themselves)
-            has_direct_children = False
-            all_children_are_leaves = True
-            
-            j = i + 1
-            while j < len(chapters):
-                next_ch = chapters[j]
-                next_level = next_ch.get('level', 1)
-                
-                # Stop if we've moved back to same or higher level
-                if next_level <= current_level:
-                    break
-                
-                # If this is a direct child (level + 1)
-                if next_level == current_level + 1:
-                    has_direct_children = True
-                    # If this child is also a parent, then our item is NOT a Part
-                    if next_ch.get('is_parent', False):
-                        all_children_are_leaves = False
-                        break
-                
-                j += 1
-            
-            # Item is a Part if it has direct children AND all are leaves
-            if has_direct_children and all_children_are_leaves:
-                part_indices.add(i)
-        
-        # Step 2: Build the structure
-        book_structure = []
-        current_part = None
-        current_part_level = None
-        
-        for i, ch in enumerate(chapters):
-            title = ch.get('title', 'Untitled')
-            summary_text = ch.get('summary', '')
-            level = ch.get('level', 1)
-            
-            # Reset current_part if we're back to same or higher level than the part
-            if current_part and current_part_level is not None and level <= current_part_level:
-                current_part = None
-                current_part_level = None
-            
-            if i in part_indices:
-                # This item becomes a Part
-                # Get the raw content to check if it has meaningful text
-                raw_content = ch.get('content', '')
-                
-                current_part = {
-                    "_type": "part",
-                    "_key": str(uuid.uuid4()),
-                    "partTitle": title,
-                    "chapters": []
-                }
-                
-                # Only add partDescription if the part has meaningful content (not just a heading)
-                if has_meaningful_content(raw_content):
-                    current_part["partDescription"] = text_to_portable_text(summary_text)
-                
-                current_part_level = level
-                book_structure.append(current_part)
-                
-            elif current_part and level > current_part_level:
-                # This is a child of the current Part → becomes a Chapter under Part
-                chapter_obj = {
-                    "_type": "chapter",
-                    "_key": str(uuid.uuid4()),
-                    "chapterTitle": title,
-                    "chapterSummary": text_to_portable_text(summary_text)
-                }
-                current_part['chapters'].append(chapter_obj)
-                
-            else:
-                # Standalone chapter (not under any Part)
-                chapter_obj = {
-                    "_type": "chapter",
-                    "_key": str(uuid.uuid4()),
-                    "chapterTitle": title,
-                    "chapterSummary": text_to_portable_text(summary_text)
-                }
-                book_structure.append(chapter_obj)
-        
-        return book_structure
+        builder = StructureBuilder()
+        for ch in chapters:
+            builder.add(ch)
+        return builder.finish()
+
+
+    @staticmethod
+    def fingerprint_path(output_path):
+        """Path of the fingerprint sidecar of an output JSON (in the output's .state/ folder)."""
+        return state_path(output_path, ".fingerprints.json")
+
+    @staticmethod
+    def load_fingerprints(output_path):
+        """
+        Returns {(index, fingerprint): chapterTitle} for chapters completed in a previous
+        run (see utils.match_by_fingerprint). Older sidecars without positions load with
+        index None, so they only match by unique fingerprint.
+        """
+        path = JSONFormatter.fingerprint_path(output_path)
+        if not os.path.exists(path):
+            # Written next to the output JSON before sidecars moved to .state/
+            path = f"{os.path.splitext(output_path)[0]}.fingerprints.json"
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                chapters = json.load(f).get('chapters', [])
+        except Exception as e:
+            print(f"Warning: Could not load chapter fingerprints: {e}")
+            return {}
+        if isinstance(chapters, dict):
+            return {(None, fp): title for fp, title in chapters.items()}
+        return {(c.get('index'), c['fingerprint']): c.get('title', '') for c in chapters if c.get('fingerprint')}
+
+    @staticmethod
+    def save_fingerprints(chapters, output_path):
+        """Persists the fingerprints of every successfully summarized chapter."""
+        fingerprints = [
+            {"index": i, "fingerprint": ch['fingerprint'], "title": ch.get('title', '')}
+            for i, ch in enumerate(chapters)
+            if ch.get('fingerprint') and ch.get('summary') and not ch.get('failed')
+        ]
+        path = JSONFormatter.fingerprint_path(output_path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"chapters": fingerprints}, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error saving chapter fingerprints: {e}")
 
+    @staticmethod
+    def slugify(title):
+        """Slug used for the Sanity document (and its id) from the book title."""
+        slug = title.lower().replace(' ', '-')
+        return re.sub(r'[^a-z0-9-]', '', slug) # Remove special chars
 
     @staticmethod
     def save(metadata, chapters, output_path, book_description=None, rating=0, affiliate_link=None):
@@ -151,8 +105,7 @@ class JSONFormatter:
         book_structure = JSONFormatter.build_structure(chapters)
 
         # 3. Slugify title
-        slug = metadata.get("title", "unknown").lower().replace(' ', '-')
-        slug = re.sub(r'[^a-z0-9-]', '', slug) # Remove special chars
+        slug = JSONFormatter.slugify(metadata.get("title", "unknown"))
 
         # Default affiliate link logic if not provided
         if not affiliate_link:
@@ -186,5 +139,135 @@ class JSONFormatter:
             print(f"Successfully saved output to {output_path}")
         except Exception as e:
             print(f"Error saving JSON: {e}")
+
+        JSONFormatter.save_fingerprints(chapters, output_path)
             
         return final_data
+
+
+class StructureBuilder:
+    """
+    Single-pass, stack-based builder for the Part → Chapters hierarchy.
+
+    An item is a Part if it has children (is_parent=True), it has at least one direct
+    child (level + 1) and none of its direct children is itself a parent. Open parents
+    are kept on a stack ordered by level, so each item is classified in O(1) amortized
+    time instead of scanning ahead from every parent.
+
+    Chapters can be added one at a time. Items following a parent whose Part status is
+    not yet known are held back until it is decided; `structure` only ever contains
+    the decided prefix, and `finish()` closes everything that is still open.
+    """
+
+    def __init__(self):
+        self.structure = []
+        self._open = []      # Open parent entries, strictly increasing level
+        self._pending = []   # Entries waiting (in order) for an earlier Part decision
+        self._current_part = None
+        self._current_part_level = None
+        self._used_keys = set()
+
+    def add(self, ch):
+        """Adds the next item of the flat, TOC-ordered chapter list."""
+        level = ch.get('level', 1)
+        is_parent = ch.get('is_parent', False)
+
+        # Every open parent at the same or a deeper level ends here
+        while self._open and self._open[-1]['level'] >= level:
+            self._close(self._open.pop())
+
+        # Direct child of the innermost open parent?
+        if self._open and self._open[-1]['level'] == level - 1:
+            parent = self._open[-1]
+            parent['has_children'] = True
+            if is_parent and not parent['decided']:
+                # A child that is itself a parent means the item is NOT a Part
+                parent['decided'] = True
+
+        entry = {'ch': ch, 'level': level, 'decided': not is_parent, 'is_part': False, 'has_children': False}
+        if is_parent:
+            self._open.append(entry)
+        self._pending.append(entry)
+        self._flush()
+
+    def finish(self):
+        """Closes all open parents and returns the complete structure."""
+        while self._open:
+            self._close(self._open.pop())
+        self._flush()
+        return self.structure
+
+    def _close(self, entry):
+        if not entry['decided']:
+            entry['decided'] = True
+            entry['is_part'] = entry['has_children']
+
+    def _flush(self):
+        emitted = 0
+        for entry in self._pending:
+            if not entry['decided']:
+                break
+            self._emit(entry)
+            emitted += 1
+        if emitted:
+            del self._pending[:emitted]
+
+    def _key_for(self, kind, ch):
+        """Deterministic key from the chapter fingerprint (or title), unique within the document."""
+        base = stable_key(kind, ch.get('fingerprint') or '', ch.get('title', ''))
+        key = base
+        n = 1
+        while key in self._used_keys:
+            key = stable_key(base, n)
+            n += 1
+        self._used_keys.add(key)
+        return key
+
+    def _emit(self, entry):
+        ch = entry['ch']
+        title = ch.get('title', 'Untitled')
+        summary_text = ch.get('summary', '')
+        level = entry['level']
+
+        # Reset current_part if we're back to same or higher level than the part
+        if self._current_part and self._current_part_level is not None and level <= self._current_part_level:
+            self._current_part = None
+            self._current_part_level = None
+
+        if entry['is_part']:
+            # This item becomes a Part
+            # Get the raw content to check if it has meaningful text
+            raw_content = ch.get('content', '')
+
+            part_key = self._key_for("part", ch)
+            part = {
+                "_type": "part",
+                "_key": part_key,
+                "partTitle": title,
+                "chapters": []
+            }
+
+            # Only add partDescription if the part has meaningful content (not just a heading).
+            # Chapters replayed from the journal carry the precomputed flag instead of content.
+            meaningful = ch['meaningful_content'] if 'meaningful_content' in ch else has_meaningful_content(raw_content)
+            if meaningful:
+                part["partDescription"] = text_to_portable_text(summary_text, key_seed=part_key)
+
+            self._current_part = part
+            self._current_part_level = level
+            self.structure.append(part)
+            return
+
+        chapter_key = self._key_for("chapter", ch)
+        chapter_obj = {
+            "_type": "chapter",
+            "_key": chapter_key,
+            "chapterTitle": title,
+            "chapterSummary": text_to_portable_text(summary_text, key_seed=chapter_key)
+        }
+        if self._current_part and level > self._current_part_level:
+            # This is a child of the current Part → becomes a Chapter under Part
+            self._current_part['chapters'].append(chapter_obj)
+        else:
+            # Standalone chapter (not under any Part)
+            self.structure.append(chapter_obj)
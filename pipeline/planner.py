@@ -0,0 +1,223 @@
+import os
+
+from .ledger import CALL_TYPES, Ledger
+
+# Rough conversion used throughout the pipeline (see Chunker)
+CHARS_PER_TOKEN = 4
+
+# Fixed part of each prompt (system prompt + instructions), measured from Summarizer's prompts
+PROMPT_OVERHEAD_CHARS = {"summary": 1550, "merge": 1130, "highlights": 725, "consolidate": 850, "description": 810}
+
+# Used when the ledger has no completions to go by
+DEFAULT_COMPLETION_TOKENS = {"summary": 350, "merge": 500, "highlights": 250, "consolidate": 400, "description": 300}
+HIGHLIGHTS_PER_CHUNK = 5
+HIGHLIGHT_CHARS = 150
+CONSOLIDATE_ABOVE = 10  # Summarizer.extract_highlights consolidates lists longer than this
+MERGE_UP_TO = 3  # Summarizer.summarize_chapter merges at most this many chunk summaries
+
+
+def estimate_tokens(chars):
+    return -(-chars // CHARS_PER_TOKEN)
+
+
+class CallHistory:
+    """
+    What previous runs in the ledger say about future calls. Per call type, latency is
+    fitted as a + b * prompt_chars (least squares) when there is enough spread in the
+    history, otherwise the mean is used; call types never seen fall back to a fit over
+    all calls. Completion lengths and how often chapters of a given chunk count needed
+    a consolidation call are taken from the same rows.
+    """
+
+    def __init__(self, rows=()):
+        rows = [r for r in rows if not r["error"] and r["latency"] is not None]
+        self.calls = len(rows)
+        self.fits = {}
+        self.completion_tokens = {}
+        for call_type in CALL_TYPES:
+            typed = [r for r in rows if r["call_type"] == call_type]
+            if typed:
+                self.fits[call_type] = self._fit(typed)
+            completions = [r["completion_tokens"] for r in typed if r["completion_tokens"]]
+            if completions:
+                self.completion_tokens[call_type] = sum(completions) / len(completions)
+        self.overall = self._fit(rows) if rows else None
+
+        # Chunk count (= highlights calls) of each chapter seen, and whether it was consolidated
+        chapters = {}
+        for r in rows:
+            if r["call_type"] in ("highlights", "consolidate") and r["chapter"] is not None:
+                seen = chapters.setdefault((r["run_id"], r["book"], r["chapter"]), [0, False])
+                if r["call_type"] == "highlights":
+                    seen[0] += 1
+                else:
+                    seen[1] = True
+        by_chunks = {}
+        for chunks, consolidated in chapters.values():
+            if chunks:
+                by_chunks.setdefault(chunks, []).append(consolidated)
+        self.consolidate_rates = {n: sum(flags) / len(flags) for n, flags in by_chunks.items()}
+
+    @classmethod
+    def from_ledger(cls, path, model=None):
+        """History for `model` (or every model when it has none); an empty model if there is no ledger yet."""
+        if not os.path.exists(path):
+            return cls()
+        ledger = Ledger(path)
+        rows = ledger.rows(model=model) if model else []
+        return cls(rows or ledger.rows())
+
+    @staticmethod
+    def _fit(rows):
+        points = [(r["prompt_chars"] or 0, r["latency"]) for r in rows]
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if n < 3 or var_x == 0:
+            return (mean_y, 0.0)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        if slope <= 0:
+            return (mean_y, 0.0)
+        return (mean_y - slope * mean_x, slope)
+
+    def predict(self, call_type, prompt_chars):
+        """Seconds for one call, or None without any history."""
+        fit = self.fits.get(call_type) or self.overall
+        if fit is None:
+            return None
+        intercept, slope = fit
+        return max(0.0, intercept + slope * prompt_chars)
+
+    def consolidates(self, chunks):
+        """Whether a chapter of `chunks` chunks is expected to need a consolidation call."""
+        if not self.consolidate_rates:
+            return chunks * HIGHLIGHTS_PER_CHUNK > CONSOLIDATE_ABOVE
+        nearest = min(self.consolidate_rates, key=lambda n: (abs(n - chunks), -n))
+        return self.consolidate_rates[nearest] >= 0.5
+
+    def completion_chars(self, call_type):
+        tokens = self.completion_tokens.get(call_type, DEFAULT_COMPLETION_TOKENS[call_type])
+        return int(tokens * CHARS_PER_TOKEN)
+
+
+def chapter_calls(chunk_chars, history):
+    """
+    The LLM calls Summarizer makes for one chapter, as {call_type: [prompt chars, ...]},
+    following summarize_chapter and extract_highlights. Consolidation depends on how many
+    highlights come back, so it is predicted from history (see CallHistory.consolidates).
+    """
+    calls = {call_type: [] for call_type in CALL_TYPES}
+    if not chunk_chars:
+        return calls
+    for chars in chunk_chars:
+        calls["summary"].append(PROMPT_OVERHEAD_CHARS["summary"] + chars)
+        calls["highlights"].append(PROMPT_OVERHEAD_CHARS["highlights"] + chars)
+    if 1 < len(chunk_chars) <= MERGE_UP_TO:
+        calls["merge"].append(PROMPT_OVERHEAD_CHARS["merge"] + len(chunk_chars) * history.completion_chars("summary"))
+    if history.consolidates(len(chunk_chars)):
+        highlights = max(len(chunk_chars) * HIGHLIGHTS_PER_CHUNK, CONSOLIDATE_ABOVE + 1)
+        calls["consolidate"].append(PROMPT_OVERHEAD_CHARS["consolidate"] + highlights * HIGHLIGHT_CHARS)
+    return calls
+
+
+def _summary_chars(chunks, history):
+    """Expected length of a chapter's final summary, which feeds the description prompt."""
+    if chunks > MERGE_UP_TO:
+        return chunks * history.completion_chars("summary")  # Chunk summaries are joined unmerged
+    if chunks > 1:
+        return history.completion_chars("merge")
+    return history.completion_chars("summary") if chunks else 0
+
+
+def plan_book(chapters, chunker, cached=(), needs_description=True, history=None):
+    """
+    Estimates what summarizing `chapters` (cleaned, segmented and filtered, as main.py
+    would summarize them) costs: chunks, prompt tokens and LLM calls per chapter and in
+    total, plus the projected LLM wall time when `history` has any calls. Chapters whose
+    index is in `cached` are already done and cost nothing.
+    """
+    history = history or CallHistory()
+    totals = {call_type: {"calls": 0, "prompt_tokens": 0, "seconds": 0.0} for call_type in CALL_TYPES}
+    rows = []
+    summary_chars = 0
+    for i, ch in enumerate(chapters):
+        content = ch.get('content', '').strip()
+        is_cached = i in cached
+        chunks = chunker.chunk(ch.get('content', '')) if content else []
+        calls = chapter_calls([] if is_cached else [len(c) for c in chunks], history)
+        row = {"index": i, "title": ch['title'], "chars": len(content), "chunks": len(chunks), "cached": is_cached,
+               "calls": 0, "prompt_tokens": 0, "seconds": 0.0}
+        for call_type, prompts in calls.items():
+            for chars in prompts:
+                tokens = estimate_tokens(chars)
+                seconds = history.predict(call_type, chars) or 0.0
+                totals[call_type]["calls"] += 1
+                totals[call_type]["prompt_tokens"] += tokens
+                totals[call_type]["seconds"] += seconds
+                row["calls"] += 1
+                row["prompt_tokens"] += tokens
+                row["seconds"] += seconds
+        row["seconds"] = round(row["seconds"], 1)
+        rows.append(row)
+        summary_chars += len(ch['title']) + _summary_chars(len(chunks), history)
+
+    if needs_description and chapters:
+        chars = PROMPT_OVERHEAD_CHARS["description"] + summary_chars
+        totals["description"]["calls"] += 1
+        totals["description"]["prompt_tokens"] += estimate_tokens(chars)
+        totals["description"]["seconds"] += history.predict("description", chars) or 0.0
+
+    has_history = history.overall is not None
+    for t in totals.values():
+        t["seconds"] = round(t["seconds"], 1)
+    return {
+        "chapters": rows,
+        "calls": totals,
+        "total_calls": sum(t["calls"] for t in totals.values()),
+        "total_prompt_tokens": sum(t["prompt_tokens"] for t in totals.values()),
+        "wall_seconds": round(sum(t["seconds"] for t in totals.values()), 1) if has_history else None,
+        "history_calls": history.calls,
+    }
+
+
+def format_duration(seconds):
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{secs:02d}s"
+
+
+def format_plan(plan):
+    """Plain-text report: one row per chapter, then calls per type and the projected wall time."""
+    timed = plan["wall_seconds"] is not None
+    lines = [f"{'#':>4}  {'Chapter':<40} {'Chars':>8} {'Chunks':>6} {'Calls':>5} {'~Tokens':>8}" + ("  ~Time" if timed else "")]
+    lines.append("-" * len(lines[0]))
+    for row in plan["chapters"]:
+        title = row["title"] if len(row["title"]) <= 40 else row["title"][:37] + "..."
+        line = f"{row['index'] + 1:>4}  {title:<40} {row['chars']:>8} {row['chunks']:>6} "
+        if row["cached"]:
+            line += f"{'done':>5} {'-':>8}"
+        else:
+            line += f"{row['calls']:>5} {row['prompt_tokens']:>8}"
+            if timed:
+                line += f"  {format_duration(row['seconds'])}"
+        lines.append(line)
+
+    lines.append("")
+    lines.append(f"{'Call type':<12} {'Calls':>6} {'~Prompt tokens':>15}" + (f" {'~Time':>9}" if timed else ""))
+    for call_type, t in plan["calls"].items():
+        if t["calls"]:
+            lines.append(f"{call_type:<12} {t['calls']:>6} {t['prompt_tokens']:>15}"
+                         + (f" {format_duration(t['seconds']):>9}" if timed else ""))
+    lines.append(f"{'total':<12} {plan['total_calls']:>6} {plan['total_prompt_tokens']:>15}"
+                 + (f" {format_duration(plan['wall_seconds']):>9}" if timed else ""))
+    lines.append("")
+    cached = sum(1 for row in plan["chapters"] if row["cached"])
+    if cached:
+        lines.append(f"{cached} chapters are already summarized and won't be sent again.")
+    if timed:
+        lines.append(f"Projected LLM time: {format_duration(plan['wall_seconds'])} "
+                     f"(fitted on {plan['history_calls']} previous calls in the ledger).")
+    else:
+        lines.append("No previous calls in the ledger, so no time estimate; run one book first.")
+    return "\n".join(lines)
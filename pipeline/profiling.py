@@ -0,0 +1,132 @@
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+MODES = ("both", "cprofile", "sample")
+
+
+def add_arguments(parser):
+    """The --profile options shared by main.py and the scripts."""
+    parser.add_argument("--profile", nargs="?", const="all", default=None, metavar="STAGES",
+                        help="Profile stages (comma-separated names, or all) and write .prof and collapsed-stack files")
+    parser.add_argument("--profile-mode", choices=MODES, default="both",
+                        help="cprofile (deterministic, .prof), sample (collapsed stacks for flamegraphs) or both (default)")
+    parser.add_argument("--profile-interval", type=float, default=0.005,
+                        help="Seconds between stack samples (default: 0.005)")
+
+
+def from_args(args, output_dir, prefix):
+    """A Profiler configured from add_arguments() options, or None when --profile wasn't given."""
+    if not getattr(args, "profile", None):
+        return None
+    stages = None if args.profile == "all" else [s.strip() for s in args.profile.split(",") if s.strip()]
+    return Profiler(output_dir, prefix, stages=stages, mode=args.profile_mode, interval=args.profile_interval)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profiler:
+    """
+    Per-stage profiles, accumulated across every run of a stage (all chapters end up in
+    one "chapter" profile) and written on close():
+    - <prefix>.profile.<stage>.prof: cProfile stats, for snakeviz / pstats
+    - <prefix>.profile.<stage>.collapsed: sampled "frame;frame;frame count" lines, for
+      flamegraph.pl or speedscope
+    Only one stage is profiled at a time: a selected stage nested in another one counts
+    toward the outer profile. Stages on background threads are not profiled.
+    """
+
+    def __init__(self, output_dir, prefix, stages=None, mode="both", interval=0.005):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.stages = set(stages) if stages else None
+        self.mode = mode
+        self.interval = interval
+        self.profiles = {}
+        self.samples = {}
+        self._current = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def wants(self, name):
+        return self.stages is None or name in self.stages
+
+    @contextmanager
+    def profile(self, name, attrs=None):
+        """Profiles the enclosed block as stage `name` (no-op if not selected, nested or off the main thread)."""
+        if (self._current is not None or not self.wants(name)
+                or threading.current_thread() is not threading.main_thread()):
+            yield
+            return
+
+        profiler = None
+        if self.mode in ("both", "cprofile"):
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+        if self.mode in ("both", "sample"):
+            self.samples.setdefault(name, Counter())
+            self._start_sampler()
+        self._current = name
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self._current = None
+
+    def hook(self, name, attrs):
+        """RunRecorder.add_hook() adapter, so every instrumented stage can be profiled."""
+        return self.profile(name, attrs)
+
+    def _start_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, args=(threading.main_thread().ident,),
+                                             name="profile-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self, thread_id):
+        while not self._stop.wait(self.interval):
+            name = self._current
+            if name is None:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack and self._current == name:
+                self.samples[name][";".join(reversed(stack))] += 1
+
+    def close(self):
+        """Stops sampling and writes the profile files. Returns the written paths."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        for name, profiler in self.profiles.items():
+            path = self._path(name, "prof")
+            profiler.dump_stats(path)
+            written.append(path)
+        for name, stacks in self.samples.items():
+            path = self._path(name, "collapsed")
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            written.append(path)
+        if written:
+            print(f"Profiles written to {self.output_dir} ({len(written)} files, {self.prefix}.profile.*)")
+        return written
+
+    def _path(self, name, extension):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        return os.path.join(self.output_dir, f"{self.prefix}.profile.{safe}.{extension}")
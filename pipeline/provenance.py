@@ -0,0 +1,100 @@
+import re
+from collections import defaultdict
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def _tokenize(text):
+    """Returns (word, start, end) tuples for the lowercased text."""
+    return [(m.group(), m.start(), m.end()) for m in WORD_PATTERN.finditer((text or '').lower())]
+
+
+class HighlightIndex:
+    """
+    Word n-gram hash index over cleaned chapter texts.
+    Maps a highlight back to the chapter (and character span) it was taken from,
+    so per-chapter highlights can be recovered from an existing output without the LLM.
+    """
+
+    def __init__(self, texts, ngram=5, max_postings=64):
+        self.ngram = ngram
+        self.max_postings = max_postings
+        self.offsets = []  # Per chapter: list of (start, end) character offsets per token
+        self.postings = defaultdict(list)  # n-gram hash -> [(chapter_idx, token_pos)]
+
+        for chapter_idx, text in enumerate(texts):
+            tokens = _tokenize(text)
+            self.offsets.append([(start, end) for _, start, end in tokens])
+            words = [w for w, _, _ in tokens]
+            for pos in range(len(words) - ngram + 1):
+                self.postings[hash(tuple(words[pos:pos + ngram]))].append((chapter_idx, pos))
+
+    def _query_hashes(self, highlight):
+        words = [w for w, _, _ in _tokenize(highlight)]
+        # Short highlights still get one (shorter) n-gram, which simply won't match.
+        n = min(self.ngram, len(words))
+        return [hash(tuple(words[pos:pos + self.ngram])) for pos in range(len(words) - n + 1)]
+
+    def locate(self, highlight, min_score=0.2):
+        """
+        Finds the best-matching chapter for a highlight.
+        Returns {'chapter', 'start', 'end', 'score'} or None if nothing matches well enough.
+        """
+        hashes = self._query_hashes(highlight)
+        if not hashes:
+            return None
+
+        chapter_votes = defaultdict(int)
+        hits = defaultdict(list)  # chapter_idx -> [(query_pos, token_pos)]
+        for query_pos, h in enumerate(hashes):
+            postings = self.postings.get(h)
+            # Extremely common phrases carry no location signal
+            if not postings or len(postings) > self.max_postings:
+                continue
+            seen = set()
+            for chapter_idx, token_pos in postings:
+                hits[chapter_idx].append((query_pos, token_pos))
+                if chapter_idx not in seen:
+                    chapter_votes[chapter_idx] += 1
+                    seen.add(chapter_idx)
+
+        if not chapter_votes:
+            return None
+
+        # Most votes wins; ties go to the earliest chapter
+        best = min(chapter_votes, key=lambda c: (-chapter_votes[c], c))
+        score = chapter_votes[best] / len(hashes)
+        if score < min_score:
+            return None
+
+        # Use the densest alignment (token_pos - query_pos) to pick the span
+        diagonals = defaultdict(list)
+        for query_pos, token_pos in hits[best]:
+            diagonals[token_pos - query_pos].append(token_pos)
+        positions = max(diagonals.values(), key=len)
+        offsets = self.offsets[best]
+        last_token = min(max(positions) + self.ngram - 1, len(offsets) - 1)
+
+        return {
+            "chapter": best,
+            "start": offsets[min(positions)][0],
+            "end": offsets[last_token][1],
+            "score": round(score, 3),
+        }
+
+    def assign(self, highlights, min_score=0.2):
+        """
+        Groups highlights by the chapter they were located in.
+        Returns (dict chapter_idx -> [highlights], list of unmatched highlights).
+        """
+        by_chapter = defaultdict(list)
+        unmatched = []
+        for h in highlights:
+            if not isinstance(h, str):
+                continue
+            match = self.locate(h, min_score=min_score)
+            if match:
+                by_chapter[match["chapter"]].append(h)
+            else:
+                unmatched.append(h)
+        return dict(by_chapter), unmatched
@@ -0,0 +1,118 @@
+import json
+
+
+def _keyed(items):
+    """Returns the _key list if every item is a dict with a unique _key, else None."""
+    if not isinstance(items, list):
+        return None
+    keys = [item.get('_key') if isinstance(item, dict) else None for item in items]
+    if not keys or None in keys or len(set(keys)) != len(keys):
+        return None
+    return keys
+
+
+def _item_path(path, key):
+    return f'{path}[_key=="{key}"]'
+
+
+def _diff_value(path, old, new, ops):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        _diff_object(path, old, new, ops)
+    elif _keyed(old) is not None and _keyed(new) is not None:
+        _diff_keyed_array(path, old, new, ops)
+    else:
+        ops['set'][path] = new
+
+
+def _diff_object(path, old, new, ops, unset_missing=True):
+    for field, value in new.items():
+        child = f"{path}.{field}" if path else field
+        if field not in old:
+            ops['set'][child] = value
+        else:
+            _diff_value(child, old[field], value, ops)
+    if unset_missing:
+        for field in old:
+            if field not in new:
+                ops['unset'].append(f"{path}.{field}" if path else field)
+
+
+def _diff_keyed_array(path, old, new, ops):
+    old_keys = _keyed(old)
+    new_keys = _keyed(new)
+    common = [k for k in new_keys if k in set(old_keys)]
+    # Reordered (or nothing left to anchor inserts on): replace the array wholesale
+    if not common or common != [k for k in old_keys if k in set(new_keys)]:
+        ops['set'][path] = new
+        return
+
+    old_by_key = dict(zip(old_keys, old))
+    for key in old_keys:
+        if key not in set(new_keys):
+            ops['unset'].append(_item_path(path, key))
+
+    run = []
+    anchor = None  # Key of the last common item seen
+    for key, item in zip(new_keys, new):
+        if key in old_by_key:
+            if run:
+                _flush_insert(path, run, anchor, key, ops)
+                run = []
+            _diff_value(_item_path(path, key), old_by_key[key], item, ops)
+            anchor = key
+        else:
+            run.append(item)
+    if run:
+        _flush_insert(path, run, anchor, None, ops)
+
+
+def _flush_insert(path, items, after_key, before_key, ops):
+    if after_key is not None:
+        ops['insert'].append({"after": _item_path(path, after_key), "items": items})
+    else:
+        ops['insert'].append({"before": _item_path(path, before_key), "items": items})
+
+
+def diff_documents(old, new):
+    """
+    Computes the patch operations turning `old` into `new`, addressing array items by _key.
+    Top-level fields missing from `new` (e.g. ones edited in the Studio) and system fields
+    (_id, _rev, _createdAt, ...) are left alone.
+    Returns {'set': {path: value}, 'unset': [paths], 'insert': [insert specs]}.
+    """
+    ops = {'set': {}, 'unset': [], 'insert': []}
+    new_fields = {k: v for k, v in new.items() if not k.startswith('_') or k == '_type'}
+    _diff_object("", old, new_fields, ops, unset_missing=False)
+    return ops
+
+
+def build_patch_mutations(doc_id, old, new):
+    """
+    Builds the mutation list for a minimal update of document `doc_id`.
+    The first patch is guarded by the fetched revision so a concurrent edit fails
+    the transaction instead of being overwritten. Returns [] when nothing changed.
+    """
+    ops = diff_documents(old, new)
+    mutations = []
+    head = {"id": doc_id}
+    if old.get('_rev'):
+        head["ifRevisionID"] = old['_rev']
+    if ops['set']:
+        head["set"] = ops['set']
+    if ops['unset']:
+        head["unset"] = ops['unset']
+    if ops['set'] or ops['unset']:
+        mutations.append({"patch": head})
+    for insert in ops['insert']:
+        patch = {"id": doc_id, "insert": insert}
+        if not mutations and "ifRevisionID" in head:
+            patch["ifRevisionID"] = head["ifRevisionID"]
+        mutations.append({"patch": patch})
+    return mutations
+
+
+def payload_size(mutations):
+    """Size in bytes of the mutations as sent over the wire."""
+    return len(json.dumps({"mutations": mutations}, ensure_ascii=False).encode('utf-8'))
@@ -2,43 +2,130 @@ import os
 import requests
 import json
 import uuid
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .outbox import is_duplicate_transaction, join_labels
+from .sanity_patch import build_patch_mutations, payload_size
+from . import metrics
 
 load_dotenv()
 
 PROJECT_ID = os.getenv("NEXT_PUBLIC_SANITY_PROJECT_ID")
 DATASET = "production" # Assuming 'production' dataset, customize if needed
 API_TOKEN = os.getenv("SANITY_API_TOKEN")
+API_VERSION = "v2021-06-07"
+# Optional override of the API origin, e.g. http://127.0.0.1:8765 for a local stand-in
+API_HOST = os.getenv("SANITY_API_HOST")
+
+# Local map of image SHA-1 -> uploaded asset, so identical covers are never re-sent.
+# Kept in .state/ so it isn't listed among the reviews in output/*.json.
+ASSET_MAP_PATH = os.path.join("output", ".state", "sanity_assets.json")
+
+# Responses worth retrying; Retry-After is honored for 429/503
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Fields the editor owns in Sanity; a regenerated review never overwrites them once set
+PRESERVED_FIELDS = ['yourReview', 'yourRating', 'affiliateLink', 'bookDescription', 'coverImage']
+
+
+# Default for upload_book_review(existing_doc=...): fetch the document at upload time
+NOT_FETCHED = object()
+
+# upload_book_review result when a minimal patch finds nothing to change (truthy: it's a success)
+NO_CHANGES = {"noop": True}
+
+
+def _observe_response(response, *args, **kwargs):
+    """requests response hook: Sanity latency per endpoint and status for pipeline.metrics."""
+    path = response.request.path_url if response.request is not None else ""
+    endpoint = next((name for name in ("mutate", "query", "assets") if f"/{name}/" in path), "other")
+    metrics.SANITY_LATENCY.observe(response.elapsed.total_seconds(), endpoint=endpoint, status=response.status_code)
+
+
+def is_transient_error(exc):
+    """True for failures worth replaying later: connection errors, timeouts, or a retryable status."""
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        return response.status_code in RETRY_STATUSES
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def new_transaction_id():
+    """Idempotency key chosen before the first attempt, so retries and replays can't apply a write twice."""
+    return uuid.uuid4().hex
+
 
 class SanityUploader:
-    def __init__(self):
-        if not PROJECT_ID or not API_TOKEN:
+    def __init__(self, project_id=None, api_token=None, dataset=None, api_host=None,
+                 timeout=30, max_retries=4, backoff_factor=0.5, pool_size=10, asset_map_path=ASSET_MAP_PATH,
+                 outbox=None, defer=False):
+        project_id = project_id or PROJECT_ID
+        api_token = api_token or API_TOKEN
+        dataset = dataset or DATASET
+        api_host = api_host or API_HOST
+        self.timeout = timeout
+        self.asset_map_path = asset_map_path
+        self._asset_lock = threading.Lock()
+        # Failed (transient) or deferred writes go to the outbox for scripts/replay_outbox.py
+        self.outbox = outbox
+        self.defer = defer and outbox is not None
+
+        if not project_id or not api_token:
             print("Warning: Sanity credentials not found. Skipping upload.")
             self.enabled = False
         else:
             self.enabled = True
-            self.url = f"https://{PROJECT_ID}.api.sanity.io/v2021-06-07/data/mutate/{DATASET}"
+            self.api_base = f"{api_host.rstrip('/')}/{API_VERSION}" if api_host else f"https://{project_id}.api.sanity.io/{API_VERSION}"
+            self.url = f"{self.api_base}/data/mutate/{dataset}"
+            self.query_url = f"{self.api_base}/data/query/{dataset}"
+            self.assets_url = f"{self.api_base}/assets/images/{dataset}"
             self.headers = {
-                "Authorization": f"Bearer {API_TOKEN}",
+                "Authorization": f"Bearer {api_token}",
                 "Content-Type": "application/json"
             }
+            self.session = self._create_session(max_retries, backoff_factor, pool_size)
+
+    @staticmethod
+    def _create_session(max_retries, backoff_factor, pool_size):
+        """Shared keep-alive session with bounded exponential retry on 429/5xx and connection errors."""
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            # Also retry POSTs. Safe for mutations because every one carries a transactionId
+            # (see _post_mutations); a re-sent image upload maps to the same asset.
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand the final response back so raise_for_status reports it
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks['response'].append(_observe_response)
+        return session
+
+    def fetch_document(self, doc_id):
+        """Fetches a document by ID; raises on failure so callers can tell 'missing' from 'unreachable'."""
+        query = f'*[_id == "{doc_id}"][0]'
+        params = {"query": query}
+        response = self.session.get(self.query_url, headers=self.headers, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get('result')
 
     def get_document(self, doc_id):
         """Fetches a document from Sanity by ID."""
         if not self.enabled:
             return None
         
-        # Query URL for a single document by ID
-        query = f'*[_id == "{doc_id}"][0]'
-        url = f"https://{PROJECT_ID}.api.sanity.io/v2021-06-07/data/query/{DATASET}"
-        params = {"query": query}
-        
         try:
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('result')
+            return self.fetch_document(doc_id)
         except Exception as e:
             print(f"Error fetching document from Sanity: {e}")
             return None
@@ -50,11 +137,10 @@ class SanityUploader:
         
         # Query for a book review with the matching slug
         query = f'*[_type == "bookReview" && slug.current == "{slug}"][0]'
-        url = f"https://{PROJECT_ID}.api.sanity.io/v2021-06-07/data/query/{DATASET}"
         params = {"query": query}
         
         try:
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self.session.get(self.query_url, headers=self.headers, params=params, timeout=self.timeout)
             response.raise_for_status()
             data = response.json()
             return data.get('result')
@@ -62,25 +148,60 @@ class SanityUploader:
             print(f"Error fetching document by slug from Sanity: {e}")
             return None
 
-    def upload_book_review(self, book_data):
+    def batch(self, **kwargs):
+        """Starts a MutationBatch that accumulates mutations across books until flush()."""
+        return MutationBatch(self, **kwargs)
+
+    def upload_book_review(self, book_data, minimal_patch=False, batch=None, existing_doc=NOT_FETCHED):
+        """
+        Uploads a book review document.
+        With minimal_patch=True an existing document is diffed by _key path and only the
+        changed fields/items are sent as patch operations instead of createOrReplace.
+        With a batch, the mutations are queued on it (and returned) instead of sent.
+        existing_doc may be passed when it was fetched earlier (None = not in Sanity).
+        Returns None on failure; a minimal patch with nothing to send returns NO_CHANGES.
+        When the existing document can't be read (offline, or deferred), the merge is
+        left to Sanity: createIfNotExists plus a patch that only fills preserved fields
+        if they are missing, so queued writes never clobber editor changes.
+        """
         if not self.enabled:
             return None
         
         doc_id = book_data.get('_id')
-        if doc_id:
-            existing_doc = self.get_document(doc_id)
-            if existing_doc:
-                print(f"  - Document '{doc_id}' exists in Sanity. Merging fields...")
-                # Fields to preserve from Sanity if they exist and are non-empty
-                # We prioritize the existing Sanity content for these specific fields
-                fields_to_preserve = ['yourReview', 'yourRating', 'affiliateLink', 'bookDescription', 'coverImage']
-                for field in fields_to_preserve:
-                    if field in existing_doc and existing_doc[field]:
-                        # Special case for Portable Text (yourReview is usually a list)
-                        if isinstance(existing_doc[field], list) and not existing_doc[field]:
-                            continue
-                        book_data[field] = existing_doc[field]
-                        print(f"    - Preserved existing '{field}'")
+        prefetched = existing_doc is not NOT_FETCHED
+        if not prefetched:
+            existing_doc = None
+        if doc_id and self.defer:
+            return self._submit(self._merge_mutations(doc_id, book_data), batch, label=doc_id)
+        if doc_id and not prefetched:
+            try:
+                existing_doc = self.fetch_document(doc_id)
+            except Exception as e:
+                print(f"Error fetching document from Sanity: {e}")
+                if self.outbox is None:
+                    return None
+                print("  - Sanity unreachable. Queuing a server-side merge instead.")
+                return self._submit(self._merge_mutations(doc_id, book_data), batch, label=doc_id)
+        if existing_doc:
+            print(f"  - Document '{doc_id}' exists in Sanity. Merging fields...")
+            # Fields to preserve from Sanity if they exist and are non-empty
+            # We prioritize the existing Sanity content for these specific fields
+            for field in PRESERVED_FIELDS:
+                if field in existing_doc and existing_doc[field]:
+                    # Special case for Portable Text (yourReview is usually a list)
+                    if isinstance(existing_doc[field], list) and not existing_doc[field]:
+                        continue
+                    book_data[field] = existing_doc[field]
+                    print(f"    - Preserved existing '{field}'")
+
+        if minimal_patch and existing_doc:
+            mutations = build_patch_mutations(doc_id, existing_doc, book_data)
+            if not mutations:
+                print("  - No changes since the last upload. Nothing to send.")
+                return dict(NO_CHANGES)
+            print(f"  - Sending {len(mutations)} patch mutation(s) ({payload_size(mutations)} bytes) "
+                  f"instead of the full document ({payload_size([{'createOrReplace': book_data}])} bytes).")
+            return self._submit(mutations, batch, label=doc_id)
         
         # Use createOrReplace to update or create
         mutations = [
@@ -88,10 +209,23 @@ class SanityUploader:
                 "createOrReplace": book_data
             }
         ]
+        if prefetched and existing_doc and existing_doc.get('_rev'):
+            # The merge used an earlier snapshot; abort the transaction if it was edited since
+            mutations.insert(0, {"patch": {"id": doc_id, "ifRevisionID": existing_doc['_rev'], "set": {}}})
         
-        return self._send_mutation(mutations)
+        return self._submit(mutations, batch, label=doc_id)
 
-    def patch_document(self, doc_id, set_fields):
+    @staticmethod
+    def _merge_mutations(doc_id, book_data):
+        """Mutations equivalent to the fetch-and-merge in upload_book_review, evaluated by Sanity."""
+        generated = {k: v for k, v in book_data.items() if k not in PRESERVED_FIELDS and not k.startswith('_')}
+        preserved = {k: book_data[k] for k in PRESERVED_FIELDS if book_data.get(k)}
+        patch = {"id": doc_id, "set": generated}
+        if preserved:
+            patch["setIfMissing"] = preserved
+        return [{"createIfNotExists": book_data}, {"patch": patch}]
+
+    def patch_document(self, doc_id, set_fields, batch=None):
         """Updates specific fields of an existing document."""
         if not self.enabled:
             return None
@@ -104,35 +238,103 @@ class SanityUploader:
                 }
             }
         ]
-        return self._send_mutation(mutations)
+        return self._submit(mutations, batch, label=doc_id)
+
+    def find_image_asset(self, sha1):
+        """Looks up an existing image asset by the SHA-1 of its bytes."""
+        if not self.enabled:
+            return None
+
+        query = '*[_type == "sanity.imageAsset" && sha1hash == $hash][0]{_id, url, sha1hash}'
+        params = {"query": query, "$hash": json.dumps(sha1)}
+
+        try:
+            response = self.session.get(self.query_url, headers=self.headers, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json().get('result')
+        except Exception as e:
+            print(f"Error looking up image asset in Sanity: {e}")
+            return None
+
+    def _load_asset_map(self):
+        if not self.asset_map_path or not os.path.exists(self.asset_map_path):
+            return {}
+        try:
+            with open(self.asset_map_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not read asset map {self.asset_map_path}: {e}")
+            return {}
+
+    def _cached_asset(self, sha1):
+        with self._asset_lock:
+            return self._load_asset_map().get(self.assets_url, {}).get(sha1)
+
+    def _remember_asset(self, sha1, asset_doc):
+        if not self.asset_map_path:
+            return
+        with self._asset_lock:
+            asset_map = self._load_asset_map()
+            asset_map.setdefault(self.assets_url, {})[sha1] = {
+                "_id": asset_doc.get('_id'),
+                "url": asset_doc.get('url'),
+                "sha1hash": sha1,
+            }
+            # Write a temp file and swap it in, so a crash or a second process reading the
+            # map never sees it half-written
+            directory = os.path.dirname(self.asset_map_path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix=".sanity_assets_", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(asset_map, f, indent=2)
+                os.replace(tmp_path, self.asset_map_path)
+            except Exception as e:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                print(f"Warning: Could not update asset map {self.asset_map_path}: {e}")
 
     def upload_image_asset(self, image_bytes, filename="cover.jpg", mimetype="image/jpeg"):
-        """Uploads an image asset to Sanity and returns the asset document."""
+        """
+        Uploads an image asset to Sanity and returns the asset document.
+        Identical bytes are only uploaded once: the SHA-1 is checked against the local
+        asset map first, then against existing sanity.imageAsset documents.
+        """
         if not self.enabled:
             return None
+
+        sha1 = hashlib.sha1(image_bytes).hexdigest()
+        asset_doc = self._cached_asset(sha1)
+        if asset_doc:
+            print(f"Reusing image asset {asset_doc['_id']} (already uploaded, sha1 {sha1[:10]}).")
+            return asset_doc
+        asset_doc = self.find_image_asset(sha1)
+        if asset_doc:
+            print(f"Reusing existing Sanity image asset {asset_doc['_id']} (sha1 {sha1[:10]}).")
+            self._remember_asset(sha1, asset_doc)
+            return asset_doc
             
         print(f"Uploading image asset '{filename}' to Sanity...")
         
         # Sanity Asset Upload endpoint
-        upload_url = f"https://{PROJECT_ID}.api.sanity.io/v2021-06-07/assets/images/{DATASET}"
-        headers = {
-            "Authorization": f"Bearer {API_TOKEN}",
-            "Content-Type": mimetype
-        }
+        headers = dict(self.headers, **{"Content-Type": mimetype})
         
         try:
-            response = requests.post(upload_url, headers=headers, data=image_bytes)
+            response = self.session.post(self.assets_url, headers=headers, data=image_bytes, timeout=self.timeout)
             response.raise_for_status()
-            asset_doc = response.json()
+            asset_doc = response.json().get('document')
             print("Image Upload Success!")
-            return asset_doc.get('document')
+            if asset_doc:
+                self._remember_asset(sha1, asset_doc)
+            return asset_doc
         except Exception as e:
             print(f"Error uploading image to Sanity: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Details: {e.response.text}")
             return None
 
-    def create_update_log(self, book_title, book_slug, log_title=None, log_message=None, log_type="NEW_BOOK_SUMMARY"):
+    def create_update_log(self, book_title, book_slug, log_title=None, log_message=None, log_type="NEW_BOOK_SUMMARY", batch=None):
         """Creates an update log entry in Sanity."""
         if not self.enabled:
             return None
@@ -160,17 +362,165 @@ class SanityUploader:
             }
         ]
         
-        return self._send_mutation(mutations)
+        # Same label as the book's review so both land in one transaction when batched
+        return self._submit(mutations, batch, label=f"book-review-{book_slug}")
+
+    def _submit(self, mutations, batch, label=None):
+        if batch is not None:
+            batch.add(mutations, label=label)
+            return mutations
+        return self._send_mutation(mutations, label=label)
 
-    def _send_mutation(self, mutations):
-        payload = {"mutations": mutations}
+    def _post_mutations(self, mutations, transaction_id=None):
+        """
+        Sends one transaction and returns the response JSON; raises on failure.
+        It always carries a transactionId: when the session retries a POST whose first try
+        committed (read timeout, 5xx from a proxy), Sanity refuses the repeat with a 409
+        "already used" instead of applying it twice, and that counts as success here.
+        """
+        transaction_id = transaction_id or new_transaction_id()
+        payload = {"mutations": mutations, "transactionId": transaction_id}
+        response = self.session.post(self.url, headers=self.headers, json=payload, timeout=self.timeout)
         try:
-            response = requests.post(self.url, headers=self.headers, json=payload)
             response.raise_for_status()
+        except requests.HTTPError as e:
+            if not is_duplicate_transaction(e, transaction_id):
+                raise
+            print(f"  - Transaction {transaction_id} was already committed by an earlier attempt.")
+            return {"transactionId": transaction_id, "results": []}
+        return response.json()
+
+    def _send_mutation(self, mutations, label=None):
+        if self.defer:
+            key = self.outbox.enqueue(mutations, label=label)
+            print(f"Queued Sanity write in the outbox ({key}).")
+            return {"queued": key}
+        # The outbox replays under the same ID, so a write that did commit before the
+        # failure was reported is recognized instead of applied twice
+        transaction_id = new_transaction_id()
+        try:
+            result = self._post_mutations(mutations, transaction_id=transaction_id)
             print("Sanity Upload Success!")
-            return response.json()
+            return result
         except Exception as e:
             print(f"Error uploading to Sanity: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Details: {e.response.text}")
+            if self.outbox is not None and is_transient_error(e):
+                key = self.outbox.enqueue(mutations, label=label, key=transaction_id)
+                print(f"Queued the write in the outbox for replay ({key}).")
             return None
+
+
+class MutationBatch:
+    """
+    Accumulates mutations (documents, patches, update logs) across many books and
+    flushes them as size-capped transactions, sent concurrently up to a limit.
+    Mutations added with the same label (e.g. a review and its update log) always
+    stay in the same transaction. A transaction rejected as a whole (e.g. one book's
+    stale ifRevisionID) is resent one label at a time, so the other books still go through.
+    """
+
+    def __init__(self, uploader, max_mutations=200, max_bytes=2_000_000, concurrency=4):
+        self.uploader = uploader
+        self.max_mutations = max_mutations
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self._groups = []
+        self._by_label = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(g['mutations']) for g in self._groups)
+
+    def add(self, mutations, label=None):
+        with self._lock:
+            size = payload_size(mutations)
+            group = self._by_label.get(label) if label is not None else None
+            if group is not None:
+                # Also when other labels were added in between (A, B, A)
+                group['mutations'].extend(mutations)
+                group['bytes'] += size
+            else:
+                group = {"label": label, "mutations": list(mutations), "bytes": size}
+                self._groups.append(group)
+                if label is not None:
+                    self._by_label[label] = group
+
+    def _transactions(self, groups):
+        """Greedily packs groups into transactions under the mutation-count and byte caps."""
+        transactions = []
+        current = None
+        for group in groups:
+            fits = (current is not None
+                    and len(current['mutations']) + len(group['mutations']) <= self.max_mutations
+                    and current['bytes'] + group['bytes'] <= self.max_bytes)
+            if not fits:
+                current = {"labels": [], "groups": [], "mutations": [], "bytes": 0}
+                transactions.append(current)
+            current['labels'].append(group['label'])
+            current['groups'].append(group)
+            current['mutations'].extend(group['mutations'])
+            current['bytes'] += group['bytes']
+        return transactions
+
+    def _send_each(self, transaction):
+        """Sends every group of a transaction as a transaction of its own."""
+        return [result for group in transaction['groups'] for result in self._send(self._transactions([group])[0])]
+
+    def _send(self, transaction):
+        """Sends one transaction. Returns a list of results (one per label when it was split)."""
+        labels = transaction['labels']
+        outbox = self.uploader.outbox
+        if self.uploader.defer and len(labels) > 1:
+            # Nothing went out yet: each label gets its own outbox entry and replay order
+            return self._send_each(transaction)
+        result = {"labels": labels, "mutations": len(transaction['mutations']),
+                  "bytes": transaction['bytes'], "ok": False}
+        if self.uploader.defer:
+            result["queued"] = outbox.enqueue(transaction['mutations'], label=labels[0])
+            return [result]
+        transaction_id = new_transaction_id()
+        try:
+            response = self.uploader._post_mutations(transaction['mutations'], transaction_id=transaction_id)
+            result["ok"] = True
+            result["transactionId"] = response.get('transactionId')
+        except Exception as e:
+            result["error"] = str(e)
+            if hasattr(e, 'response') and e.response is not None:
+                result["error"] += f" ({e.response.text[:200]})"
+                result["status"] = e.response.status_code  # 409: e.g. a stale ifRevisionID guard
+            if is_transient_error(e):
+                if outbox is not None:
+                    # It may have committed, so it is queued whole under its transactionId;
+                    # the joined label keeps it in order with each label's later writes
+                    result["queued"] = outbox.enqueue(transaction['mutations'], label=join_labels(labels), key=transaction_id)
+            elif len(labels) > 1:
+                # Rejected as a whole, so nothing was applied: one label's failure must not
+                # take the others down with it
+                print(f"  - Transaction for {len(labels)} documents rejected ({result.get('status', 'error')}). Resending each on its own...")
+                return self._send_each(transaction)
+        return [result]
+
+    def flush(self):
+        """Sends everything queued so far. Returns one result dict per transaction sent."""
+        with self._lock:
+            groups, self._groups = self._groups, []
+            self._by_label = {}
+        if not groups or not self.uploader.enabled:
+            return []
+
+        transactions = self._transactions(groups)
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            results = [r for results in pool.map(self._send, transactions) for r in results]
+
+        ok = [r for r in results if r['ok']]
+        queued = [r for r in results if r.get('queued')]
+        print(f"Sanity batch: {len(ok)}/{len(results)} transactions succeeded "
+              f"({sum(r['mutations'] for r in ok)}/{sum(r['mutations'] for r in results)} mutations).")
+        if queued:
+            print(f"  - {len(queued)} transaction(s) queued in the outbox. Run scripts/replay_outbox.py to send them.")
+        for r in results:
+            if not r['ok'] and not r.get('queued'):
+                print(f"  ! Failed transaction for {', '.join(str(l) for l in r['labels'])}: {r['error']}")
+        return results
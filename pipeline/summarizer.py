@@ -1,18 +1,35 @@
-import openai
-import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import time
 from .chunker import Chunker
+from .dedup import dedupe_highlights
+from .instrument import stage
+from . import metrics
 
-# Retry configuration for LLM calls
-llm_retry = retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type((openai.APIConnectionError, openai.APITimeoutError)),
-    reraise=True
-)
+def llm_retry(fn):
+    """Retry configuration for LLM calls."""
+    # openai and tenacity take most of a second to import, so they are only loaded
+    # once a Summarizer actually talks to a model (not for --help or --plan).
+    import openai
+    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+    return retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type((openai.APIConnectionError, openai.APITimeoutError)),
+        reraise=True
+    )(fn)
+
+def _usage_count(usage, field):
+    """Token count from response.usage; None when the server didn't report one."""
+    value = getattr(usage, field, None)
+    return value if isinstance(value, int) else None
 
 class Summarizer:
-    def __init__(self, model_url="http://localhost:11434/v1", model_name="llama3", api_key="nopass"):
+    # Bump whenever the prompts below change in a way that should invalidate
+    # previously generated summaries (it is part of every chapter fingerprint).
+    PROMPT_VERSION = "1"
+
+    def __init__(self, model_url="http://localhost:11434/v1", model_name="llama3", api_key="nopass", ledger=None):
+        import httpx
+        import openai
         # Use explicit httpx client to avoid "proxies" argument issues in some environments
         self.client = openai.OpenAI(
             base_url=model_url,
@@ -20,7 +37,11 @@ class Summarizer:
             http_client=httpx.Client(timeout=120.0)
         )
         self.model_name = model_name
+        self.model_url = model_url
         self.chunker = Chunker()
+        # Optional pipeline.ledger.Ledger; every chat call is recorded there
+        self.ledger = ledger
+        self.context = {"book": None, "chapter": None}
         
         self.system_prompt = (
             "You are a master of literary analysis and narrative reconstruction. "
@@ -39,6 +60,73 @@ class Summarizer:
             "Be generous but discerning; extract anything that would make a reader stop and think."
         )
 
+    def set_context(self, book=None, chapter=None):
+        """Labels the ledger rows of the calls that follow with the book and chapter being processed."""
+        self.context = {"book": book, "chapter": chapter}
+
+    def _chat(self, call_type, system_prompt, prompt, json_mode=False):
+        """One chat completion (retried on connection errors). Records it in the ledger and returns the message text."""
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        attempts = 0
+
+        @llm_retry
+        def fetch():
+            nonlocal attempts
+            attempts += 1
+            return self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                **extra
+            )
+
+        start = time.perf_counter()
+        response, error = None, None
+        metrics.LLM_IN_FLIGHT.inc()
+        try:
+            with stage("llm", call=call_type):
+                response = fetch()
+            return response.choices[0].message.content
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            usage = getattr(response, 'usage', None)
+            self._observe(call_type, latency, usage, error)
+            if self.ledger is not None:
+                try:
+                    self.ledger.record(
+                        call_type, model=self.model_name, endpoint=self.model_url,
+                        prompt_chars=len(system_prompt) + len(prompt),
+                        prompt_tokens=_usage_count(usage, 'prompt_tokens'),
+                        completion_tokens=_usage_count(usage, 'completion_tokens'),
+                        latency=round(latency, 4),
+                        retries=max(0, attempts - 1), cache_hit=False, error=error, **self.context
+                    )
+                except Exception as e:
+                    print(f"Warning: Could not record LLM call in the ledger: {e}")
+
+    @staticmethod
+    def _observe(call_type, latency, usage, error):
+        """Updates the live metrics (pipeline.metrics) for one finished call."""
+        metrics.LLM_IN_FLIGHT.dec()
+        metrics.LLM_CALLS.inc(call=call_type, outcome="error" if error else "ok")
+        if error:
+            return
+        metrics.LLM_LATENCY.observe(latency, call=call_type)
+        prompt_tokens = _usage_count(usage, 'prompt_tokens')
+        completion_tokens = _usage_count(usage, 'completion_tokens')
+        if prompt_tokens:
+            metrics.LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        if completion_tokens:
+            metrics.LLM_TOKENS.inc(completion_tokens, kind="completion")
+            if latency > 0:
+                metrics.LLM_TOKENS_PER_SECOND.set(round(completion_tokens / latency, 2))
+
     def summarize_chapter(self, text):
         """Summarizes text using the LLM. Handles chunking and merging."""
         chunks = self.chunker.chunk(text)
@@ -84,18 +172,7 @@ class Summarizer:
         )
         
         try:
-            @llm_retry
-            def fetch_description():
-                return self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": self.extraction_system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-            response = fetch_description()
-            content = response.choices[0].message.content
+            content = self._chat("description", self.extraction_system_prompt, prompt)
             return self._strip_introductory_phrases(content)
         except Exception as e:
             print(f"Error generating book description: {e}")
@@ -117,18 +194,7 @@ class Summarizer:
         )
         
         try:
-            @llm_retry
-            def fetch_summary():
-                return self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-            response = fetch_summary()
-            content = response.choices[0].message.content
+            content = self._chat("summary", self.system_prompt, prompt)
             return self._strip_introductory_phrases(content)
         except Exception as e:
             print(f"Error calling LLM: {e}")
@@ -150,8 +216,13 @@ class Summarizer:
             highlights = self._generate_highlights(chunk)
             all_highlights.extend(highlights)
             
-        # If we have too many, we might want to consolidate, but for now we'll just return them
-        # Let's deduplicate or prune if it's a massive list
+        # Collapse near-duplicates (mostly caused by the chunk overlap) locally first,
+        # so the consolidation call only happens when the list is genuinely large.
+        deduped = dedupe_highlights(all_highlights)
+        if len(deduped) < len(all_highlights):
+            print(f"  Pruned {len(all_highlights) - len(deduped)} near-duplicate highlights.")
+        all_highlights = deduped
+
         if len(all_highlights) > 10:
             return self._consolidate_highlights(all_highlights)
             
@@ -170,19 +241,7 @@ class Summarizer:
         )
         
         try:
-            @llm_retry
-            def fetch_highlights():
-                return self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": self.extraction_system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    response_format={"type": "json_object"}
-                )
-            response = fetch_highlights()
-            content = response.choices[0].message.content
+            content = self._chat("highlights", self.extraction_system_prompt, prompt, json_mode=True)
             return self._parse_json_response(content)
         except Exception as e:
             print(f"Error calling LLM for highlights: {e}")
@@ -296,19 +355,7 @@ class Summarizer:
         )
         
         try:
-            @llm_retry
-            def fetch_consolidated():
-                return self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": self.extraction_system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    response_format={"type": "json_object"}
-                )
-            response = fetch_consolidated()
-            content = response.choices[0].message.content
+            content = self._chat("consolidate", self.extraction_system_prompt, prompt, json_mode=True)
             return self._parse_json_response(content) or highlights[:15]
         except Exception as e:
             print(f"Error consolidating highlights: {e}")
@@ -329,18 +376,7 @@ class Summarizer:
         )
         
         try:
-            @llm_retry
-            def fetch_merged():
-                return self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-            response = fetch_merged()
-            content = response.choices[0].message.content
+            content = self._chat("merge", self.system_prompt, prompt)
             return self._strip_introductory_phrases(content)
         except Exception as e:
              return joined_summaries # Fallback to concatenated summaries
@@ -1,11 +1,35 @@
 
-import uuid
+import hashlib
+import os
+import re
+from collections import Counter
 
-def text_to_portable_text(text):
+# Bookkeeping files (fingerprints, run reports, asset map) live in <output dir>/.state/,
+# so tools that pick up every output/*.json as a review never see them.
+STATE_DIR = ".state"
+
+
+def state_path(output_path, suffix):
+    """<output dir>/.state/<output base name><suffix> for a sidecar of an output JSON."""
+    directory, name = os.path.split(output_path)
+    base, _ = os.path.splitext(name)
+    return os.path.join(directory, STATE_DIR, f"{base}{suffix}")
+
+
+def stable_key(*parts):
+    """
+    Short Sanity _key derived from a hash of the given parts.
+    Unchanged content keeps identical keys across runs, which keeps diffs and patches small.
+    """
+    digest = hashlib.sha1("\x00".join(str(p) for p in parts).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+def text_to_portable_text(text, key_seed=""):
     """
     Standard conversion of plain text (with \n\n for paragraphs) 
     to Sanity Portable Text blocks.
     Ensures consistent styles, keys, and structure.
+    Keys are derived from (key_seed, paragraph index, paragraph text).
     """
     blocks = []
     if not text:
@@ -19,15 +43,16 @@ def text_to_portable_text(text):
         p = p.strip()
         if not p:
             continue
+        block_key = stable_key(key_seed, len(blocks), p)
         blocks.append({
             "_type": "block",
-            "_key": str(uuid.uuid4()),
+            "_key": block_key,
             "style": "normal",
             "markDefs": [],
             "children": [
                 {
                     "_type": "span",
-                    "_key": str(uuid.uuid4()),
+                    "_key": stable_key(block_key, "span"),
                     "text": p,
                     "marks": []
                 }
@@ -81,3 +106,39 @@ def has_meaningful_content(content, min_chars=150):
         return False
     
     return True
+
+def chapter_fingerprint(text, model_name="", prompt_version=""):
+    """
+    Content fingerprint of a chapter: hash of its normalized cleaned text plus the
+    model and prompt version, so a re-run only re-summarizes what actually changed.
+    """
+    normalized = re.sub(r'\s+', ' ', text or '').strip()
+    digest = hashlib.sha256()
+    for part in (str(prompt_version), str(model_name), normalized):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()[:16]
+
+def match_by_fingerprint(chapters, previous):
+    """
+    Maps work from a previous run onto the current chapters.
+    `previous` is {(index, fingerprint): value}; returns {current index: value}.
+    A chapter takes the value recorded at its own position with the same fingerprint;
+    failing that (chapters added or removed before it), the value of that fingerprint
+    elsewhere, but only when the fingerprint is unique in both runs. Empty sections,
+    part headings and repeated boilerplate share a fingerprint, so they are only ever
+    matched by position and never borrow another chapter's summary.
+    """
+    current_counts = Counter(ch.get('fingerprint') for ch in chapters)
+    previous_counts = Counter(fp for _, fp in previous)
+    by_fingerprint = {fp: value for (_, fp), value in previous.items()}
+    matched = {}
+    for i, ch in enumerate(chapters):
+        fp = ch.get('fingerprint')
+        if not fp:
+            continue
+        if (i, fp) in previous:
+            matched[i] = previous[(i, fp)]
+        elif current_counts[fp] == 1 and previous_counts[fp] == 1:
+            matched[i] = by_fingerprint[fp]
+    return matched
@@ -0,0 +1,138 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+# inotify(7) flags: anything that can mean "an EPUB appeared or changed"
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class _Inotify:
+    """Minimal inotify wrapper over libc; used only as a wake-up signal, events aren't parsed."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Blocks until something changes in the directory or `timeout` seconds pass."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+        return bool(readable)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Reports EPUBs in `directory` that are new or have changed, once they have stopped
+    changing: a file is only reported after its size and mtime have been the same for
+    `settle` seconds, so a book that is still being copied or downloaded isn't picked
+    up half-written. Uses inotify on Linux to wake up on changes and falls back to
+    polling every `poll` seconds elsewhere (or with use_inotify=False).
+    """
+
+    def __init__(self, directory, settle=5.0, poll=2.0, use_inotify=True, clock=time.monotonic):
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Not a directory: {directory}")
+        self.directory = directory
+        self.settle = settle
+        self.poll = poll
+        self.clock = clock
+        self.pending = {}  # path -> (signature, unchanged since)
+        self.reported = {}  # path -> signature it was reported with
+        self.inotify = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self.inotify = _Inotify(directory)
+            except (OSError, AttributeError) as e:
+                print(f"  ! inotify unavailable ({e}); polling {directory} every {poll:g}s")
+
+    @property
+    def mode(self):
+        return "inotify" if self.inotify else "polling"
+
+    def _signatures(self):
+        found = {}
+        for name in os.listdir(self.directory):
+            if not name.lower().endswith(".epub") or name.startswith("."):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # Moved away between listdir and stat
+            if os.path.isfile(path):
+                found[path] = (st.st_size, st.st_mtime_ns)
+        return found
+
+    def scan(self):
+        """One pass over the folder; returns the paths that just became ready, sorted."""
+        now = self.clock()
+        current = self._signatures()
+        for path in set(self.pending) | set(self.reported):
+            if path not in current:
+                self.pending.pop(path, None)
+                self.reported.pop(path, None)
+
+        ready = []
+        for path, signature in current.items():
+            if self.reported.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)  # New or still being written: restart the clock
+            elif now - previous[1] >= self.settle:
+                del self.pending[path]
+                self.reported[path] = signature
+                ready.append(path)
+        return sorted(ready)
+
+    def wait(self):
+        """Sleeps until the next scan is due: a change (inotify), a pending file settling, or the poll interval."""
+        if self.pending:
+            oldest = min(since for _, since in self.pending.values())
+            timeout = max(0.05, min(self.poll, oldest + self.settle - self.clock()))
+        else:
+            timeout = self.poll
+        if self.inotify:
+            self.inotify.wait(timeout)  # Returns early as soon as the folder changes
+        else:
+            time.sleep(timeout)
+
+    def run(self, on_ready, stop=None):
+        """Calls on_ready(path) for every settled EPUB until `stop` (a threading.Event) is set."""
+        try:
+            while stop is None or not stop.is_set():
+                for path in self.scan():
+                    on_ready(path)
+                self.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import sys
+
+# Ensure we can import from pipeline
+sys.path.append(os.getcwd())
+
+from pipeline.batch import load_books, run_batch, format_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Process every EPUB in a folder or manifest without prompts. "
+                    "Unrecognized options (e.g. --model-name, --restart, --defer-upload) are passed to main.py.")
+    parser.add_argument("source", nargs="?", default="book", help="Folder of EPUBs, or a CSV/JSON manifest with path, rating, affiliate_link (default: book)")
+    parser.add_argument("--workers", type=int, default=1, help="Books processed at the same time (default: 1)")
+    parser.add_argument("--output-dir", default="output", help="Directory for the output JSON files (default: output)")
+    parser.add_argument("--log-dir", default=None, help="Per-book logs (default: <output-dir>/logs)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the per-book results to this JSON file")
+    args, main_args = parser.parse_known_args()
+
+    try:
+        books = load_books(args.source)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    missing = [b["path"] for b in books if not os.path.exists(b["path"])]
+    for path in missing:
+        print(f"Warning: File not found, skipping: {path}")
+    books = [b for b in books if b["path"] not in missing]
+    if not books:
+        print(f"No EPUB files to process in {args.source}.")
+        sys.exit(1)
+
+    log_dir = args.log_dir or os.path.join(args.output_dir, "logs")
+    print(f"Processing {len(books)} books with {args.workers} worker(s); logs in {log_dir}")
+
+    def report(result):
+        print(f"  - [{result['status']}] {os.path.basename(result['input'])} ({result['seconds']:.1f}s)")
+
+    results = run_batch(books, output_dir=args.output_dir, log_dir=log_dir, workers=args.workers,
+                        main_args=main_args, on_result=report)
+    print()
+    print(format_summary(results))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if any(r["status"] == "failed" for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
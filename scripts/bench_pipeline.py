@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add parent directory to sys.path to allow importing the pipeline package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from scripts.llm_stub import LLMStub
+from scripts.sanity_stub import SanityStub
+
+
+def run_main(epub_path, output_dir, model_url, extra_args, env, restart=True, log_path=None):
+    """Runs main.py once without prompts; returns (seconds, returncode)."""
+    cmd = [sys.executable, os.path.join(ROOT, "main.py"), epub_path,
+           "--output-dir", output_dir, "--model-url", model_url, "--model-name", "stub",
+           "--rating", "4", "--affiliate-link", "https://example.com/bench"] + extra_args
+    if restart:
+        cmd.append("--restart")
+    start = time.perf_counter()
+    with open(log_path or os.devnull, 'w', encoding='utf-8') as log:
+        # "y" answers the resume prompt on warm runs
+        proc = subprocess.run(cmd, cwd=ROOT, env=env, input="y\n", text=True, stdout=log, stderr=subprocess.STDOUT)
+    return time.perf_counter() - start, proc.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of main.py against the local LLM (and optionally Sanity) stand-ins")
+    parser.add_argument("epub", help="EPUB to process (see scripts/synthetic_epub.py for generated ones)")
+    parser.add_argument("--runs", type=int, default=1, help="Cold runs (from scratch) to time (default: 1)")
+    parser.add_argument("--warm", action="store_true", help="Also time a resumed run after each cold run (measures checkpoint reuse)")
+    parser.add_argument("--prefill-tps", type=float, default=1500.0, help="Stub prompt throughput in tokens/s (default: 1500)")
+    parser.add_argument("--decode-tps", type=float, default=40.0, help="Stub generation throughput in tokens/s (default: 40)")
+    parser.add_argument("--capacity", type=int, default=1, help="Requests the stub serves concurrently (default: 1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LLM requests that fail (default: 0)")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Multiplier on simulated LLM latency (default: 0.05)")
+    parser.add_argument("--sanity", action="store_true", help="Upload to a local Sanity stand-in (otherwise uploads are disabled)")
+    parser.add_argument("--sanity-latency", type=float, default=0.02, help="Sanity stand-in latency per request (default: 0.02)")
+    parser.add_argument("--main-args", default="", help="Extra arguments passed to main.py, e.g. \"--limit 5\"")
+    parser.add_argument("--keep", action="store_true", help="Keep the output directory and logs")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.epub):
+        print(f"Error: File not found: {args.epub}")
+        sys.exit(1)
+
+    llm = LLMStub(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, capacity=args.capacity,
+                  error_rate=args.error_rate, time_scale=args.time_scale, seed=0).start()
+    sanity = SanityStub(latency=args.sanity_latency, seed=0).start() if args.sanity else None
+
+    env = dict(os.environ)
+    if sanity:
+        env.update(NEXT_PUBLIC_SANITY_PROJECT_ID="bench", SANITY_API_TOKEN="bench", SANITY_API_HOST=sanity.url)
+    else:
+        # Empty values win over .env (load_dotenv doesn't override), which disables the upload
+        env.update(NEXT_PUBLIC_SANITY_PROJECT_ID="", SANITY_API_TOKEN="")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    epub_path = os.path.join(work_dir, os.path.basename(args.epub))
+    shutil.copy(args.epub, epub_path)  # Own folder, so no stray covers in book/ are picked up
+    output_dir = os.path.join(work_dir, "output")
+    extra_args = args.main_args.split()
+
+    results = []
+    try:
+        for run in range(args.runs):
+            phases = [("cold", True)] + ([("warm", False)] if args.warm else [])
+            for phase, restart in phases:
+                before = llm.snapshot()
+                log_path = os.path.join(work_dir, f"run{run + 1}_{phase}.log")
+                seconds, code = run_main(epub_path, output_dir, llm.url, extra_args, env, restart, log_path)
+                after = llm.snapshot()
+                calls = {k: v - before["calls"].get(k, 0) for k, v in after["calls"].items() if v - before["calls"].get(k, 0)}
+                result = {
+                    "run": run + 1,
+                    "phase": phase,
+                    "returncode": code,
+                    "seconds": round(seconds, 3),
+                    "llm_requests": after["requests"] - before["requests"],
+                    "llm_errors": after["errors"] - before["errors"],
+                    "llm_calls": calls,
+                    "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+                    "completion_tokens": after["completion_tokens"] - before["completion_tokens"],
+                    "llm_busy_seconds": round(after["busy_seconds"] - before["busy_seconds"], 3),
+                    "llm_queue_seconds": round(after["queue_seconds"] - before["queue_seconds"], 3),
+                    "max_in_flight": after["max_in_flight"],
+                }
+                if sanity:
+                    result["sanity_requests"] = sanity.stats["requests"]
+                results.append(result)
+                status = "ok" if code == 0 else f"exit {code}, see {log_path}"
+                print(f"Run {run + 1} ({phase}): {seconds:.2f}s, {result['llm_requests']} LLM calls "
+                      f"({result['prompt_tokens']:,} prompt / {result['completion_tokens']:,} completion tokens) [{status}]")
+    finally:
+        llm.stop()
+        if sanity:
+            sanity.stop()
+        if args.keep:
+            print(f"Output and logs kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    cold = [r["seconds"] for r in results if r["phase"] == "cold"]
+    if cold:
+        # Utilization: how much of the wall time the (simulated) model was busy
+        busy = sum(r["llm_busy_seconds"] for r in results if r["phase"] == "cold")
+        print(f"Cold runs: best {min(cold):.2f}s, mean {sum(cold) / len(cold):.2f}s; "
+              f"model busy {busy / sum(cold):.0%} of wall time.")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Add parent directory to sys.path to allow importing the pipeline package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline.output import JSONFormatter
+from pipeline.sanity_uploader import SanityUploader
+from scripts.sanity_stub import SanityStub
+
+MODES = ["replace", "batch", "patch"]
+
+
+def make_review(index, chapters, rng, revision=0):
+    """A synthetic bookReview shaped like JSONFormatter.save output."""
+    title = f"Benchmark Book {index}"
+    slug = JSONFormatter.slugify(title)
+    chs = []
+    for c in range(chapters):
+        words = " ".join(rng.choice(["focus", "habit", "system", "attention", "practice", "memory"]) for _ in range(120))
+        edited = f" (revision {revision})" if revision and c == chapters // 2 else ""
+        chs.append({
+            "title": f"Chapter {c + 1}",
+            "level": 1,
+            "fingerprint": f"{index}-{c}",
+            "content": words,
+            "summary": f"Summary of chapter {c + 1}{edited}.\n\n{words}",
+            "highlights": [f"Highlight {c + 1}.{h} about {words[:40]}" for h in range(3)],
+        })
+    return {
+        "_id": f"book-review-{slug}",
+        "_type": "bookReview",
+        "title": title,
+        "slug": {"_type": "slug", "current": slug},
+        "author": "Bench",
+        "bookDescription": "Synthetic book used to benchmark uploads.",
+        "yourRating": 4.0,
+        "affiliateLink": "https://example.com",
+        "yourReview": [],
+        "highlightsAndNotes": [h for ch in chs for h in ch["highlights"]],
+        "bookStructure": JSONFormatter.build_structure(chs),
+    }
+
+
+def run_mode(mode, args):
+    rng = random.Random(args.seed)
+    stub = SanityStub(latency=args.latency, jitter=args.jitter, error_rate=0.0, seed=args.seed).start()
+    uploader = SanityUploader(project_id="bench", api_token="bench", api_host=stub.url, timeout=30,
+                              max_retries=args.max_retries, backoff_factor=args.backoff, asset_map_path=None)
+    reviews = [make_review(i, args.chapters, rng) for i in range(args.books)]
+    covers = [rng.randbytes(args.cover_kb * 1024) for _ in range(max(1, args.books // 2))]
+
+    if mode == "patch":
+        # Seed the documents, then measure re-uploading one edited chapter per book
+        for review in reviews:
+            uploader.upload_book_review(json.loads(json.dumps(review)))
+        rng = random.Random(args.seed)
+        reviews = [make_review(i, args.chapters, rng, revision=1) for i in range(args.books)]
+        for key in stub.stats:
+            stub.stats[key] = 0
+
+    stub.error_rate = args.error_rate
+    ok = 0
+    start = time.perf_counter()
+    batch = uploader.batch(concurrency=args.concurrency) if mode == "batch" else None
+    for i, review in enumerate(reviews):
+        asset = uploader.upload_image_asset(covers[i % len(covers)])
+        if asset:
+            review["coverImage"] = {"_type": "image", "asset": {"_type": "reference", "_ref": asset["_id"]}}
+        res = uploader.upload_book_review(review, minimal_patch=(mode == "patch"), batch=batch)
+        uploader.create_update_log(review["title"], review["slug"]["current"], batch=batch)
+        if batch is None and res is not None:
+            ok += 1
+    if batch is not None:
+        results = batch.flush()
+        failed = {l for r in results if not r["ok"] for l in r["labels"]}
+        ok = sum(1 for r in reviews if r["_id"] not in failed)
+    elapsed = time.perf_counter() - start
+    stub.stop()
+
+    stats = dict(stub.stats)
+    return {
+        "mode": mode,
+        "books": args.books,
+        "ok": ok,
+        "seconds": round(elapsed, 4),
+        "books_per_second": round(args.books / elapsed, 2) if elapsed else None,
+        "requests": stats["requests"],
+        "injected_errors": stats["errors"],
+        "transactions": stats["transactions"],
+        "mutations": stats["mutations"],
+        "uploads": stats["uploads"],
+        "bytes_sent": stats["bytes_in"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SanityUploader against the local Sanity stand-in")
+    parser.add_argument("--books", type=int, default=20, help="Books uploaded per mode (default: 20)")
+    parser.add_argument("--chapters", type=int, default=30, help="Chapters per book (default: 30)")
+    parser.add_argument("--cover-kb", type=int, default=64, help="Size of each synthetic cover in KB (default: 64)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds of server latency per request (default: 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 503 (default: 0)")
+    parser.add_argument("--max-retries", type=int, default=4, help="Uploader retry budget (default: 4)")
+    parser.add_argument("--backoff", type=float, default=0.05, help="Uploader backoff factor (default: 0.05)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Transactions in flight in batch mode (default: 4)")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for content, jitter and error injection")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+
+    results = []
+    for mode in modes:
+        print(f"Running '{mode}' with {args.books} books...")
+        results.append(run_mode(mode, args))
+
+    print(f"\n{'mode':<8} {'ok':>5} {'seconds':>9} {'books/s':>8} {'requests':>9} {'errors':>7} {'txns':>6} {'bytes':>12}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['ok']:>5} {r['seconds']:>9.3f} {r['books_per_second'] or 0:>8.2f} "
+              f"{r['requests']:>9} {r['injected_errors']:>7} {r['transactions']:>6} {r['bytes_sent']:>12,}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
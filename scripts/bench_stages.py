@@ -0,0 +1,161 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+# Add parent directory to sys.path to allow importing the pipeline package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from pipeline.ingest import EpiubLoader
+from pipeline.cleaner import CleanText
+from pipeline.segmenter import Segmenter
+from pipeline.chunker import Chunker
+from pipeline.output import JSONFormatter
+from pipeline import profiling
+from scripts.synthetic_epub import PRESETS, generate_epub
+
+STAGES = ["load", "get_chapters", "clean", "segment", "chunk", "build_structure"]
+
+
+def run_once(epub_path, profiler=None):
+    """Runs every stage once on a fresh loader; returns ({stage: seconds}, counts)."""
+    timings = {}
+
+    def timed(stage, fn):
+        with profiler.profile(stage) if profiler else contextlib.nullcontext():
+            start = time.perf_counter()
+            result = fn()
+            timings[stage] = time.perf_counter() - start
+        return result
+
+    loader = EpiubLoader(epub_path)
+    timed("load", loader.load)
+    raw = timed("get_chapters", loader.get_chapters)
+    cleaner = CleanText()
+
+    def clean():
+        for ch in raw:
+            ch['content'] = cleaner.clean(ch['content'])
+        return raw
+    cleaned = timed("clean", clean)
+    chapters = timed("segment", lambda: Segmenter().segment(cleaned))
+    chunker = Chunker()
+    chunks = timed("chunk", lambda: [chunker.chunk(ch.get('content', '')) for ch in chapters])
+
+    for ch in chapters:
+        # Stand-in summaries, so build_structure does its full Portable Text work
+        ch['summary'] = ch.get('content', '')[:1500]
+    timed("build_structure", lambda: JSONFormatter.build_structure(chapters))
+
+    counts = {"toc_entries": len(raw), "chapters": len(chapters), "chunks": sum(len(c) for c in chunks),
+              "text_chars": sum(len(ch.get('content', '')) for ch in chapters)}
+    return timings, counts
+
+
+def bench(epub_path, repeat, profiler=None):
+    samples = {stage: [] for stage in STAGES}
+    counts = None
+    for _ in range(repeat):
+        # The pipeline prints progress; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings, counts = run_once(epub_path, profiler)
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+    stages = {}
+    for stage, values in samples.items():
+        stages[stage] = {"min": round(min(values), 5), "median": round(statistics.median(values), 5),
+                         "mean": round(statistics.mean(values), 5)}
+    total = sum(s["median"] for s in stages.values())
+    return {"epub": os.path.basename(epub_path), "bytes": os.path.getsize(epub_path), "repeat": repeat,
+            "counts": counts, "stages": stages, "total_median": round(total, 5)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_results(results, baseline=None):
+    base = {r["epub"]: r for r in (baseline or {}).get("results", [])}
+    for r in results:
+        c = r["counts"]
+        print(f"\n{r['epub']} ({r['bytes']:,} bytes, {c['toc_entries']} TOC entries, {c['chapters']} chapters, {c['chunks']} chunks)")
+        print(f"  {'stage':<16} {'median s':>10} {'min s':>10}" + (f" {'vs base':>9}" if base else ""))
+        for stage in STAGES + ["total"]:
+            s = r["stages"][stage] if stage != "total" else {"median": r["total_median"], "min": None}
+            min_text = f"{s['min']:.4f}" if s['min'] is not None else ""
+            line = f"  {stage:<16} {s['median']:>10.4f} {min_text:>10}"
+            old = base.get(r["epub"])
+            if old:
+                old_median = old["total_median"] if stage == "total" else old["stages"].get(stage, {}).get("median")
+                if old_median:
+                    line += f" {s['median'] / old_median:>8.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the ingest/clean/segment/chunk/structure stages on EPUBs")
+    parser.add_argument("epubs", nargs="*", help="EPUBs to benchmark (default: generate the --presets corpus)")
+    parser.add_argument("--presets", default="small,medium", help=f"Synthetic shapes to generate: {', '.join(sorted(PRESETS))} (default: small,medium)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus (default: 0)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per EPUB; median and min are reported (default: 5)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Earlier --json output to compare against")
+    parser.add_argument("--profile-dir", default="output", help="Where --profile writes its files (default: output)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")  # bs4 parser warnings on XHTML
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="bench_stages_") as tmp:
+        epubs = list(args.epubs)
+        if not epubs:
+            for name in [p.strip() for p in args.presets.split(",") if p.strip()]:
+                if name not in PRESETS:
+                    parser.error(f"Unknown preset: {name}")
+                path = os.path.join(tmp, f"synthetic_{name}.epub")
+                generate_epub(path, seed=args.seed, title=f"Synthetic {name.title()}", **PRESETS[name])
+                epubs.append(path)
+
+        results = []
+        for path in epubs:
+            print(f"Benchmarking {os.path.basename(path)} ({args.repeat} runs)...")
+            # Profiled timings are inflated; compare them only with other profiled runs
+            profiler = profiling.from_args(args, args.profile_dir, os.path.splitext(os.path.basename(path))[0])
+            results.append(bench(path, args.repeat, profiler))
+            if profiler:
+                profiler.close()
+
+    print_results(results, baseline)
+
+    if args.json_path:
+        report = {
+            "revision": git_revision(),
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 
+import contextlib
 import os
 import sys
 
@@ -7,12 +8,19 @@ sys.path.append(os.getcwd())
 
 from pipeline.ingest import EpiubLoader
 from pipeline.output import JSONFormatter
+from pipeline import profiling
 
-def analyze_epub(path):
+def analyze_epub(path, profiler=None):
     print(f"Analyzing: {path}")
+
+    def profiled(name):
+        return profiler.profile(name) if profiler else contextlib.nullcontext()
+
     loader = EpiubLoader(path)
-    loader.load()
-    chapters = loader.get_chapters()
+    with profiled("load"):
+        loader.load()
+    with profiled("get_chapters"):
+        chapters = loader.get_chapters()
     
     print(f"\n=== RAW TOC Structure ===")
     print(f"Total sections: {len(chapters)}")
@@ -26,7 +34,8 @@ def analyze_epub(path):
 
     print(f"=== DETECTED HIERARCHY (Output Logic) ===")
     # Use the shared logic from output.py
-    book_structure = JSONFormatter.build_structure(chapters)
+    with profiled("build_structure"):
+        book_structure = JSONFormatter.build_structure(chapters)
     
     for item in book_structure:
         if item['_type'] == 'part':
@@ -44,10 +53,15 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Inspect EPUB structure.")
     parser.add_argument("file", nargs="?", default=default_file_path, help="Path to EPUB file.")
+    parser.add_argument("--profile-dir", default="output", help="Where --profile writes its files (default: output)")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     
     if os.path.exists(args.file):
-        analyze_epub(args.file)
+        profiler = profiling.from_args(args, args.profile_dir, os.path.splitext(os.path.basename(args.file))[0])
+        analyze_epub(args.file, profiler)
+        if profiler:
+            profiler.close()
     elif os.path.exists(default_file_path):
          # Just use default if arg provided but not found? No, better warn.
          print(f"File not found: {args.file}")
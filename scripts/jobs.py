@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Ensure we can import main.py and the pipeline package
+sys.path.append(os.getcwd())
+
+import main as pipeline_main
+from pipeline import metrics
+from pipeline.batch import load_books
+from pipeline.jobs import JobQueue, JOBS_PATH, LeaseLost, STATES, FAILED
+from pipeline.watch import FolderWatcher
+
+
+def run_job(queue, job, worker, output_dir, default_args=(), lease_seconds=300, log_dir=None):
+    """
+    Runs one claimed job in-process with main.process_book, recording each pipeline stage
+    and renewing the lease in the background. Returns the job's final row.
+    """
+    log_dir = log_dir or os.path.join(output_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"job-{job['id']}.log")
+
+    argv = [job["path"], "--output-dir", output_dir] + list(default_args) + json.loads(job["options"] or "[]")
+    if job["rating"] is not None:
+        argv += ["--rating", str(job["rating"])]
+    if job["affiliate_link"]:
+        argv += ["--affiliate-link", job["affiliate_link"]]
+
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def keep_lease():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                queue.heartbeat(job["id"], worker, lease_seconds)
+            except LeaseLost:
+                lost.set()
+                return
+            except Exception as e:
+                print(f"  ! Could not renew the lease of job {job['id']}: {e}", file=sys.__stderr__)
+
+    heartbeat = threading.Thread(target=keep_lease, name=f"lease-{job['id']}", daemon=True)
+    heartbeat.start()
+    try:
+        with open(log_path, 'a', encoding='utf-8') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            print(f"=== Job {job['id']} attempt {job['attempts'] + 1} by {worker} ===")
+            try:
+                args = pipeline_main.build_parser().parse_args(argv)
+                result = pipeline_main.process_book(args.input_file, args, interactive=False,
+                                                    on_state=lambda state: queue.advance(job["id"], worker, state))
+            except LeaseLost:
+                raise
+            except pipeline_main.BookError as e:
+                # An unreadable EPUB won't get better by retrying
+                queue.fail(job["id"], worker, f"BookError: {e}", retry=False)
+                return queue.get(job["id"])
+            except SystemExit as e:
+                queue.fail(job["id"], worker, f"Invalid job options (exit {e.code})", retry=False)
+                return queue.get(job["id"])
+            except Exception as e:
+                print(f"Job failed: {type(e).__name__}: {e}")
+                queue.fail(job["id"], worker, f"{type(e).__name__}: {e}")
+                return queue.get(job["id"])
+
+            if lost.is_set():
+                raise LeaseLost(f"Job {job['id']} lease expired while running")
+            if result.get("chapters_failed"):
+                # The journal keeps the good chapters; the next attempt only redoes the failed ones
+                queue.fail(job["id"], worker, f"{result['chapters_failed']} chapters failed", result=result)
+            elif result.get("upload") == "failed":
+                # Summaries are saved; the retry resumes them and only redoes the upload
+                queue.fail(job["id"], worker, "Sanity upload failed", result=result)
+            else:
+                queue.complete(job["id"], worker, result)
+    except LeaseLost as e:
+        print(f"  ! {e}; leaving it to its new owner.")
+    finally:
+        stop.set()
+        heartbeat.join()
+    return queue.get(job["id"])
+
+
+def work(queue, worker, output_dir, default_args=(), lease_seconds=300, poll=5.0, once=False, log_dir=None):
+    """Claims and runs jobs until stopped (SIGINT/SIGTERM finish the current job first), or until idle with once=True."""
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        if stopping.is_set():
+            raise KeyboardInterrupt
+        print("Stopping after the current job (signal again to abort).")
+        stopping.set()
+
+    previous = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous[signum] = signal.signal(signum, request_stop)
+
+    processed = 0
+    try:
+        while not stopping.is_set():
+            job = queue.claim(worker, lease_seconds)
+            if job is None:
+                if once:
+                    break
+                stopping.wait(poll)
+                continue
+            print(f"[{worker}] Job {job['id']}: {os.path.basename(job['path'])} (attempt {job['attempts'] + 1}/{job['max_attempts']})")
+            start = time.perf_counter()
+            final = run_job(queue, job, worker, output_dir, default_args, lease_seconds, log_dir)
+            processed += 1
+            outcome = final["state"] if final["finished_at"] else f"retrying ({final['last_error']})"
+            print(f"[{worker}] Job {job['id']}: {outcome} in {time.perf_counter() - start:.1f}s")
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return processed
+
+
+def needs_job(queue, path):
+    """False if the book is already waiting, or was queued after it last changed."""
+    job = queue.latest(path)
+    if job is None:
+        return True
+    if job["finished_at"] is None:
+        return False
+    queued_at = datetime.fromisoformat(job["created_at"].rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+    return os.path.getmtime(path) > queued_at
+
+
+def watch(queue, watcher, stop=None, **job_options):
+    """Enqueues every EPUB the watcher reports as settled; books already handled since their last change are skipped."""
+    def on_ready(path):
+        if not needs_job(queue, path):
+            return
+        job_id = queue.enqueue(path, **job_options)
+        print(f"  - Job {job_id}: {os.path.basename(path)}")
+
+    watcher.run(on_ready, stop)
+
+
+def print_status(queue, state=None, limit=20):
+    counts = queue.counts()
+    print(f"Jobs: {counts['pending']} pending ({counts['running']} running). "
+          + ", ".join(f"{s}: {counts[s]}" for s in STATES + [FAILED] if counts[s]))
+    rows = queue.jobs(state=state, limit=limit)
+    if not rows:
+        return
+    print(f"{'id':>5}  {'state':<12} {'tries':>5}  {'owner':<20} book")
+    for row in rows:
+        owner = row["lease_owner"] or ("done" if row["finished_at"] else "-")
+        print(f"{row['id']:>5}  {row['state']:<12} {row['attempts']:>5}  {owner[:20]:<20} {os.path.basename(row['path'])}")
+        if row["last_error"]:
+            print(f"{'':>5}  ! {row['last_error'][:200]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite-backed book queue: enqueue EPUBs and run worker daemons over them")
+    parser.add_argument("--queue", default=JOBS_PATH, help=f"Path to the job database (default: {JOBS_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Add EPUBs (files, folders or CSV/JSON manifests). Unknown options are stored for main.py.")
+    enqueue.add_argument("sources", nargs="+")
+    enqueue.add_argument("--rating", type=float, default=None)
+    enqueue.add_argument("--affiliate-link", default=None)
+    enqueue.add_argument("--max-attempts", type=int, default=3)
+
+    status = commands.add_parser("status", help="Show queue counts and recent jobs")
+    status.add_argument("--state", choices=STATES + [FAILED], default=None)
+    status.add_argument("--limit", type=int, default=20)
+
+    retry = commands.add_parser("retry", help="Put finished or failed jobs back in the queue")
+    retry.add_argument("job_ids", nargs="+", type=int)
+
+    watcher = commands.add_parser("watch", help="Enqueue EPUBs as they appear in a folder. Unknown options are stored for main.py.")
+    watcher.add_argument("directory", nargs="?", default="book", help="Folder to watch (default: book)")
+    watcher.add_argument("--settle", type=float, default=5.0, help="Seconds a file's size and mtime must stay unchanged before it is queued (default: 5)")
+    watcher.add_argument("--poll", type=float, default=2.0, help="Rescan interval in seconds when polling (default: 2)")
+    watcher.add_argument("--no-inotify", action="store_true", help="Always poll, e.g. for network shares where inotify sees no events")
+    watcher.add_argument("--rating", type=float, default=None)
+    watcher.add_argument("--affiliate-link", default=None)
+    watcher.add_argument("--max-attempts", type=int, default=3)
+
+    worker = commands.add_parser("work", help="Run a worker. Start several to share the queue. Unknown options are passed to main.py.")
+    worker.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    worker.add_argument("--output-dir", default="output")
+    worker.add_argument("--log-dir", default=None, help="Per-job logs (default: <output-dir>/logs)")
+    worker.add_argument("--lease", type=float, default=300, help="Lease length in seconds; renewed every third of it (default: 300)")
+    worker.add_argument("--poll", type=float, default=5.0, help="Seconds between checks when the queue is empty (default: 5)")
+    worker.add_argument("--backoff", type=float, default=30.0, help="First retry delay in seconds, doubled per attempt (default: 30)")
+    worker.add_argument("--once", action="store_true", help="Exit when no job is runnable instead of waiting for more")
+    worker.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics (incl. queue depth) on this port")
+
+    args, extra = parser.parse_known_args()
+    if extra and args.command not in ("enqueue", "watch", "work"):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    queue = JobQueue(args.queue, backoff_base=getattr(args, "backoff", 30.0))
+
+    if args.command == "enqueue":
+        for source in args.sources:
+            books = load_books(source) if os.path.isdir(source) or source.lower().endswith((".csv", ".json")) \
+                else [{"path": source, "rating": None, "affiliate_link": None}]
+            for book in books:
+                rating = book["rating"] if book["rating"] is not None else args.rating
+                job_id = queue.enqueue(book["path"], rating=rating, affiliate_link=book["affiliate_link"] or args.affiliate_link,
+                                       options=extra, max_attempts=args.max_attempts)
+                print(f"  - Job {job_id}: {book['path']}")
+    elif args.command == "watch":
+        try:
+            folder = FolderWatcher(args.directory, settle=args.settle, poll=args.poll, use_inotify=not args.no_inotify)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Watching {args.directory} ({folder.mode}); queue: {args.queue}. Press Ctrl+C to stop.")
+        try:
+            watch(queue, folder, rating=args.rating, affiliate_link=args.affiliate_link,
+                  options=extra, max_attempts=args.max_attempts)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    elif args.command == "status":
+        print_status(queue, args.state, args.limit)
+    elif args.command == "retry":
+        for job_id in args.job_ids:
+            print(f"  - Job {job_id}: {'requeued' if queue.retry(job_id) else 'not found'}")
+    else:
+        metrics.JOBS_PENDING.set_function(lambda: queue.counts()["pending"])
+        if args.metrics_port is not None:
+            metrics.start_http_server(args.metrics_port)
+            print(f"Metrics: http://127.0.0.1:{args.metrics_port}/metrics")
+        print(f"Worker {args.worker_id} watching {args.queue}")
+        count = work(queue, args.worker_id, args.output_dir, extra, args.lease, args.poll, args.once, args.log_dir)
+        print(f"Worker {args.worker_id} processed {count} jobs.")
+
+if __name__ == "__main__":
+    main()
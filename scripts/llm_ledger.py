@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import sys
+
+# Ensure we can import from pipeline
+sys.path.append(os.getcwd())
+
+from pipeline.ledger import Ledger, LEDGER_PATH, GROUPS
+
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else "-"
+
+
+def print_table(by, groups):
+    print(f"{by:<32} {'calls':>6} {'err':>4} {'retry':>5} {'prompt tok':>11} {'compl tok':>10} "
+          f"{'total s':>8} {'mean s':>7} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7}")
+    for key, g in sorted(groups.items(), key=lambda kv: -kv[1]["latency_total"]):
+        name = str(key) if len(str(key)) <= 32 else str(key)[:29] + "..."
+        print(f"{name:<32} {g['calls']:>6} {g['errors']:>4} {g['retries']:>5} {g['prompt_tokens']:>11,} "
+              f"{g['completion_tokens']:>10,} {g['latency_total']:>8.1f} {_fmt(g['latency_mean'], '>7.2f')} "
+              f"{_fmt(g['latency_p50'], '>7.2f')} {_fmt(g['latency_p90'], '>7.2f')} {_fmt(g['latency_p99'], '>7.2f')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the LLM call ledger: tokens, retries and latency percentiles")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help=f"Path to the ledger database (default: {LEDGER_PATH})")
+    parser.add_argument("--by", default="book,model", help=f"Comma-separated groupings to print: {', '.join(GROUPS)} (default: book,model)")
+    parser.add_argument("--book", default=None, help="Only calls for this book title")
+    parser.add_argument("--model", default=None, help="Only calls made with this model")
+    parser.add_argument("--run", dest="run_id", default=None, help="Only calls from this run id")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of tables")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ledger):
+        print(f"No ledger at {args.ledger}. Run main.py first.")
+        return
+
+    ledger = Ledger(args.ledger)
+    filters = {"book": args.book, "model": args.model, "run_id": args.run_id}
+    groupings = [b.strip() for b in args.by.split(",") if b.strip()]
+    for by in groupings:
+        if by not in GROUPS:
+            parser.error(f"Unknown grouping: {by}")
+
+    results = {by: ledger.aggregate(by, **filters) for by in groupings}
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    for i, by in enumerate(groupings):
+        if i:
+            print()
+        print_table(by, results[by])
+
+if __name__ == "__main__":
+    main()
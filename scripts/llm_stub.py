@@ -0,0 +1,236 @@
+"""
+OpenAI-compatible stand-in for the local LLM (Ollama) used by Summarizer.
+Answers /v1/chat/completions with deterministic summaries and highlight JSON built
+from the prompt text, and sleeps according to a simple serving model: queueing for
+one of `capacity` slots, then prefill (prompt tokens / prefill_tps) and decode
+(completion tokens / decode_tps). Errors can be injected. GET /stats returns counters.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Markers Summarizer puts in front of the text it wants processed
+_TEXT_MARKERS = ("TEXT TO SUMMARIZE:", "CHAPTER PARTS:", "CHAPTER SUMMARIES:", "HIGHLIGHTS:", "TEXT:")
+_SENTENCE = re.compile(r'[^.!?\n]+[.!?]')
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), matching what the latency model charges."""
+    return max(1, math.ceil(len(text or "") / 4))
+
+
+def classify(messages, response_format=None):
+    """Names the Summarizer call a request belongs to, from its prompt."""
+    prompt = messages[-1].get("content", "") if messages else ""
+    if prompt.startswith("Merge the following"):
+        return "merge"
+    if "consolidate these" in prompt:
+        return "consolidate"
+    if "book description" in prompt:
+        return "description"
+    if (response_format or {}).get("type") == "json_object" or "JSON list" in prompt:
+        return "highlights"
+    return "summary"
+
+
+def _source_text(prompt):
+    for marker in _TEXT_MARKERS:
+        idx = prompt.rfind(marker)
+        if idx != -1:
+            return prompt[idx + len(marker):].strip()
+    return prompt
+
+
+def _pick_sentences(text, count, seed):
+    sentences = [s.strip() for s in _SENTENCE.findall(text) if len(s.split()) >= 4]
+    if not sentences:
+        words = text.split()
+        sentences = [" ".join(words[i:i + 12]) + "." for i in range(0, len(words), 12)] or ["Nothing happened."]
+    rng = random.Random(seed)
+    if len(sentences) <= count:
+        return sentences
+    picked = sorted(rng.sample(range(len(sentences)), count))
+    return [sentences[i] for i in picked]
+
+
+def fake_completion(call_type, prompt, summary_ratio=0.15, max_tokens=800, highlights=6):
+    """Deterministic response text for a request: same prompt, same answer."""
+    text = _source_text(prompt)
+    seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16], 16)
+    if call_type in ("highlights", "consolidate"):
+        if call_type == "consolidate":
+            items = [line[2:].strip() for line in text.splitlines() if line.startswith("- ")][:12]
+        else:
+            items = _pick_sentences(text, highlights, seed)
+        return json.dumps({"highlights": items})
+
+    budget = min(max_tokens, max(20, int(estimate_tokens(text) * summary_ratio)))
+    out = []
+    for sentence in _pick_sentences(text, 10_000, seed):
+        if estimate_tokens(" ".join(out + [sentence])) > budget:
+            break
+        out.append(sentence)
+    return " ".join(out) or _pick_sentences(text, 1, seed)[0]
+
+
+class LLMStub(ThreadingHTTPServer):
+    """
+    The stand-in server. `capacity` requests are served at once (the rest queue);
+    each takes prompt_tokens/prefill_tps + completion_tokens/decode_tps seconds,
+    multiplied by `time_scale`. `error_rate` of requests fail with `error_status`.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), prefill_tps=1500.0, decode_tps=40.0, capacity=1,
+                 error_rate=0.0, error_status=503, time_scale=1.0, summary_ratio=0.15, max_tokens=800, seed=None):
+        super().__init__(address, _Handler)
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.time_scale = time_scale
+        self.summary_ratio = summary_ratio
+        self.max_tokens = max_tokens
+        self.random = random.Random(seed)
+        self.slots = threading.BoundedSemaphore(max(1, capacity))
+        self.lock = threading.Lock()
+        self.active = 0
+        self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                      "busy_seconds": 0.0, "queue_seconds": 0.0, "max_in_flight": 0, "calls": {}}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serves on a daemon thread; returns self for chaining."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def complete(self, request):
+        """Serves one chat completion request; returns (status, body)."""
+        messages = request.get("messages", [])
+        call_type = classify(messages, request.get("response_format"))
+        prompt = messages[-1].get("content", "") if messages else ""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["calls"][call_type] = self.stats["calls"].get(call_type, 0) + 1
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+        if fail:
+            with self.lock:
+                self.stats["errors"] += 1
+            return self.error_status, {"error": {"message": "Injected failure", "type": "server_error"}}
+
+        content = fake_completion(call_type, prompt, self.summary_ratio,
+                                  request.get("max_tokens") or self.max_tokens)
+        completion_tokens = estimate_tokens(content)
+
+        queued_at = time.perf_counter()
+        with self.slots:
+            started = time.perf_counter()
+            with self.lock:
+                self.active += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.active)
+            busy = (prompt_tokens / self.prefill_tps + completion_tokens / self.decode_tps) * self.time_scale
+            time.sleep(busy)
+            with self.lock:
+                self.active -= 1
+                self.stats["queue_seconds"] += started - queued_at
+                self.stats["busy_seconds"] += busy
+                self.stats["prompt_tokens"] += prompt_tokens
+                self.stats["completion_tokens"] += completion_tokens
+
+        return 200, {
+            "id": f"chatcmpl-{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith("/models"):
+            self._reply(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+        elif self.path.rstrip('/').endswith("/stats"):
+            self._reply(200, self.server.snapshot())
+        else:
+            self._reply(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b"{}"
+        if not self.path.rstrip('/').endswith("/chat/completions"):
+            self._reply(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError as e:
+            self._reply(400, {"error": {"message": f"Invalid JSON: {e}"}})
+            return
+        self._reply(*self.server.complete(request))
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OpenAI-compatible LLM stand-in (use --model-url http://HOST:PORT/v1)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=11435, help="Port to listen on (default: 11435)")
+    parser.add_argument("--prefill-tps", type=float, default=1500.0, help="Prompt tokens processed per second (default: 1500)")
+    parser.add_argument("--decode-tps", type=float, default=40.0, help="Completion tokens generated per second (default: 40)")
+    parser.add_argument("--capacity", type=int, default=1, help="Requests served concurrently; the rest queue (default: 1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status used for injected failures (default: 503)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier on all simulated latency (e.g. 0.01 for fast runs)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for error injection")
+    args = parser.parse_args()
+
+    stub = LLMStub((args.host, args.port), prefill_tps=args.prefill_tps, decode_tps=args.decode_tps,
+                   capacity=args.capacity, error_rate=args.error_rate, error_status=args.error_status,
+                   time_scale=args.time_scale, seed=args.seed)
+    print(f"LLM stand-in listening on {stub.url}. Ctrl+C to stop.")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server_close()
+        print(f"Stats: {json.dumps(stub.snapshot())}")
+
+if __name__ == "__main__":
+    main()
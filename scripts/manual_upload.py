@@ -10,6 +10,7 @@ sys.path.append(os.getcwd())
 
 from pipeline.sanity_uploader import SanityUploader
 from pipeline.ingest import EpiubLoader
+from pipeline.cover import normalize_cover
 
 def find_matching_epub(book_dir, book_title):
     if not os.path.exists(book_dir):
@@ -49,24 +50,14 @@ def find_matching_epub(book_dir, book_title):
     # Fallback: fuzzy match filename?
     return os.path.join(book_dir, epubs[0]) # Default to first if all else fails
 
-def main():
-    parser = argparse.ArgumentParser(description="Upload JSON Summary and Cover to Sanity")
-    parser.add_argument("json_path", help="Path to the output JSON summary file")
-    args = parser.parse_args()
-
-    json_path = args.json_path
-    
-    if not os.path.exists(json_path):
-        print(f"Error: JSON file not found at {json_path}")
-        sys.exit(1)
-
+def upload_one(uploader, json_path, args, batch):
+    """Uploads the cover and queues the review + update log for one JSON. Returns (title, slug) if queued."""
     print(f"Loading {json_path}...")
     with open(json_path, "r", encoding="utf-8") as f:
         final_json_data = json.load(f)
 
     print("Step 7: Uploading to Sanity (Manual Run)...")
-    uploader = SanityUploader()
-    if uploader.enabled and final_json_data:
+    if final_json_data:
         # Determine Cover Image (Local vs EPUB)
         cover_bytes = None
         cover_mimetype = "image/jpeg"
@@ -76,7 +67,7 @@ def main():
         
         if not slug:
             print("Error: JSON missing slug.")
-            return
+            return None
 
         # 1. Check Local Images in book/ folder
         book_dir_local = "book" 
@@ -125,6 +116,11 @@ def main():
             else:
                  print("  - No valid EPUB found to extract cover from.")
 
+        if cover_bytes and args.cover_max_dim:
+            cover_bytes, cover_mimetype, saved = normalize_cover(cover_bytes, cover_mimetype, max_dim=args.cover_max_dim,
+                                                                 fmt=args.cover_format, quality=args.cover_quality)
+            print(f"  - Normalized cover image ({len(cover_bytes)} bytes, saved {saved} bytes).")
+
         if cover_bytes:
             print(f"  - Uploading cover image to Sanity...")
             asset_doc = uploader.upload_image_asset(cover_bytes, mimetype=cover_mimetype)
@@ -146,14 +142,48 @@ def main():
         doc_id = f"book-review-{slug}"
         final_json_data['_id'] = doc_id
         
-        res = uploader.upload_book_review(final_json_data)
+        res = uploader.upload_book_review(final_json_data, minimal_patch=args.patch, batch=batch)
         
         if res:
             # Create Log
-            uploader.create_update_log(final_json_data['title'], slug)
-            print(f"Done! Summary of '{final_json_data['title']}' is live.")
-    else:
+            uploader.create_update_log(final_json_data['title'], slug, batch=batch)
+            return final_json_data['title'], slug
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload JSON Summary and Cover to Sanity")
+    parser.add_argument("json_paths", nargs="+", help="Path(s) to the output JSON summary file(s)")
+    parser.add_argument("--patch", action="store_true", help="Upload only the changes to an existing document instead of replacing it")
+    parser.add_argument("--cover-max-dim", type=int, default=None, help="Downsize the cover to fit within N pixels and re-encode it before upload")
+    parser.add_argument("--cover-format", default="JPEG", choices=["JPEG", "WEBP"], help="Format used when re-encoding the cover (default: JPEG)")
+    parser.add_argument("--cover-quality", type=int, default=85, help="Encoder quality used when re-encoding the cover (default: 85)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Transactions sent in parallel when flushing (default: 4)")
+    args = parser.parse_args()
+
+    missing = [p for p in args.json_paths if not os.path.exists(p)]
+    if missing:
+        for p in missing:
+            print(f"Error: JSON file not found at {p}")
+        sys.exit(1)
+
+    uploader = SanityUploader()
+    if not uploader.enabled:
         print("Sanity Uploader not enabled or no data.")
+        return
+
+    # Every book's review and update log is queued, then sent in a few size-capped transactions
+    batch = uploader.batch(concurrency=args.concurrency)
+    queued = []
+    for json_path in args.json_paths:
+        title = upload_one(uploader, json_path, args, batch)
+        if title:
+            queued.append(title)
+
+    results = batch.flush()
+    failed_labels = {str(l) for r in results if not r['ok'] for l in r['labels']}
+    for title, slug in queued:
+        if f"book-review-{slug}" not in failed_labels:
+            print(f"Done! Summary of '{title}' is live.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+
+# Add parent directory to sys.path to allow importing the pipeline package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline.journal import ChapterJournal
+from pipeline.output import JSONFormatter
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize the output JSON from a chapter checkpoint journal (e.g. mid-run).")
+    parser.add_argument("json_path", help="Path of the output JSON (the journal next to it is read)")
+    args = parser.parse_args()
+
+    journal = ChapterJournal(ChapterJournal.path_for(args.json_path))
+    if not os.path.exists(journal.path):
+        print(f"Error: Journal not found at {journal.path}")
+        sys.exit(1)
+
+    book, _ = journal.load()
+    chapters = journal.chapters_in_order()
+    print(f"Replaying {len(chapters)} chapters from {journal.path}...")
+
+    JSONFormatter.save(book.get('metadata', {}), chapters, args.json_path,
+                       book_description=book.get('bookDescription') or None,
+                       rating=book.get('rating') or 0,
+                       affiliate_link=book.get('affiliateLink'))
+
+if __name__ == "__main__":
+    main()
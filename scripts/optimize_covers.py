@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+
+# Add parent directory to sys.path to allow importing the pipeline package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline.cover import normalize_cover_files
+
+VALID_EXTS = ['.jpg', '.jpeg', '.png', '.webp']
+
+def main():
+    parser = argparse.ArgumentParser(description="Downsize and recompress cover images before uploading them to Sanity.")
+    parser.add_argument("input_dir", nargs="?", default="book", help="Folder containing cover images (default: book)")
+    parser.add_argument("--output-dir", default=os.path.join("output", "covers"), help="Where to write the optimized covers")
+    parser.add_argument("--max-dim", type=int, default=1600, help="Maximum width/height in pixels (default: 1600)")
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "WEBP"], help="Output format (default: JPEG)")
+    parser.add_argument("--quality", type=int, default=85, help="Encoder quality (default: 85)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: Folder not found: {args.input_dir}")
+        sys.exit(1)
+
+    paths = [os.path.join(args.input_dir, f) for f in sorted(os.listdir(args.input_dir))
+             if os.path.splitext(f)[1].lower() in VALID_EXTS]
+    if not paths:
+        print(f"No cover images found in '{args.input_dir}'.")
+        return
+
+    print(f"Optimizing {len(paths)} covers with up to {args.workers or os.cpu_count()} workers...")
+    results = normalize_cover_files(paths, args.output_dir, max_dim=args.max_dim, fmt=args.format,
+                                    quality=args.quality, workers=args.workers)
+
+    total_before = total_after = 0
+    for r in results:
+        if 'error' in r:
+            print(f"  ! {os.path.basename(r['path'])}: {r['error']}")
+            continue
+        total_before += r['before']
+        total_after += r['after']
+        print(f"  - {os.path.basename(r['path']):<50} {r['before']:>10,} -> {r['after']:>10,} bytes")
+
+    print(f"Saved {total_before - total_after:,} bytes ({total_before:,} -> {total_after:,}). Output: {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+
+# Ensure we can import from pipeline
+sys.path.append(os.getcwd())
+
+from pipeline.sanity_uploader import SanityUploader
+from pipeline.outbox import Outbox, OUTBOX_PATH
+
+def main():
+    parser = argparse.ArgumentParser(description="Send Sanity writes that were queued in the local outbox")
+    parser.add_argument("--outbox", default=OUTBOX_PATH, help=f"Path to the outbox database (default: {OUTBOX_PATH})")
+    parser.add_argument("--concurrency", type=int, default=4, help="Documents replayed in parallel (default: 4)")
+    parser.add_argument("--status", action="store_true", help="Only list pending entries; send nothing")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.outbox):
+        print(f"Outbox is empty (no database at {args.outbox}).")
+        return
+
+    outbox = Outbox(args.outbox)
+    stats = outbox.stats()
+    print(f"Outbox: {stats['pending']} pending ({stats['failing']} with failed attempts), {stats['total']} total.")
+
+    if args.status:
+        for row in outbox.pending():
+            error = f" - last error: {row['last_error']}" if row['last_error'] else ""
+            print(f"  - [{row['kind']}] {row['label'] or '-'} {row['idempotency_key']} (attempts: {row['attempts']}){error}")
+        return
+    if not stats['pending']:
+        return
+
+    uploader = SanityUploader()
+    sent, failed = outbox.replay(uploader, concurrency=args.concurrency)
+    print(f"Replayed {sent} entries, {failed} still pending.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
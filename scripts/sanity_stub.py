@@ -0,0 +1,384 @@
+"""
+In-memory stand-in for the parts of the Sanity HTTP API that SanityUploader uses:
+data/mutate (create, createOrReplace, createIfNotExists, delete, patch with
+set/setIfMissing/unset/insert on _key paths and ifRevisionID), data/query for the
+_id, slug and sha1hash lookups, and assets/images. Latency and errors can be
+injected to exercise retries, and every request (and mutate payload, incl. its
+transactionId) is logged for tests. Point the uploader at it with SANITY_API_HOST.
+"""
+import argparse
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+_SEGMENT = re.compile(r'^(\w+)((?:\[_key=="[^"]+"\])?)$')
+_KEY = re.compile(r'\[_key=="([^"]+)"\]')
+
+
+class MutationError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_path(path):
+    """'a[_key=="k"].b' -> [('field', 'a'), ('key', 'k'), ('field', 'b')]"""
+    tokens = []
+    for segment in path.split('.'):
+        match = _SEGMENT.match(segment)
+        if not match:
+            raise MutationError(400, f"Unsupported path: {path}")
+        tokens.append(('field', match.group(1)))
+        key = _KEY.match(match.group(2)) if match.group(2) else None
+        if key:
+            tokens.append(('key', key.group(1)))
+    return tokens
+
+
+def _index_of(items, key):
+    if isinstance(items, list):
+        for i, item in enumerate(items):
+            if isinstance(item, dict) and item.get('_key') == key:
+                return i
+    return None
+
+
+def _walk(doc, tokens, create=False):
+    """Returns the container holding the last token, or None if the path doesn't exist."""
+    node = doc
+    for kind, name in tokens[:-1]:
+        if kind == 'field':
+            if not isinstance(node, dict):
+                return None
+            if name not in node and create:
+                node[name] = {}
+            node = node.get(name)
+        else:
+            idx = _index_of(node, name)
+            if idx is None:
+                return None
+            node = node[idx]
+    return node
+
+
+def _get(doc, path):
+    tokens = _parse_path(path)
+    parent = _walk(doc, tokens)
+    kind, name = tokens[-1]
+    if kind == 'field':
+        return (True, parent[name]) if isinstance(parent, dict) and name in parent else (False, None)
+    idx = _index_of(parent, name)
+    return (True, parent[idx]) if idx is not None else (False, None)
+
+
+def _set(doc, path, value):
+    tokens = _parse_path(path)
+    parent = _walk(doc, tokens, create=True)
+    kind, name = tokens[-1]
+    if kind == 'field' and isinstance(parent, dict):
+        parent[name] = copy.deepcopy(value)
+        return
+    idx = _index_of(parent, name)
+    if idx is not None:
+        parent[idx] = copy.deepcopy(value)
+
+
+def _unset(doc, path):
+    tokens = _parse_path(path)
+    parent = _walk(doc, tokens)
+    kind, name = tokens[-1]
+    if kind == 'field':
+        if isinstance(parent, dict):
+            parent.pop(name, None)
+        return
+    idx = _index_of(parent, name)
+    if idx is not None:
+        del parent[idx]
+
+
+def _insert(doc, spec):
+    position = next((p for p in ('before', 'after', 'replace') if p in spec), None)
+    if position is None:
+        raise MutationError(400, "insert needs before, after or replace")
+    tokens = _parse_path(spec[position])
+    if tokens[-1][0] != 'key':
+        raise MutationError(400, f"Unsupported insert path: {spec[position]}")
+    items = _walk(doc, tokens)
+    idx = _index_of(items, tokens[-1][1])
+    if idx is None:
+        raise MutationError(409, f"Insert anchor not found: {spec[position]}")
+    new_items = copy.deepcopy(spec.get('items', []))
+    if position == 'before':
+        items[idx:idx] = new_items
+    elif position == 'after':
+        items[idx + 1:idx + 1] = new_items
+    else:
+        items[idx:idx + 1] = new_items
+
+
+def _apply_patch(doc, patch):
+    if 'ifRevisionID' in patch and doc.get('_rev') != patch['ifRevisionID']:
+        raise MutationError(409, f"Document {patch['id']} has revision {doc.get('_rev')}, expected {patch['ifRevisionID']}")
+    for path, value in patch.get('setIfMissing', {}).items():
+        if not _get(doc, path)[0]:
+            _set(doc, path, value)
+    for path, value in patch.get('set', {}).items():
+        _set(doc, path, value)
+    for path in patch.get('unset', []):
+        _unset(doc, path)
+    if 'insert' in patch:
+        _insert(doc, patch['insert'])
+
+
+class SanityStub(ThreadingHTTPServer):
+    """
+    The stand-in server. `latency` (+ up to `jitter`) seconds are added to every request;
+    `error_rate` of requests fail with `error_status`, and fail_next() scripts exact failures.
+    Documents live in `documents`; `requests` logs (method, path, Authorization) of every
+    request and `mutate_payloads` every data/mutate body received, failed ones included.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, retry_after=0, seed=None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.documents = {}
+        self.assets = {}
+        self.transaction_ids = set()
+        self.requests = []
+        self.mutate_payloads = []
+        self._scripted = []  # [remaining, status, endpoint, after] from fail_next()
+        self.stats = {"requests": 0, "errors": 0, "mutations": 0, "transactions": 0,
+                      "queries": 0, "uploads": 0, "bytes_in": 0}
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves on a daemon thread; returns self for chaining."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def fail_next(self, count, status=503, endpoint=None, after=False):
+        """
+        Fails the next `count` requests (only those whose path contains `endpoint`, if given)
+        with `status`. With after=True the request is applied first and only the response
+        is lost, like a gateway error or read timeout after Sanity committed the write.
+        """
+        with self.lock:
+            self._scripted.append([count, status, endpoint, after])
+
+    def _failure(self, path):
+        """(status, after) to fail this request with, or None to serve it normally."""
+        with self.lock:
+            for entry in self._scripted:
+                remaining, status, endpoint, after = entry
+                if remaining > 0 and (endpoint is None or endpoint in path):
+                    entry[0] -= 1
+                    return status, after
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return self.error_status, False
+        return None
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+            time.sleep(self.latency + extra)
+
+    def mutate(self, payload):
+        """Applies one transaction atomically. Returns the response body or raises MutationError."""
+        mutations = payload.get('mutations', [])
+        with self.lock:
+            transaction_id = payload.get('transactionId')
+            if transaction_id and transaction_id in self.transaction_ids:
+                raise MutationError(409, f"The transaction ID {transaction_id} has already been used")
+            transaction_id = transaction_id or uuid.uuid4().hex
+            revision = uuid.uuid4().hex[:12]
+            staged = {}
+            results = []
+
+            def current(doc_id):
+                if doc_id not in staged:
+                    staged[doc_id] = copy.deepcopy(self.documents.get(doc_id))
+                return staged[doc_id]
+
+            for mutation in mutations:
+                (operation, body), = mutation.items()
+                if operation in ('create', 'createOrReplace', 'createIfNotExists'):
+                    doc_id = body.get('_id') or f"stub-{uuid.uuid4().hex[:12]}"
+                    exists = current(doc_id) is not None
+                    if operation == 'create' and exists:
+                        raise MutationError(409, f"Document {doc_id} already exists")
+                    if operation == 'createIfNotExists' and exists:
+                        results.append({"id": doc_id, "operation": "none"})
+                        continue
+                    staged[doc_id] = dict(copy.deepcopy(body), _id=doc_id)
+                    results.append({"id": doc_id, "operation": "update" if exists else "create"})
+                elif operation == 'delete':
+                    staged[body['id']] = None
+                    results.append({"id": body['id'], "operation": "delete"})
+                elif operation == 'patch':
+                    doc = current(body['id'])
+                    if doc is None:
+                        raise MutationError(404, f"Document {body['id']} not found")
+                    _apply_patch(doc, body)
+                    results.append({"id": body['id'], "operation": "update"})
+                else:
+                    raise MutationError(400, f"Unsupported mutation: {operation}")
+
+            for doc_id, doc in staged.items():
+                if doc is None:
+                    self.documents.pop(doc_id, None)
+                elif doc != self.documents.get(doc_id):
+                    doc['_rev'] = revision
+                    self.documents[doc_id] = doc
+            self.transaction_ids.add(transaction_id)
+            self.stats["transactions"] += 1
+            self.stats["mutations"] += len(mutations)
+        return {"transactionId": transaction_id, "results": results}
+
+    def query(self, groq, params):
+        """Answers the handful of GROQ shapes SanityUploader sends."""
+        with self.lock:
+            self.stats["queries"] += 1
+            match = re.search(r'_id == "([^"]+)"', groq)
+            if match:
+                return copy.deepcopy(self.documents.get(match.group(1)))
+            match = re.search(r'slug\.current == "([^"]+)"', groq)
+            if match:
+                return next((copy.deepcopy(d) for d in self.documents.values()
+                             if d.get('_type') == 'bookReview' and d.get('slug', {}).get('current') == match.group(1)), None)
+            if 'sha1hash == $hash' in groq:
+                return copy.deepcopy(self.assets.get(json.loads(params.get('$hash', 'null'))))
+        raise MutationError(400, f"Unsupported query: {groq}")
+
+    def upload(self, data, mimetype):
+        sha1 = hashlib.sha1(data).hexdigest()
+        with self.lock:
+            self.stats["uploads"] += 1
+            ext = (mimetype or "image/jpeg").split('/')[-1]
+            asset = self.assets.setdefault(sha1, {
+                "_id": f"image-{sha1}-1x1-{ext}",
+                "_type": "sanity.imageAsset",
+                "url": f"{self.url}/images/{sha1}.{ext}",
+                "sha1hash": sha1,
+                "size": len(data),
+                "mimeType": mimetype,
+            })
+            return copy.deepcopy(asset)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        with server.lock:
+            server.stats["requests"] += 1
+            server.stats["bytes_in"] += len(body)
+            server.requests.append((self.command, self.path, self.headers.get("Authorization")))
+            if "/data/mutate/" in self.path:
+                try:
+                    server.mutate_payloads.append(json.loads(body or b"{}"))
+                except ValueError:
+                    pass
+
+        server._delay()
+        failure = server._failure(self.path)
+        if failure is not None:
+            with server.lock:
+                server.stats["errors"] += 1
+            status, after = failure
+            if after:
+                self._serve(body, reply=lambda *_: None)
+            self._reply(status, {"error": "Injected failure"}, {"Retry-After": str(server.retry_after)})
+            return
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            self._reply(401, {"error": "Unauthorized"})
+            return
+        self._serve(body, reply=self._reply)
+
+    def _serve(self, body, reply):
+        server = self.server
+        url = urlparse(self.path)
+        try:
+            if "/data/mutate/" in url.path and self.command == "POST":
+                reply(200, server.mutate(json.loads(body or b"{}")))
+            elif "/data/query/" in url.path and self.command == "GET":
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                reply(200, {"result": server.query(params.get("query", ""), params)})
+            elif "/assets/images/" in url.path and self.command == "POST":
+                reply(200, {"document": server.upload(body, self.headers.get("Content-Type"))})
+            else:
+                reply(404, {"error": f"Unknown endpoint {self.command} {url.path}"})
+        except MutationError as e:
+            reply(e.status, {"error": {"description": str(e)}})
+        except Exception as e:
+            reply(400, {"error": {"description": f"Bad request: {e}"}})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Sanity API (set SANITY_API_HOST to its URL)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra random seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status used for injected failures (default: 503)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for jitter and error injection")
+    args = parser.parse_args()
+
+    stub = SanityStub((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, error_status=args.error_status, seed=args.seed)
+    print(f"Sanity stand-in listening on {stub.url} (SANITY_API_HOST={stub.url}). Ctrl+C to stop.")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server_close()
+        print(f"Stats: {json.dumps(stub.stats)}")
+
+if __name__ == "__main__":
+    main()
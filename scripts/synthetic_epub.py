@@ -0,0 +1,192 @@
+import argparse
+import math
+import os
+import random
+import struct
+import zlib
+
+from ebooklib import epub
+
+# Shapes used by scripts/bench_stages.py; override any field from the command line
+PRESETS = {
+    "small": dict(spine_files=8, toc_depth=1, anchors_per_file=1, blank_pages=1, target_kb=150, images=1),
+    "medium": dict(spine_files=30, toc_depth=2, anchors_per_file=3, blank_pages=3, target_kb=1200, images=5),
+    "large": dict(spine_files=80, toc_depth=3, anchors_per_file=5, blank_pages=6, target_kb=6000, images=20),
+}
+
+_WORDS = (
+    "time river house memory light silence morning letter window garden road stranger promise "
+    "city winter habit attention system practice mother father child friend question answer "
+    "war harvest ship doctor teacher market fire stone bridge forest mountain music voice year "
+    "walked remembered believed wrote carried waited listened returned learned understood kept "
+    "quiet slow bright old small heavy strange careful patient distant familiar ordinary hidden"
+).split()
+_NUMBERS = ["One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten"]
+
+
+def _sentence(rng):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 22))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice([".", ".", ".", "?", "!"])
+
+
+def _paragraphs(rng, target_chars):
+    paras, size = [], 0
+    while size < target_chars:
+        para = " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+        paras.append(f"<p>{para}</p>")
+        size += len(para)
+    return "\n".join(paras)
+
+
+def _png(width, height, rng):
+    """A valid RGB PNG filled with noise, without needing Pillow."""
+    raw = b"".join(b"\x00" + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def _page(title, body):
+    return f"<html><head><title>{title}</title></head><body>{body}</body></html>"
+
+
+def generate_epub(path, spine_files=20, toc_depth=2, anchors_per_file=1, blank_pages=0,
+                  target_kb=500, images=0, seed=0, title=None):
+    """
+    Writes an EPUB with a controllable shape and returns a summary of what it contains.
+    - spine_files: chapter files in the spine (part title pages and blank pages come on top)
+    - toc_depth: 1 = flat chapters, 2 = parts > chapters, 3 = parts > chapters > anchored sections
+    - anchors_per_file: sections per chapter file, each addressed by a #anchor in the TOC
+    - blank_pages: chapters whose TOC entry is a title-only page followed by an untitled continuation file
+    - target_kb: approximate total text size
+    - images: PNGs embedded across chapters; the first one also becomes the cover
+    """
+    rng = random.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier(f"synthetic-{seed}-{spine_files}-{toc_depth}-{anchors_per_file}")
+    book_title = title or f"Synthetic Book {seed}"
+    book.set_title(book_title)
+    book.set_language("en")
+    book.add_author("Synthetic Author")
+
+    image_items = []
+    for i in range(images):
+        data = _png(48, 72, rng)
+        if i == 0:
+            # EPUB 2 style cover (<meta name="cover">), which EpiubLoader.get_cover reads
+            book.add_item(epub.EpubImage(uid="cover-img", file_name="images/cover.png", media_type="image/png", content=data))
+            book.add_metadata(None, "meta", "", {"name": "cover", "content": "cover-img"})
+        img = epub.EpubItem(uid=f"img{i}", file_name=f"images/img{i}.png", media_type="image/png", content=data)
+        book.add_item(img)
+        image_items.append(img.file_name)
+
+    n_parts = 0 if toc_depth < 2 else max(2, min(len(_NUMBERS), spine_files // 5))
+    per_part = math.ceil(spine_files / n_parts) if n_parts else spine_files
+    chars_per_file = max(200, target_kb * 1024 // max(1, spine_files))
+    blank = set(rng.sample(range(spine_files), min(blank_pages, spine_files)))
+
+    spine, toc, part_children = [], [], None
+    stats = {"spine_files": 0, "toc_entries": 0, "parts": 0, "anchors": 0, "blank_pages": len(blank),
+             "images": images, "text_chars": 0}
+
+    for c in range(spine_files):
+        if n_parts and c % per_part == 0:
+            p = c // per_part
+            part_title = f"Part {_NUMBERS[p]}: The {rng.choice(_WORDS).capitalize()}"
+            part = epub.EpubHtml(title=part_title, file_name=f"part{p + 1}.xhtml", lang="en")
+            part.content = _page(part_title, f"<h1>{part_title}</h1>")
+            book.add_item(part)
+            spine.append(part)
+            part_children = []
+            toc.append((epub.Section(part_title, href=part.file_name), part_children))
+            stats["parts"] += 1
+            stats["toc_entries"] += 1
+
+        ch_title = f"Chapter {c + 1}: {rng.choice(_WORDS).capitalize()} and {rng.choice(_WORDS).capitalize()}"
+        file_name = f"chapter{c + 1:03d}.xhtml"
+        sections = max(1, anchors_per_file)
+        text_parts = [_paragraphs(rng, chars_per_file // sections) for _ in range(sections)]
+        stats["text_chars"] += sum(len(t) for t in text_parts)
+
+        body = [f"<h1>{ch_title}</h1>"]
+        if image_items and rng.random() < images / max(1, spine_files):
+            body.append(f'<p><img src="{rng.choice(image_items)}" alt=""/></p>')
+        continuation = None
+        if c in blank:
+            # Title-only page in the TOC; the text lives in the next (untitled) spine file
+            continuation = epub.EpubHtml(title=f"{ch_title} (cont.)", file_name=f"chapter{c + 1:03d}b.xhtml", lang="en")
+            continuation.content = _page(ch_title, "\n".join(text_parts))
+            text_parts = []
+
+        entries = []
+        for s, text in enumerate(text_parts):
+            if anchors_per_file > 1:
+                anchor = f"c{c + 1}s{s + 1}"
+                body.append(f'<h2 id="{anchor}">Section {s + 1}</h2>')
+                entries.append(epub.Link(f"{file_name}#{anchor}", f"Section {c + 1}.{s + 1}", anchor))
+                stats["anchors"] += 1
+            body.append(text)
+
+        chapter = epub.EpubHtml(title=ch_title, file_name=file_name, lang="en")
+        chapter.content = _page(ch_title, "\n".join(body))
+        book.add_item(chapter)
+        spine.append(chapter)
+        if continuation:
+            book.add_item(continuation)
+            spine.append(continuation)
+
+        if entries and toc_depth >= 3:
+            node = (epub.Section(ch_title, href=file_name), entries)
+        elif entries:
+            node = [epub.Link(file_name, ch_title, f"ch{c + 1}")] + entries
+        else:
+            node = [epub.Link(file_name, ch_title, f"ch{c + 1}")]
+        target = part_children if n_parts else toc
+        target.extend(node if isinstance(node, list) else [node])
+        stats["toc_entries"] += 1 + len(entries)
+
+    book.toc = toc
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ["nav"] + spine
+    stats["spine_files"] = len(spine)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    epub.write_epub(path, book)
+    stats["bytes"] = os.path.getsize(path)
+    stats["title"] = book_title
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic EPUB with a controllable shape")
+    parser.add_argument("output", help="Path of the EPUB to write")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default=None, help="Start from a named shape")
+    parser.add_argument("--spine-files", type=int, default=None, help="Chapter files in the spine")
+    parser.add_argument("--toc-depth", type=int, choices=[1, 2, 3], default=None, help="1 flat, 2 parts, 3 parts + anchored sections")
+    parser.add_argument("--anchors-per-file", type=int, default=None, help="TOC anchors (sections) per chapter file")
+    parser.add_argument("--blank-pages", type=int, default=None, help="Chapters split into a title page + untitled continuation")
+    parser.add_argument("--target-kb", type=int, default=None, help="Approximate total text size in KB")
+    parser.add_argument("--images", type=int, default=None, help="Embedded images (the first is the cover)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--title", default=None, help="Book title")
+    args = parser.parse_args()
+
+    shape = dict(PRESETS.get(args.preset, {}))
+    for field in ("spine_files", "toc_depth", "anchors_per_file", "blank_pages", "target_kb", "images"):
+        if getattr(args, field) is not None:
+            shape[field] = getattr(args, field)
+
+    stats = generate_epub(args.output, seed=args.seed, title=args.title, **shape)
+    print(f"Wrote {args.output}: {stats['bytes']:,} bytes, {stats['spine_files']} spine files, "
+          f"{stats['toc_entries']} TOC entries ({stats['parts']} parts, {stats['anchors']} anchors), "
+          f"{stats['blank_pages']} blank pages, {stats['images']} images.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""Small test doubles shared by several test modules."""
+
+
+class FakeClock:
+    """Callable clock for code that takes `clock=time.time`; tests move `now` by hand."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from pipeline.batch import load_books, run_batch, format_summary
+from scripts.llm_stub import LLMStub
+from scripts.synthetic_epub import generate_epub
+
+
+class TestLoadBooks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_directory_lists_epubs_sorted(self):
+        for name in ("b.epub", "a.EPUB", "notes.txt"):
+            open(os.path.join(self.dir, name), 'w').close()
+        books = load_books(self.dir)
+        self.assertEqual([os.path.basename(b["path"]) for b in books], ["a.EPUB", "b.epub"])
+        self.assertIsNone(books[0]["rating"])
+
+    def test_csv_and_json_manifests(self):
+        csv_path = os.path.join(self.dir, "books.csv")
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write("path,rating,affiliate_link\none.epub,4.5,https://a.example\n/abs/two.epub,,\n")
+        books = load_books(csv_path)
+        self.assertEqual(books[0], {"path": os.path.join(self.dir, "one.epub"), "rating": 4.5, "affiliate_link": "https://a.example"})
+        self.assertEqual(books[1], {"path": "/abs/two.epub", "rating": None, "affiliate_link": None})
+
+        json_path = os.path.join(self.dir, "books.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"books": [{"file": "x.epub", "yourRating": 3}, "y.epub"]}, f)
+        books = load_books(json_path)
+        self.assertEqual(books[0]["rating"], 3.0)
+        self.assertEqual(books[1]["path"], os.path.join(self.dir, "y.epub"))
+
+        with self.assertRaises(ValueError):
+            load_books(os.path.join(self.dir, "books.txt"))
+
+
+class TestRunBatch(unittest.TestCase):
+    def test_books_run_without_prompts_and_failures_stay_isolated(self):
+        stub = LLMStub(time_scale=0, seed=1).start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                books = []
+                for i in range(2):
+                    path = os.path.join(tmp, f"book{i}.epub")
+                    generate_epub(path, spine_files=2, toc_depth=1, target_kb=8, seed=i, title=f"Batch Book {i}")
+                    books.append({"path": path, "rating": 4.0 if i == 0 else None, "affiliate_link": None})
+                broken = os.path.join(tmp, "broken.epub")
+                with open(broken, 'w') as f:
+                    f.write("not a zip")
+                books.append({"path": broken, "rating": None, "affiliate_link": None})
+
+                env = dict(os.environ, NEXT_PUBLIC_SANITY_PROJECT_ID="", SANITY_API_TOKEN="")
+                output_dir = os.path.join(tmp, "output")
+                results = run_batch(books, output_dir=output_dir, workers=2, env=env,
+                                    main_args=["--model-url", stub.url, "--model-name", "stub"])
+
+                self.assertEqual([r["status"] for r in results], ["ok", "ok", "failed"])
+                self.assertEqual(results[0]["title"], "Batch Book 0")
+                self.assertEqual(results[0]["chapters"], 2)
+                with open(results[1]["output"], 'r', encoding='utf-8') as f:
+                    self.assertEqual(json.load(f)["yourRating"], 0)  # No prompt; defaulted
+                self.assertTrue(all(os.path.exists(r["log"]) for r in results))
+                summary = format_summary(results)
+                self.assertIn("2 ok, 0 with failed chapters, 1 failed", summary)
+                self.assertIn("broken.epub", summary)
+        finally:
+            stub.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
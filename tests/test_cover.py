@@ -0,0 +1,57 @@
+import unittest
+import sys
+import os
+import io
+
+sys.path.append(os.getcwd())
+
+from pipeline.cover import normalize_cover
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+@unittest.skipUnless(Image, "Pillow is not installed")
+class TestNormalizeCover(unittest.TestCase):
+    def encode(self, img, fmt):
+        out = io.BytesIO()
+        img.save(out, format=fmt)
+        return out.getvalue()
+
+    def test_large_png_is_downsized_to_progressive_jpeg(self):
+        original = self.encode(Image.effect_noise((1200, 1800), 50).convert("RGB"), "PNG")
+        data, mimetype, saved = normalize_cover(original, "image/png", max_dim=600)
+        self.assertEqual(mimetype, "image/jpeg")
+        self.assertEqual(saved, len(original) - len(data))
+        result = Image.open(io.BytesIO(data))
+        self.assertEqual(result.size, (400, 600))
+        self.assertTrue(result.info.get("progressive") or result.info.get("progression"))
+
+    def test_transparent_cover_is_flattened(self):
+        original = self.encode(Image.effect_noise((800, 800), 50).convert("RGBA"), "PNG")
+        data, mimetype, _ = normalize_cover(original, "image/png", max_dim=200, fmt="WEBP")
+        self.assertEqual(mimetype, "image/webp")
+        self.assertEqual(Image.open(io.BytesIO(data)).mode, "RGB")
+
+    def test_exif_orientation_is_applied(self):
+        img = Image.effect_noise((1200, 600), 50).convert("RGB")
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise to display
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=95, exif=exif)
+        data, _, saved = normalize_cover(out.getvalue(), max_dim=600)
+        self.assertGreater(saved, 0)
+        result = Image.open(io.BytesIO(data))
+        self.assertEqual(result.size, (300, 600))
+        self.assertNotIn(0x0112, result.getexif())
+
+    def test_keeps_original_when_not_smaller_or_undecodable(self):
+        tiny = self.encode(Image.new("RGB", (4, 4)), "PNG")
+        self.assertEqual(normalize_cover(tiny, "image/png", max_dim=1600), (tiny, "image/png", 0))
+        self.assertEqual(normalize_cover(b"not an image", "image/png"), (b"not an image", "image/png", 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from unittest.mock import MagicMock, patch
+
+from pipeline.dedup import dedupe_highlights
+from pipeline.summarizer import Summarizer
+
+
+class TestDedupeHighlights(unittest.TestCase):
+    def test_collapses_near_verbatim_repeats(self):
+        highlights = [
+            "The unexamined life is not worth living.",
+            "the unexamined life is not worth living",
+            "Courage is knowing what not to fear.",
+        ]
+        self.assertEqual(dedupe_highlights(highlights), [
+            "The unexamined life is not worth living.",
+            "Courage is knowing what not to fear.",
+        ])
+
+    def test_prefers_longest_wording_in_first_position(self):
+        highlights = [
+            "We suffer more often in imagination",
+            "Something else entirely different here.",
+            "We suffer more often in imagination than in reality.",
+        ]
+        result = dedupe_highlights(highlights)
+        self.assertEqual(result[0], "We suffer more often in imagination than in reality.")
+        self.assertEqual(len(result), 2)
+
+    def test_keeps_short_highlight_contained_in_a_longer_one(self):
+        highlights = [
+            "Be kind.",
+            "Be kind to the version of yourself that did not know better yet.",
+        ]
+        self.assertEqual(dedupe_highlights(highlights), highlights)
+
+    def test_keeps_distinct_and_drops_empty(self):
+        highlights = ["Alpha beta gamma delta.", "", None, "Omega psi chi phi."]
+        self.assertEqual(dedupe_highlights(highlights), ["Alpha beta gamma delta.", "Omega psi chi phi."])
+
+
+class TestExtractHighlightsConsolidation(unittest.TestCase):
+    def setUp(self):
+        with patch('openai.OpenAI'):
+            self.summarizer = Summarizer(api_key="fake")
+
+    def test_skips_consolidation_when_deduped_list_is_small(self):
+        repeated = [
+            "Patience turns obstacles into teachers.",
+            "A promise kept is worth more than gold.",
+            "Fear shrinks when it is named aloud.",
+            "Every city hides a second, quieter city.",
+            "Grief is love with nowhere left to go.",
+            "Small habits compound into a life.",
+        ]
+        self.summarizer.chunker.chunk = MagicMock(return_value=["c1", "c2"])
+        self.summarizer._generate_highlights = MagicMock(return_value=list(repeated))
+        self.summarizer._consolidate_highlights = MagicMock()
+
+        result = self.summarizer.extract_highlights("text")
+
+        self.assertEqual(result, repeated)
+        self.summarizer._consolidate_highlights.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import threading
+
+sys.path.append(os.getcwd())
+
+from pipeline import instrument
+from pipeline.instrument import RunRecorder, stage
+
+
+class TestRunRecorder(unittest.TestCase):
+    def test_stages_nest_and_aggregate_per_chapter(self):
+        recorder = RunRecorder(input="book.epub").activate()
+        try:
+            with stage("load"):
+                pass
+            for i in range(2):
+                with stage("chapter", index=i, title=f"Chapter {i}") as rec:
+                    with stage("summarize"):
+                        with stage("llm", call="summary"):
+                            pass
+                    if i == 1:
+                        rec["cached"] = True
+        finally:
+            recorder.close()
+
+        report = recorder.report(output="out.json")
+        self.assertEqual(report["input"], "book.epub")
+        self.assertEqual(report["output"], "out.json")
+        self.assertEqual([r["name"] for r in report["stages"]], ["load", "chapter", "chapter"])
+        self.assertEqual(report["stages"][1]["children"][0]["children"][0]["call"], "summary")
+        self.assertEqual(report["totals"]["llm"]["count"], 2)
+        self.assertEqual([c["index"] for c in report["chapters"]], [0, 1])
+        self.assertIn("summarize", report["chapters"][0]["stages"])
+        self.assertTrue(report["chapters"][1]["cached"])
+        json.dumps(report)  # The report must be serializable as-is
+
+    def test_error_is_recorded_and_reraised(self):
+        recorder = RunRecorder()
+        with self.assertRaises(ValueError):
+            with recorder.stage("validate"):
+                raise ValueError("bad")
+        self.assertEqual(recorder.records[0]["error"], "ValueError: bad")
+        self.assertIn("wall", recorder.records[0])
+
+    def test_memory_peak_propagates_to_parent(self):
+        recorder = RunRecorder(trace_memory=True)
+        try:
+            with recorder.stage("outer"):
+                with recorder.stage("inner"):
+                    blob = bytearray(2 * 1024 * 1024)
+                    del blob
+        finally:
+            recorder.close()
+        outer = recorder.records[0]
+        inner = outer["children"][0]
+        self.assertGreaterEqual(inner["py_peak_kb"], 2000)
+        self.assertGreaterEqual(outer["py_peak_kb"], inner["py_peak_kb"])
+        self.assertLess(inner["py_delta_kb"], 100)
+
+    def test_background_thread_stages_are_top_level(self):
+        recorder = RunRecorder()
+        with recorder.stage("chapter"):
+            def run():
+                with recorder.stage("sanity.prefetch"):
+                    pass
+            worker = threading.Thread(target=run, name="prefetch")
+            worker.start()
+            worker.join()
+        names = [r["name"] for r in recorder.records]
+        self.assertEqual(sorted(names), ["chapter", "sanity.prefetch"])
+        prefetch = next(r for r in recorder.records if r["name"] == "sanity.prefetch")
+        self.assertEqual(prefetch["thread"], "prefetch")
+
+    def test_module_stage_is_a_noop_without_recorder(self):
+        self.assertIsNone(instrument._active)
+        with stage("llm") as record:
+            self.assertIsNone(record)
+
+    def test_save_writes_report_in_the_state_folder(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "book_chapter_summaries.json")
+            path = RunRecorder.report_path(output)
+            self.assertEqual(path, os.path.join(tmp, ".state", "book_chapter_summaries.run_report.json"))
+            recorder = RunRecorder()
+            with recorder.stage("save"):
+                pass
+            recorder.save(path, chapters_total=3)
+            with open(path, 'r', encoding='utf-8') as f:
+                self.assertEqual(json.load(f)["chapters_total"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import contextlib
+import io
+from unittest import mock
+
+sys.path.append(os.getcwd())
+
+from pipeline import sanity_uploader
+from pipeline.jobs import JobQueue, LeaseLost
+from pipeline.instrument import RunRecorder
+from scripts.llm_stub import LLMStub
+from scripts.sanity_stub import SanityStub
+from scripts.synthetic_epub import generate_epub
+from scripts import jobs as jobs_cli
+from tests.fakes import FakeClock
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.clock = FakeClock(1000.0)
+        self.queue = JobQueue(os.path.join(self.tmp.name, "jobs.sqlite"), backoff_base=10, clock=self.clock)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_enqueue_is_idempotent_while_unfinished(self):
+        first = self.queue.enqueue("book/a.epub", rating=4)
+        self.assertEqual(self.queue.enqueue("book/a.epub"), first)
+        job = self.queue.claim("w1")
+        self.queue.complete(job["id"], "w1", {"chapters": 3})
+        self.assertNotEqual(self.queue.enqueue("book/a.epub"), first)
+
+    def test_lease_excludes_other_workers_until_it_expires(self):
+        job_id = self.queue.enqueue("book/a.epub")
+        self.assertEqual(self.queue.claim("w1", lease_seconds=60)["id"], job_id)
+        self.assertIsNone(self.queue.claim("w2", lease_seconds=60))
+
+        self.queue.advance(job_id, "w1", "summarizing")
+        self.clock.now += 61  # w1 died without renewing
+        self.assertEqual(self.queue.claim("w2", lease_seconds=60)["id"], job_id)
+        with self.assertRaises(LeaseLost):
+            self.queue.advance(job_id, "w1", "summarized")
+        self.queue.advance(job_id, "w2", "summarized")
+        self.assertEqual(self.queue.get(job_id)["state"], "summarized")
+
+    def test_failures_back_off_exponentially_then_fail(self):
+        job_id = self.queue.enqueue("book/a.epub", max_attempts=3)
+        self.assertTrue(self.queue.fail(self.queue.claim("w")["id"], "w", "timeout"))
+        self.assertIsNone(self.queue.claim("w"))  # Backing off for 10s
+        self.clock.now += 10
+        self.assertTrue(self.queue.fail(self.queue.claim("w")["id"], "w", "timeout"))
+        self.clock.now += 19
+        self.assertIsNone(self.queue.claim("w"))  # Second delay is 20s
+        self.clock.now += 1
+        self.assertFalse(self.queue.fail(self.queue.claim("w")["id"], "w", "timeout"))
+
+        job = self.queue.get(job_id)
+        self.assertEqual((job["state"], job["attempts"], job["last_error"]), ("failed", 3, "timeout"))
+        self.assertEqual(self.queue.counts()["failed"], 1)
+        self.assertTrue(self.queue.retry(job_id))
+        self.assertEqual(self.queue.claim("w")["state"], "queued")
+
+
+class TestWorker(unittest.TestCase):
+    def test_worker_runs_jobs_through_the_pipeline_stages(self):
+        stub = LLMStub(time_scale=0, seed=1).start()
+        original_project = sanity_uploader.PROJECT_ID
+        sanity_uploader.PROJECT_ID = None  # Uploads off: jobs finish at "validated"
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                queue = JobQueue(os.path.join(tmp, "jobs.sqlite"))
+                good = os.path.join(tmp, "good.epub")
+                generate_epub(good, spine_files=2, toc_depth=1, target_kb=8, title="Queued Book")
+                broken = os.path.join(tmp, "broken.epub")
+                with open(broken, 'w') as f:
+                    f.write("not a zip")
+                good_id = queue.enqueue(good, rating=3)
+                broken_id = queue.enqueue(broken)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    processed = jobs_cli.work(queue, "test-worker", os.path.join(tmp, "output"),
+                                              ["--model-url", stub.url, "--model-name", "stub"], once=True)
+
+                self.assertEqual(processed, 2)
+                job = queue.get(good_id)
+                self.assertEqual(job["state"], "validated")
+                self.assertIsNotNone(job["finished_at"])
+                self.assertEqual(json.loads(job["result"])["chapters"], 2)
+                self.assertEqual(queue.get(broken_id)["state"], "failed")
+                self.assertEqual(queue.get(broken_id)["attempts"], 1)  # Unreadable EPUBs aren't retried
+                self.assertTrue(os.path.exists(os.path.join(tmp, "output", "logs", f"job-{good_id}.log")))
+        finally:
+            sanity_uploader.PROJECT_ID = original_project
+            stub.stop()
+
+    def test_failed_upload_fails_the_job_and_reports_count_only_their_own_book(self):
+        llm = LLMStub(time_scale=0, seed=1).start()
+        sanity = SanityStub().start()
+        sanity.fail_next(100, status=400, endpoint="/data/mutate/")
+        try:
+            with tempfile.TemporaryDirectory() as tmp, \
+                    mock.patch.multiple(sanity_uploader, PROJECT_ID="test", API_TOKEN="secret", API_HOST=sanity.url):
+                queue = JobQueue(os.path.join(tmp, "jobs.sqlite"))
+                job_ids = []
+                for title in ("First Book", "Second Book"):
+                    path = os.path.join(tmp, f"{title}.epub")
+                    generate_epub(path, spine_files=2, toc_depth=1, target_kb=8, title=title)
+                    job_ids.append(queue.enqueue(path, max_attempts=1))
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    jobs_cli.work(queue, "test-worker", os.path.join(tmp, "output"),
+                                  ["--model-url", llm.url, "--model-name", "stub"], once=True)
+
+                for job_id in job_ids:
+                    job = queue.get(job_id)
+                    self.assertEqual((job["state"], job["last_error"]), ("failed", "Sanity upload failed"))
+                    result = json.loads(job["result"])
+                    self.assertEqual(result["upload"], "failed")
+                    with open(RunRecorder.report_path(result["output"]), 'r', encoding='utf-8') as f:
+                        report = json.load(f)
+                    # The worker's metrics keep growing; each report only counts its own book
+                    self.assertEqual(sum(report["metrics"]["epub_chapters_processed_total"].values()), 2)
+        finally:
+            llm.stop()
+            sanity.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
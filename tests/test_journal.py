@@ -0,0 +1,79 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from pipeline.journal import ChapterJournal
+
+
+class TestChapterJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        output_path = os.path.join(self.tmp.name, "book_chapter_summaries.json")
+        self.journal = ChapterJournal(ChapterJournal.path_for(output_path))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_path_sits_next_to_output(self):
+        self.assertTrue(self.journal.path.endswith("book_chapter_summaries.journal.jsonl"))
+
+    def test_last_record_wins_and_torn_line_is_ignored(self):
+        self.journal.append_book({"title": "Book"}, rating=4.5)
+        self.journal.append_chapter(1, {"title": "Two", "fingerprint": "b", "summary": "Second.", "content": ""})
+        self.journal.append_chapter(0, {"title": "One", "fingerprint": "a", "summary": "Old.", "content": ""})
+        self.journal.append_chapter(0, {"title": "One", "fingerprint": "a", "summary": "New.", "content": ""})
+        self.journal.append_book({"title": "Book"}, rating=4.5, book_description="Desc.")
+        with open(self.journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"type": "chapter", "fingerpr')
+
+        book, chapters = self.journal.load()
+
+        self.assertEqual(book["bookDescription"], "Desc.")
+        self.assertEqual(chapters[(0, "a")]["summary"], "New.")
+        self.assertEqual([c["title"] for c in self.journal.chapters_in_order()], ["One", "Two"])
+
+    def test_edited_chapter_is_materialized_once_per_position(self):
+        self.journal.append_chapter(0, {"title": "One", "fingerprint": "a", "summary": "First.", "content": ""})
+        self.journal.append_chapter(1, {"title": "Two", "fingerprint": "b1", "summary": "Old.", "content": ""})
+        # Chapter two was edited (new fingerprint) and summarized again on a later run
+        self.journal.append_chapter(1, {"title": "Two", "fingerprint": "b2", "summary": "New.", "content": ""})
+
+        chapters = self.journal.chapters_in_order()
+
+        self.assertEqual([(c["title"], c["summary"]) for c in chapters], [("One", "First."), ("Two", "New.")])
+
+        # Reverting the edit brings the original fingerprint back as the latest record
+        self.journal.append_chapter(1, {"title": "Two", "fingerprint": "b1", "summary": "Reverted.", "content": ""})
+        self.assertEqual([c["summary"] for c in self.journal.chapters_in_order()], ["First.", "Reverted."])
+
+    def test_identical_chapters_keep_separate_checkpoints(self):
+        self.journal.append_chapter(0, {"title": "Part One", "fingerprint": "empty", "summary": "", "content": ""})
+        self.journal.append_chapter(2, {"title": "Part Two", "fingerprint": "empty", "summary": "", "content": ""})
+        _, chapters = self.journal.load()
+        self.assertEqual(chapters[(0, "empty")]["title"], "Part One")
+        self.assertEqual(chapters[(2, "empty")]["title"], "Part Two")
+
+    def test_append_after_a_torn_line_starts_a_new_record(self):
+        self.journal.append_chapter(0, {"title": "One", "fingerprint": "a", "summary": "S.", "content": ""})
+        with open(self.journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"type": "chapter", "fingerpr')  # Crash mid-write
+
+        resumed = ChapterJournal(self.journal.path)
+        resumed.append_chapter(1, {"title": "Two", "fingerprint": "b", "summary": "T.", "content": ""})
+
+        _, chapters = resumed.load()
+        self.assertEqual(sorted(chapters), [(0, "a"), (1, "b")])
+        with open(self.journal.path, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+    def test_reset_discards_progress(self):
+        self.journal.append_chapter(0, {"title": "One", "fingerprint": "a", "summary": "S.", "content": ""})
+        self.journal.reset()
+        self.assertEqual(self.journal.load(), ({}, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
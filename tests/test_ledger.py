@@ -0,0 +1,66 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from pipeline.ledger import Ledger, percentile
+from pipeline.summarizer import Summarizer
+from scripts.llm_stub import LLMStub
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = Ledger(os.path.join(self.tmp.name, "llm_ledger.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_percentile_is_nearest_rank(self):
+        values = [float(v) for v in range(1, 11)]
+        self.assertEqual(percentile(values, 50), 5.0)
+        self.assertEqual(percentile(values, 90), 9.0)
+        self.assertEqual(percentile(values, 99), 10.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_aggregate_skips_failed_calls_for_tokens_and_latency(self):
+        for latency in (1.0, 2.0, 3.0):
+            self.ledger.record("summary", book="A", model="m", prompt_tokens=100, completion_tokens=10, latency=latency)
+        self.ledger.record("merge", book="A", model="m", latency=9.0, retries=2, error="APIConnectionError: down")
+        self.ledger.record("summary", book="B", model="m", prompt_tokens=50, completion_tokens=5, latency=0.5)
+
+        by_book = self.ledger.aggregate("book")
+        self.assertEqual(by_book["A"]["calls"], 4)
+        self.assertEqual(by_book["A"]["errors"], 1)
+        self.assertEqual(by_book["A"]["retries"], 2)
+        self.assertEqual(by_book["A"]["prompt_tokens"], 300)
+        self.assertEqual(by_book["A"]["latency_p50"], 2.0)
+        self.assertEqual(self.ledger.aggregate("model")["m"]["calls"], 5)
+        self.assertEqual(set(self.ledger.aggregate("call", book="A")), {"summary", "merge"})
+
+    def test_summarizer_records_every_call_with_usage(self):
+        stub = LLMStub(time_scale=0, seed=1).start()
+        try:
+            summarizer = Summarizer(model_url=stub.url, model_name="stub", ledger=self.ledger)
+            summarizer.set_context(book="Book", chapter="One")
+            text = " ".join(f"Sentence {i} tells of the river and the town." for i in range(500))
+            summarizer.summarize_chapter(text)
+            summarizer.set_context(book="Book")
+            summarizer.generate_book_description([{"title": "One", "summary": "It rained."}])
+        finally:
+            stub.stop()
+
+        rows = self.ledger.rows(book="Book")
+        self.assertEqual(len(rows), stub.snapshot()["requests"])
+        self.assertEqual([r["call_type"] for r in rows][-2:], ["merge", "description"])
+        self.assertEqual(rows[0]["chapter"], "One")
+        self.assertIsNone(rows[-1]["chapter"])
+        self.assertEqual(sum(r["prompt_tokens"] for r in rows), stub.snapshot()["prompt_tokens"])
+        self.assertTrue(all(r["latency"] is not None and r["retries"] == 0 and not r["cache_hit"] for r in rows))
+        self.assertEqual({r["run_id"] for r in rows}, {self.ledger.run_id})
+
+
+if __name__ == '__main__':
+    unittest.main()
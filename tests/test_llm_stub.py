@@ -0,0 +1,45 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from pipeline.summarizer import Summarizer
+from scripts.llm_stub import LLMStub, classify
+
+
+TEXT = " ".join(f"Sentence number {i} explains how the river shaped the village over time." for i in range(400))
+
+
+class TestLLMStub(unittest.TestCase):
+    def setUp(self):
+        self.stub = LLMStub(time_scale=0, seed=1).start()
+        self.summarizer = Summarizer(model_url=self.stub.url, model_name="stub")
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_summarizer_round_trip_is_deterministic(self):
+        first = self.summarizer.summarize_chapter(TEXT)
+        second = self.summarizer.summarize_chapter(TEXT)
+        self.assertTrue(first)
+        self.assertEqual(first, second)
+        highlights = self.summarizer.extract_highlights(TEXT)
+        self.assertTrue(highlights)
+        self.assertTrue(all(h in TEXT for h in highlights))
+
+        stats = self.stub.snapshot()
+        self.assertEqual(stats["calls"]["merge"], 2)  # One merge per multi-chunk summary
+        self.assertGreater(stats["prompt_tokens"], len(TEXT) // 4)
+
+    def test_classifies_every_summarizer_prompt(self):
+        seen = []
+        original = self.stub.complete
+        self.stub.complete = lambda request: (seen.append(classify(request["messages"], request.get("response_format"))), original(request))[1]
+        self.summarizer.generate_book_description([{"title": "One", "summary": "It rained."}])
+        self.summarizer._consolidate_highlights([f"Highlight {i} is here." for i in range(12)])
+        self.assertEqual(seen, ["description", "consolidate"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import urllib.request
+
+sys.path.append(os.getcwd())
+
+from pipeline import metrics
+from pipeline.metrics import Registry
+from pipeline.sanity_uploader import SanityUploader
+from scripts.sanity_stub import SanityStub
+
+
+class TestMetrics(unittest.TestCase):
+    def test_text_exposition(self):
+        registry = Registry()
+        calls = registry.counter("llm_calls_total", "Calls", ["call"])
+        latency = registry.histogram("llm_latency_seconds", "Latency", ["call"], buckets=(1, 5))
+        calls.inc(call="summary")
+        calls.inc(2, call="summary")
+        for value in (0.5, 3, 30):
+            latency.observe(value, call="summary")
+
+        text = registry.render()
+        self.assertIn("# TYPE llm_calls_total counter", text)
+        self.assertIn('llm_calls_total{call="summary"} 3', text)
+        self.assertIn('llm_latency_seconds_bucket{call="summary",le="1"} 1', text)
+        self.assertIn('llm_latency_seconds_bucket{call="summary",le="5"} 2', text)
+        self.assertIn('llm_latency_seconds_bucket{call="summary",le="+Inf"} 3', text)
+        self.assertIn('llm_latency_seconds_sum{call="summary"} 33.5', text)
+        self.assertEqual(registry.snapshot()["llm_latency_seconds"]["summary"]["count"], 3)
+
+    def test_labels_are_checked_and_gauges_can_be_callbacks(self):
+        registry = Registry()
+        counter = registry.counter("chapters_total", "Chapters", ["status"])
+        with self.assertRaises(ValueError):
+            counter.inc(outcome="ok")
+        with self.assertRaises(ValueError):
+            counter.inc(-1, status="ok")
+        self.assertIs(registry.counter("chapters_total", "Chapters", ["status"]), counter)
+
+        depth = registry.gauge("queue_depth", "Depth")
+        pending = [1, 2, 3]
+        depth.set_function(lambda: len(pending))
+        pending.append(4)
+        self.assertEqual(registry.snapshot()["queue_depth"], 4)
+        self.assertIn("queue_depth 4", registry.render())
+
+    def test_snapshot_since_a_checkpoint_counts_only_later_values(self):
+        registry = Registry()
+        chapters = registry.counter("chapters_total", "Chapters", ["status"])
+        latency = registry.histogram("latency_seconds", "Latency", ["call"], buckets=(1, 5))
+        depth = registry.gauge("queue_depth", "Depth")
+        chapters.inc(3, status="summarized")
+        latency.observe(2, call="summary")
+        depth.set(7)
+
+        start = registry.checkpoint()
+        chapters.inc(status="summarized")
+        chapters.inc(status="failed")
+        latency.observe(4, call="summary")
+
+        snapshot = registry.snapshot(since=start)
+        self.assertEqual(snapshot["chapters_total"], {"summarized": 1, "failed": 1})
+        self.assertEqual(snapshot["latency_seconds"]["summary"], {"count": 1, "sum": 4.0, "mean": 4.0})
+        self.assertEqual(snapshot["queue_depth"], 7)
+        self.assertEqual(registry.snapshot()["chapters_total"], {"summarized": 4, "failed": 1})
+
+    def test_http_endpoint_serves_registry(self):
+        registry = Registry()
+        registry.gauge("in_flight", "In flight").set(2)
+        server = metrics.start_http_server(0, registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn("in_flight 2", response.read().decode("utf-8"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_uploader_records_sanity_latency(self):
+        stub = SanityStub().start()
+        try:
+            before = metrics.SANITY_LATENCY.snapshot().get("query,200", {}).get("count", 0)
+            uploader = SanityUploader(project_id="test", api_token="token", api_host=stub.url, asset_map_path=os.devnull)
+            uploader.fetch_document("book-review-missing")
+            after = metrics.SANITY_LATENCY.snapshot()["query,200"]["count"]
+            self.assertEqual(after, before + 1)
+        finally:
+            stub.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
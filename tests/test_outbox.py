@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import requests
+
+sys.path.append(os.getcwd())
+
+from pipeline.outbox import Outbox
+from pipeline.sanity_uploader import SanityUploader, is_transient_error
+from scripts.sanity_stub import SanityStub
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.stub = SanityStub().start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(os.path.join(self.tmp.name, "outbox.sqlite"))
+
+    def tearDown(self):
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def uploader(self, **kwargs):
+        return SanityUploader(project_id="test", api_token="secret", api_host=self.stub.url,
+                              timeout=5, max_retries=0, backoff_factor=0.01,
+                              asset_map_path=os.path.join(self.tmp.name, "assets.json"), **kwargs)
+
+    def test_deferred_upload_is_queued_then_replayed_once(self):
+        uploader = self.uploader(outbox=self.outbox, defer=True)
+        book = {"_id": "book-review-x", "_type": "bookReview", "title": "X", "yourRating": 4}
+        batch = uploader.batch()
+        uploader.upload_book_review(dict(book), batch=batch)
+        uploader.create_update_log("X", "x", batch=batch)
+        results = batch.flush()
+        uploader.outbox.enqueue_cover("book-review-x", b"cover-bytes")
+
+        self.assertEqual(self.stub.requests, [])
+        self.assertTrue(results[0]["queued"])
+        mutations = json.loads(self.outbox.pending()[0]["payload"])["mutations"]
+        self.assertEqual(mutations[0], {"createIfNotExists": book})
+        self.assertEqual(mutations[1]["patch"]["set"], {"title": "X"})
+        self.assertEqual(mutations[1]["patch"]["setIfMissing"], {"yourRating": 4})
+        self.assertIn("create", mutations[2])
+
+        sent, failed = self.outbox.replay(self.uploader())
+        self.assertEqual((sent, failed), (2, 0))
+        self.assertEqual(self.stub.stats["uploads"], 1)
+        self.assertTrue(all(p.get("transactionId", "").startswith("outbox-") for p in self.stub.mutate_payloads))
+        cover = self.stub.documents["book-review-x"]["coverImage"]["asset"]["_ref"]
+        self.assertEqual(cover, next(iter(self.stub.assets.values()))["_id"])
+        self.assertEqual(self.outbox.stats()["pending"], 0)
+        self.assertEqual(self.outbox.replay(self.uploader()), (0, 0))
+
+    def test_transient_failure_is_queued_but_client_errors_are_not(self):
+        uploader = self.uploader(outbox=self.outbox)
+        self.stub.fail_next(1, status=503)
+        self.assertIsNone(uploader.patch_document("book-review-a", {"title": "A"}))
+        self.stub.fail_next(1, status=400)
+        self.assertIsNone(uploader.patch_document("book-review-b", {"title": "B"}))
+        pending = self.outbox.pending()
+        self.assertEqual([row["label"] for row in pending], ["book-review-a"])
+        # Queued under the transactionId the failed attempt already carried
+        self.assertEqual(pending[0]["idempotency_key"], self.stub.mutate_payloads[0]["transactionId"])
+
+    def test_deferred_batch_queues_each_book_under_its_own_label(self):
+        uploader = self.uploader(outbox=self.outbox, defer=True)
+        batch = uploader.batch()
+        for slug in ("a", "b"):
+            uploader.patch_document(f"book-review-{slug}", {"title": slug}, batch=batch)
+        results = batch.flush()
+        self.assertEqual([r["labels"] for r in results], [["book-review-a"], ["book-review-b"]])
+        self.assertEqual([row["label"] for row in self.outbox.pending()], ["book-review-a", "book-review-b"])
+
+    def test_failed_multi_book_transaction_replays_before_each_books_later_writes(self):
+        for slug in ("a", "b"):
+            self.stub.documents[f"book-review-{slug}"] = {"_id": f"book-review-{slug}", "_type": "bookReview"}
+        uploader = self.uploader(outbox=self.outbox)
+        batch = uploader.batch()
+        uploader.patch_document("book-review-a", {"title": "A"}, batch=batch)
+        uploader.patch_document("book-review-b", {"title": "B"}, batch=batch)
+        self.stub.fail_next(1, status=503)
+        results = batch.flush()
+        self.outbox.enqueue([{"patch": {"id": "book-review-b", "set": {"title": "B2"}}}], label="book-review-b")
+
+        # One entry under the transactionId that may have committed, not one per book
+        self.assertTrue(results[0]["queued"])
+        self.assertEqual([row["label"] for row in self.outbox.pending()], ["book-review-a book-review-b", "book-review-b"])
+        self.assertEqual(self.outbox.replay(self.uploader(), concurrency=2), (2, 0))
+        self.assertEqual(self.stub.documents["book-review-b"]["title"], "B2")
+
+    def test_only_network_errors_and_retryable_statuses_are_transient(self):
+        self.assertTrue(is_transient_error(requests.ConnectionError("refused")))
+        self.assertTrue(is_transient_error(requests.Timeout("read timed out")))
+        self.assertFalse(is_transient_error(ValueError("bad JSON")))
+        self.assertFalse(is_transient_error(KeyError("transactionId")))
+
+    def test_repeated_write_is_stored_once_but_a_b_a_keeps_its_order(self):
+        self.stub.documents["book-review-a"] = {"_id": "book-review-a", "_type": "bookReview"}
+        a = [{"patch": {"id": "book-review-a", "set": {"title": "A"}}}]
+        b = [{"patch": {"id": "book-review-a", "set": {"title": "B"}}}]
+        first = self.outbox.enqueue(a, label="book-review-a")
+        self.assertEqual(self.outbox.enqueue(a, label="book-review-a"), first)
+        self.outbox.enqueue(b, label="book-review-a")
+        self.assertNotEqual(self.outbox.enqueue(a, label="book-review-a"), first)
+        self.assertEqual(self.outbox.stats()["total"], 3)
+
+        self.assertEqual(self.outbox.replay(self.uploader()), (3, 0))
+        self.assertEqual(self.stub.documents["book-review-a"]["title"], "A")
+
+    def test_replay_keeps_per_document_order_and_stops_at_failure(self):
+        self.stub.documents["book-review-a"] = {"_id": "book-review-a", "_type": "bookReview"}
+        for i in range(3):
+            self.outbox.enqueue([{"patch": {"id": "book-review-a", "set": {"n": i}}}], label="book-review-a")
+        self.stub.fail_next(1, status=500)
+        self.assertEqual(self.outbox.replay(self.uploader(), concurrency=1), (0, 3))
+        self.assertEqual(len(self.stub.mutate_payloads), 1)
+        self.assertEqual(self.outbox.pending()[0]["attempts"], 1)
+
+        # The first write did commit (only its response was lost): Sanity answers 409
+        # "transaction ID already used", which counts as sent
+        self.stub.transaction_ids.add(self.outbox.pending()[0]["idempotency_key"])
+        self.assertEqual(self.outbox.replay(self.uploader(), concurrency=1), (3, 0))
+        payloads = self.stub.mutate_payloads[1:]
+        self.assertEqual([p["mutations"][0]["patch"]["set"]["n"] for p in payloads], [0, 1, 2])
+        self.assertEqual(len({p["transactionId"] for p in payloads}), 3)
+        self.assertEqual(self.stub.documents["book-review-a"]["n"], 2)
+
+    def test_other_conflicts_stay_pending_and_are_reported(self):
+        self.stub.documents["book-review-a"] = {"_id": "book-review-a", "_type": "bookReview", "_rev": "r2"}
+        self.outbox.enqueue([{"patch": {"id": "book-review-a", "ifRevisionID": "r1", "set": {"n": 1}}}],
+                            label="book-review-a")
+        self.assertEqual(self.outbox.replay(self.uploader()), (0, 1))
+        row = self.outbox.pending()[0]
+        self.assertEqual(row["attempts"], 1)
+        self.assertIn("409", row["last_error"])
+        self.assertNotIn("n", self.stub.documents["book-review-a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import random
+
+sys.path.append(os.getcwd())
+
+from pipeline.output import JSONFormatter, StructureBuilder
+from pipeline.utils import chapter_fingerprint, match_by_fingerprint
+from main import load_existing_progress, previous_summaries
+
+
+def reference_build_structure(chapters):
+    """The original two-pass (scan-ahead) classification, kept as an oracle."""
+    part_indices = set()
+    for i, ch in enumerate(chapters):
+        if not ch.get('is_parent', False):
+            continue
+        current_level = ch.get('level', 1)
+        has_direct_children = False
+        all_children_are_leaves = True
+        j = i + 1
+        while j < len(chapters):
+            next_level = chapters[j].get('level', 1)
+            if next_level <= current_level:
+                break
+            if next_level == current_level + 1:
+                has_direct_children = True
+                if chapters[j].get('is_parent', False):
+                    all_children_are_leaves = False
+                    break
+            j += 1
+        if has_direct_children and all_children_are_leaves:
+            part_indices.add(i)
+
+    structure = []
+    current_part = None
+    current_part_level = None
+    for i, ch in enumerate(chapters):
+        level = ch.get('level', 1)
+        if current_part and current_part_level is not None and level <= current_part_level:
+            current_part = None
+            current_part_level = None
+        if i in part_indices:
+            current_part = ("part", ch['title'], [])
+            current_part_level = level
+            structure.append(current_part)
+        elif current_part and level > current_part_level:
+            current_part[2].append(("chapter", ch['title']))
+        else:
+            structure.append(("chapter", ch['title']))
+    return structure
+
+
+def shape(structure):
+    """Reduces builder output to the tuples produced by the reference builder."""
+    result = []
+    for item in structure:
+        if item['_type'] == 'part':
+            result.append(("part", item['partTitle'], [("chapter", c['chapterTitle']) for c in item['chapters']]))
+        else:
+            result.append(("chapter", item['chapterTitle']))
+    return result
+
+
+def random_toc(rng, size, max_depth):
+    """Flat TOC with plausible level jumps; is_parent mirrors whether the next item is deeper."""
+    levels = [1]
+    for _ in range(size - 1):
+        levels.append(rng.randint(1, min(levels[-1] + rng.choice([1, 1, 2]), max_depth)))
+    toc = []
+    for i, level in enumerate(levels):
+        is_parent = i + 1 < len(levels) and levels[i + 1] > level
+        if rng.random() < 0.05:
+            is_parent = not is_parent  # Malformed TOCs happen
+        toc.append({"title": f"T{i}", "level": level, "is_parent": is_parent, "summary": "", "content": ""})
+    return toc
+
+
+class TestStructureBuilder(unittest.TestCase):
+    def test_parts_with_leaf_children(self):
+        toc = [
+            {"title": "Intro", "level": 1},
+            {"title": "Part I", "level": 1, "is_parent": True},
+            {"title": "Ch 1", "level": 2},
+            {"title": "Ch 2", "level": 2},
+            {"title": "Epilogue", "level": 1},
+        ]
+        self.assertEqual(shape(JSONFormatter.build_structure(toc)), [
+            ("chapter", "Intro"),
+            ("part", "Part I", [("chapter", "Ch 1"), ("chapter", "Ch 2")]),
+            ("chapter", "Epilogue"),
+        ])
+
+    def test_matches_reference_on_synthetic_shapes(self):
+        rng = random.Random(1234)
+        for size in (0, 1, 2, 5, 20, 200):
+            for max_depth in (1, 2, 3, 5):
+                for _ in range(25):
+                    toc = random_toc(rng, size, max_depth) if size else []
+                    self.assertEqual(shape(JSONFormatter.build_structure(toc)), reference_build_structure(toc))
+
+    def test_incremental_structure_only_holds_decided_prefix(self):
+        builder = StructureBuilder()
+        builder.add({"title": "Part I", "level": 1, "is_parent": True})
+        builder.add({"title": "Ch 1", "level": 2})
+        self.assertEqual(builder.structure, [])
+        builder.add({"title": "Part II", "level": 1, "is_parent": True})
+        self.assertEqual(shape(builder.structure), [("part", "Part I", [("chapter", "Ch 1")])])
+        builder.add({"title": "Ch 2", "level": 2})
+        self.assertEqual(shape(builder.finish()), [
+            ("part", "Part I", [("chapter", "Ch 1")]),
+            ("part", "Part II", [("chapter", "Ch 2")]),
+        ])
+
+
+class TestDeterministicKeys(unittest.TestCase):
+    def build(self, second_summary="Second chapter.\n\nMore of it."):
+        toc = [
+            {"title": "Part I", "level": 1, "is_parent": True, "fingerprint": "p1", "summary": "", "content": ""},
+            {"title": "Ch 1", "level": 2, "fingerprint": "c1", "summary": "First para.\n\nSecond para."},
+            {"title": "Ch 2", "level": 2, "fingerprint": "c2", "summary": second_summary},
+            {"title": "Ch 2", "level": 1, "fingerprint": "c2", "summary": "Duplicate fingerprint."},
+        ]
+        return JSONFormatter.build_structure(toc)
+
+    def test_rebuilding_unchanged_content_gives_identical_output(self):
+        self.assertEqual(self.build(), self.build())
+
+    def test_keys_are_unique_and_only_changed_blocks_get_new_keys(self):
+        before = self.build()
+        after = self.build(second_summary="Second chapter.\n\nRewritten ending.")
+        keys = [before[0]["_key"], before[1]["_key"]] + [c["_key"] for c in before[0]["chapters"]]
+        self.assertEqual(len(keys), len(set(keys)))
+
+        old_blocks = before[0]["chapters"][1]["chapterSummary"]
+        new_blocks = after[0]["chapters"][1]["chapterSummary"]
+        self.assertEqual(old_blocks[0]["_key"], new_blocks[0]["_key"])
+        self.assertNotEqual(old_blocks[1]["_key"], new_blocks[1]["_key"])
+        self.assertEqual(before[0]["chapters"][0], after[0]["chapters"][0])
+
+
+class TestChapterFingerprints(unittest.TestCase):
+    def test_fingerprint_ignores_whitespace_only_changes(self):
+        a = chapter_fingerprint("It was a dark\n\nand stormy night.", "llama3", "1")
+        b = chapter_fingerprint("  It was a dark and   stormy night. ", "llama3", "1")
+        self.assertEqual(a, b)
+
+    def test_fingerprint_changes_with_content_model_and_prompt(self):
+        base = chapter_fingerprint("Call me Ishmael.", "llama3", "1")
+        self.assertNotEqual(base, chapter_fingerprint("Call me Ahab.", "llama3", "1"))
+        self.assertNotEqual(base, chapter_fingerprint("Call me Ishmael.", "mistral", "1"))
+        self.assertNotEqual(base, chapter_fingerprint("Call me Ishmael.", "llama3", "2"))
+
+    def test_sidecar_records_only_completed_chapters(self):
+        chapters = [
+            {"title": "One", "summary": "Done.", "fingerprint": "aaa"},
+            {"title": "Two", "summary": "Summary generation failed (Error).", "fingerprint": "bbb", "failed": True},
+            {"title": "Three", "fingerprint": "ccc"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "book_chapter_summaries.json")
+            JSONFormatter.save_fingerprints(chapters, output_path)
+            self.assertEqual(JSONFormatter.load_fingerprints(output_path), {(0, "aaa"): "One"})
+            # Kept out of the output folder itself, where every *.json is taken for a review
+            self.assertEqual([f for f in os.listdir(tmp) if f.endswith('.json')], [])
+
+    def test_identical_chapters_keep_their_own_previous_work(self):
+        blank = chapter_fingerprint("", "llama3", "1")
+        boilerplate = chapter_fingerprint("Also by this author.", "llama3", "1")
+        story = chapter_fingerprint("Call me Ishmael.", "llama3", "1")
+        previous = {(0, blank): "Part One", (1, story): "Loomings", (2, blank): "Part Two",
+                    (3, boilerplate): "Afterword A", (4, boilerplate): "Afterword B"}
+        # A new front-matter section shifts everything by one position
+        chapters = [{"fingerprint": fp} for fp in (chapter_fingerprint("Epigraph.", "llama3", "1"),
+                                                   blank, story, blank, boilerplate, boilerplate)]
+        matched = match_by_fingerprint(chapters, previous)
+        # The unique chapter follows its content; the identical ones are never paired up by guesswork
+        self.assertEqual(matched, {2: "Loomings", 4: "Afterword B"})
+
+    def test_legacy_sidecar_matches_unique_fingerprints_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "book_chapter_summaries.json")
+            # Old runs kept a {fingerprint: title} sidecar next to the output JSON
+            with open(os.path.join(tmp, "book_chapter_summaries.fingerprints.json"), 'w', encoding='utf-8') as f:
+                json.dump({"chapters": {"aaa": "One"}}, f)
+            previous = JSONFormatter.load_fingerprints(output_path)
+            self.assertEqual(match_by_fingerprint([{"fingerprint": "zzz"}, {"fingerprint": "aaa"}], previous), {1: "One"})
+            self.assertEqual(match_by_fingerprint([{"fingerprint": "aaa"}, {"fingerprint": "aaa"}], previous), {})
+
+
+class TestResumeFromOutput(unittest.TestCase):
+    def _book(self):
+        return [
+            {"title": "Part I", "level": 1, "is_parent": True, "fingerprint": "p1", "summary": "", "content": ""},
+            {"title": "Introduction", "level": 2, "fingerprint": "i1", "summary": "Sets up part one."},
+            {"title": "Chapter 1", "level": 2, "fingerprint": "c1", "summary": "First chapter."},
+            {"title": "Part II", "level": 1, "is_parent": True, "fingerprint": "p2", "summary": "", "content": ""},
+            {"title": "Introduction", "level": 2, "fingerprint": "i2", "summary": "Sets up part two."},
+            {"title": "Chapter 2", "level": 2, "fingerprint": "c2", "summary": "Second chapter."},
+        ]
+
+    def test_repeated_titles_keep_their_own_summary(self):
+        chapters = self._book()
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "book_chapter_summaries.json")
+            JSONFormatter.save({"title": "Book"}, chapters, output_path)
+            summaries = load_existing_progress(output_path)[0]
+            fingerprints = JSONFormatter.load_fingerprints(output_path)
+
+        self.assertEqual([title for title, _ in summaries], [ch["title"] for ch in chapters])
+        found = previous_summaries(chapters, summaries, fingerprints)
+        self.assertEqual(found, {1: "Sets up part one.", 2: "First chapter.",
+                                 4: "Sets up part two.", 5: "Second chapter."})
+
+        # An edited introduction is redone instead of borrowing the other part's summary
+        chapters[4] = dict(chapters[4], fingerprint="i2-edited")
+        self.assertNotIn(4, previous_summaries(chapters, summaries, fingerprints))
+
+    def test_output_without_fingerprints_matches_by_title(self):
+        summaries = [("One", "Done."), ("Two", "")]
+        chapters = [{"title": "Two"}, {"title": "One"}]
+        self.assertEqual(previous_summaries(chapters, summaries, {}), {1: "Done."})
+
+
+if __name__ == '__main__':
+    unittest.main()
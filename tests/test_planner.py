@@ -0,0 +1,93 @@
+import unittest
+import sys
+import os
+import json
+import subprocess
+import tempfile
+
+sys.path.append(os.getcwd())
+
+from pipeline.planner import CallHistory, plan_book, format_plan, estimate_tokens, PROMPT_OVERHEAD_CHARS
+from scripts.synthetic_epub import generate_epub
+
+
+class FixedChunker:
+    """Splits text into 1000-char chunks, so tests control the chunk count exactly."""
+
+    def chunk(self, text):
+        return [text[i:i + 1000] for i in range(0, len(text), 1000)] if text else []
+
+
+def call(call_type, prompt_chars, latency, chapter=None, completion_tokens=100, error=None):
+    return {"run_id": "r1", "book": "B", "chapter": chapter, "call_type": call_type, "prompt_chars": prompt_chars,
+            "latency": latency, "completion_tokens": completion_tokens, "error": error}
+
+
+class TestCallHistory(unittest.TestCase):
+    def test_fits_latency_against_prompt_size(self):
+        history = CallHistory([call("summary", 1000, 2.0), call("summary", 2000, 3.0), call("summary", 3000, 4.0),
+                               call("summary", 9000, 99.0, error="timeout")])
+        self.assertAlmostEqual(history.predict("summary", 5000), 6.0)
+        # Call types without history use the fit over every call
+        self.assertAlmostEqual(history.predict("merge", 5000), 6.0)
+        self.assertIsNone(CallHistory().predict("summary", 5000))
+
+    def test_consolidation_rate_by_chunk_count(self):
+        rows = [call("highlights", 1000, 1.0, chapter="One"),
+                call("highlights", 1000, 1.0, chapter="Two"), call("highlights", 1000, 1.0, chapter="Two"),
+                call("consolidate", 1000, 1.0, chapter="Two")]
+        history = CallHistory(rows)
+        self.assertFalse(history.consolidates(1))
+        self.assertTrue(history.consolidates(2))
+        self.assertTrue(history.consolidates(6))  # Nearest known chunk count
+
+
+class TestPlanBook(unittest.TestCase):
+    def test_counts_calls_like_the_summarizer(self):
+        chapters = [
+            {"title": "Short", "content": "a" * 800, "fingerprint": "f1"},
+            {"title": "Medium", "content": "b" * 2500, "fingerprint": "f2"},  # 3 chunks: merged
+            {"title": "Long", "content": "c" * 5000, "fingerprint": "f3"},  # 5 chunks: not merged
+            {"title": "Done", "content": "d" * 5000, "fingerprint": "f4"},
+            {"title": "Blank", "content": "  ", "fingerprint": "f5"},
+        ]
+        history = CallHistory([call("summary", 1000, 2.0), call("summary", 2000, 3.0), call("summary", 3000, 4.0)])
+        plan = plan_book(chapters, FixedChunker(), cached={3}, history=history)
+
+        counts = {call_type: t["calls"] for call_type, t in plan["calls"].items()}
+        self.assertEqual(counts, {"summary": 9, "merge": 1, "highlights": 9, "consolidate": 2, "description": 1})
+        self.assertEqual([row["calls"] for row in plan["chapters"]], [2, 8, 11, 0, 0])
+        self.assertTrue(plan["chapters"][3]["cached"])
+        self.assertEqual(plan["chapters"][0]["prompt_tokens"],
+                         estimate_tokens(PROMPT_OVERHEAD_CHARS["summary"] + 800) + estimate_tokens(PROMPT_OVERHEAD_CHARS["highlights"] + 800))
+        self.assertEqual(plan["total_calls"], 22)
+        self.assertGreater(plan["wall_seconds"], 0)
+        self.assertIn("Projected LLM time", format_plan(plan))
+
+        no_history = plan_book(chapters, FixedChunker(), needs_description=False)
+        self.assertIsNone(no_history["wall_seconds"])
+        self.assertEqual(no_history["calls"]["description"]["calls"], 0)
+        self.assertIn("no time estimate", format_plan(no_history))
+
+    def test_plan_mode_never_calls_the_llm(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            epub = os.path.join(tmp, "book.epub")
+            generate_epub(epub, spine_files=3, toc_depth=1, target_kb=30, title="Planned Book")
+            output_dir = os.path.join(tmp, "output")
+            result_path = os.path.join(tmp, "plan.json")
+            # Nothing listens on this URL; any LLM call would fail the run
+            proc = subprocess.run([sys.executable, "main.py", epub, "--plan", "--output-dir", output_dir,
+                                   "--model-url", "http://127.0.0.1:9/v1", "--result-json", result_path],
+                                  capture_output=True, text=True, stdin=subprocess.DEVNULL, timeout=120)
+            self.assertEqual(proc.returncode, 0, proc.stdout + proc.stderr)
+            self.assertIn("Call type", proc.stdout)
+            with open(result_path, 'r', encoding='utf-8') as f:
+                plan = json.load(f)
+            self.assertEqual(plan["title"], "Planned Book")
+            self.assertEqual(len(plan["chapters"]), 3)
+            self.assertGreater(plan["total_prompt_tokens"], 0)
+            self.assertFalse(os.path.exists(output_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
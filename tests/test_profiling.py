@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import pstats
+import tempfile
+import contextlib
+import io
+from unittest import mock
+
+sys.path.append(os.getcwd())
+
+import main as pipeline_main
+from pipeline import sanity_uploader
+from pipeline.instrument import RunRecorder
+from pipeline.profiling import Profiler
+from scripts.llm_stub import LLMStub
+from scripts.synthetic_epub import generate_epub
+
+
+def busy_loop(seconds=0.1):
+    import time
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(200))
+    return total
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writes_prof_and_collapsed_files_per_stage(self):
+        profiler = Profiler(self.tmp.name, "book", interval=0.001)
+        with profiler.profile("clean"):
+            busy_loop()
+        written = profiler.close()
+
+        prof = os.path.join(self.tmp.name, "book.profile.clean.prof")
+        collapsed = os.path.join(self.tmp.name, "book.profile.clean.collapsed")
+        self.assertEqual(sorted(written), sorted([prof, collapsed]))
+        functions = {func for (_, _, func) in pstats.Stats(prof).stats}
+        self.assertIn("busy_loop", functions)
+        with open(collapsed, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any("busy_loop (test_profiling.py:" in line for line in lines))
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+
+    def test_recorder_hook_profiles_only_selected_outermost_stages(self):
+        profiler = Profiler(self.tmp.name, "book", stages=["chapter", "llm"], mode="cprofile")
+        recorder = RunRecorder().add_hook(profiler.hook)
+        with recorder.stage("segment"):
+            busy_loop(0.01)
+        for _ in range(2):
+            with recorder.stage("chapter"):
+                with recorder.stage("llm"):
+                    busy_loop(0.01)
+        profiler.close()
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["book.profile.chapter.prof"])
+        stats = pstats.Stats(os.path.join(self.tmp.name, "book.profile.chapter.prof"))
+        calls = [v[1] for (_, _, func), v in stats.stats.items() if func == "busy_loop"]
+        self.assertEqual(calls, [2])  # Both chapters accumulate in one profile
+
+
+class TestProcessBookProfiling(unittest.TestCase):
+    def test_profiles_are_written_when_each_book_finishes(self):
+        stub = LLMStub(time_scale=0, seed=1).start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp, mock.patch.object(sanity_uploader, "PROJECT_ID", None), \
+                    mock.patch("atexit.register") as register:
+                output_dir = os.path.join(tmp, "output")
+                for title in ("First Book", "Second Book"):
+                    path = os.path.join(tmp, f"{title}.epub")
+                    generate_epub(path, spine_files=2, toc_depth=1, target_kb=8, title=title)
+                    args = pipeline_main.build_parser().parse_args(
+                        [path, "--output-dir", output_dir, "--model-url", stub.url, "--model-name", "stub",
+                         "--rating", "0", "--profile=chapter", "--profile-mode", "cprofile"])
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        pipeline_main.process_book(args.input_file, args, interactive=False)
+
+                profiles = sorted(f for f in os.listdir(output_dir) if f.endswith(".profile.chapter.prof"))
+                self.assertEqual(len(profiles), 2)
+                # A long-running worker calls process_book per book; nothing may pile up until exit
+                register.assert_not_called()
+        finally:
+            stub.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from pipeline.provenance import HighlightIndex
+
+
+CHAPTERS = [
+    "The village woke late that winter. Nobody spoke of the river, and the mill stood silent all season long.",
+    "In the city he learned that every kindness has a price, and that the price is usually paid by someone else.",
+    "By spring the river had returned, carrying with it the sound of the mill and the voices of the children.",
+]
+
+
+class TestHighlightIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = HighlightIndex(CHAPTERS)
+
+    def test_locates_verbatim_quote_and_span(self):
+        quote = "every kindness has a price, and that the price is usually paid"
+        match = self.index.locate(quote)
+        self.assertEqual(match["chapter"], 1)
+        self.assertEqual(CHAPTERS[1][match["start"]:match["end"]], quote)
+        self.assertEqual(match["score"], 1.0)
+
+    def test_tolerates_case_and_punctuation_changes(self):
+        match = self.index.locate("By spring, the River had returned -- carrying with it the sound")
+        self.assertEqual(match["chapter"], 2)
+
+    def test_unrelated_text_is_unmatched(self):
+        self.assertIsNone(self.index.locate("Completely unrelated sentence about quantum computing hardware."))
+
+    def test_assign_groups_by_chapter(self):
+        highlights = [
+            "the mill stood silent all season long",
+            "by spring the river had returned, carrying with it the sound of the mill",
+            "Nobody spoke of the river, and the mill stood silent",
+            "An invented insight that appears nowhere in the book text.",
+        ]
+        by_chapter, unmatched = self.index.assign(highlights)
+        self.assertEqual(by_chapter, {0: [highlights[0], highlights[2]], 2: [highlights[1]]})
+        self.assertEqual(unmatched, [highlights[3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import sys
+import os
+import copy
+
+sys.path.append(os.getcwd())
+
+from pipeline.sanity_patch import diff_documents, build_patch_mutations
+from pipeline.utils import text_to_portable_text
+
+
+def chapter(key, summary):
+    return {"_type": "chapter", "_key": key, "chapterTitle": key.upper(),
+            "chapterSummary": text_to_portable_text(summary, key_seed=key)}
+
+
+def book(*chapters, highlights=("H1",)):
+    return {
+        "_type": "bookReview",
+        "_id": "book-review-x",
+        "title": "X",
+        "slug": {"_type": "slug", "current": "x"},
+        "highlightsAndNotes": list(highlights),
+        "bookStructure": [
+            {"_type": "part", "_key": "p1", "partTitle": "Part", "chapters": list(chapters)},
+            chapter("epilogue", "The end."),
+        ],
+    }
+
+
+class TestDiffDocuments(unittest.TestCase):
+    def setUp(self):
+        self.old = book(chapter("a", "One.\n\nTwo."), chapter("b", "Three."))
+        self.old["_rev"] = "rev1"
+        self.old["_updatedAt"] = "2024-01-01"
+        self.old["categories"] = ["studio-only"]
+
+    def test_identical_documents_need_no_mutations(self):
+        new = copy.deepcopy(self.old)
+        del new["_rev"], new["_updatedAt"], new["categories"]
+        self.assertEqual(build_patch_mutations("book-review-x", self.old, new), [])
+
+    def test_changed_paragraph_only_touches_that_chapter(self):
+        new = book(chapter("a", "One.\n\nTwo, revised."), chapter("b", "Three."), highlights=("H1", "H2"))
+        ops = diff_documents(self.old, new)
+        chapter_path = 'bookStructure[_key=="p1"].chapters[_key=="a"].chapterSummary'
+        new_block = new["bookStructure"][0]["chapters"][0]["chapterSummary"][1]
+        old_block_key = self.old["bookStructure"][0]["chapters"][0]["chapterSummary"][1]["_key"]
+        self.assertEqual(ops["set"], {"highlightsAndNotes": ["H1", "H2"]})
+        self.assertEqual(ops["unset"], [f'{chapter_path}[_key=="{old_block_key}"]'])
+        self.assertEqual(ops["insert"], [{"after": f'{chapter_path}[_key=="{self.old["bookStructure"][0]["chapters"][0]["chapterSummary"][0]["_key"]}"]',
+                                          "items": [new_block]}])
+
+    def test_added_and_removed_chapters(self):
+        new = book(chapter("z", "New first."), chapter("a", "One.\n\nTwo."))
+        ops = diff_documents(self.old, new)
+        self.assertEqual(ops["set"], {})
+        self.assertEqual(ops["unset"], ['bookStructure[_key=="p1"].chapters[_key=="b"]'])
+        self.assertEqual(ops["insert"], [{"before": 'bookStructure[_key=="p1"].chapters[_key=="a"]',
+                                          "items": [new["bookStructure"][0]["chapters"][0]]}])
+
+    def test_reordered_array_is_replaced(self):
+        new = book(chapter("b", "Three."), chapter("a", "One.\n\nTwo."))
+        ops = diff_documents(self.old, new)
+        self.assertEqual(list(ops["set"]), ['bookStructure[_key=="p1"].chapters'])
+
+    def test_mutations_are_guarded_by_revision(self):
+        new = book(chapter("a", "One.\n\nTwo."), chapter("b", "Changed."))
+        mutations = build_patch_mutations("book-review-x", self.old, new)
+        self.assertEqual(mutations[0]["patch"]["ifRevisionID"], "rev1")
+        self.assertNotIn("categories", str(mutations))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import copy
+
+sys.path.append(os.getcwd())
+
+from pipeline.output import JSONFormatter
+from pipeline.sanity_uploader import SanityUploader
+from scripts.sanity_stub import SanityStub
+from main import upload_review
+
+
+def review(chapters, **fields):
+    doc = {
+        "_id": "book-review-stub",
+        "_type": "bookReview",
+        "title": "Stub",
+        "slug": {"_type": "slug", "current": "stub"},
+        "yourReview": [],
+        "bookStructure": JSONFormatter.build_structure(chapters),
+    }
+    doc.update(fields)
+    return doc
+
+
+def chapter(n, summary=None, level=1):
+    return {"title": f"Chapter {n}", "level": level, "fingerprint": f"fp{n}", "content": "text " * 50,
+            "summary": summary or f"Summary {n}."}
+
+
+class TestSanityStub(unittest.TestCase):
+    def setUp(self):
+        self.stub = SanityStub(seed=7).start()
+        self.uploader = SanityUploader(project_id="test", api_token="secret", api_host=self.stub.url,
+                                       timeout=5, max_retries=2, backoff_factor=0.01, asset_map_path=None)
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def stored(self):
+        doc = copy.deepcopy(self.stub.documents["book-review-stub"])
+        return {k: v for k, v in doc.items() if k != "_rev"}
+
+    def test_minimal_patch_reproduces_the_new_document(self):
+        self.uploader.upload_book_review(review([chapter(1), chapter(2), chapter(3)]))
+        self.stub.documents["book-review-stub"]["yourReview"] = [{"_type": "block", "_key": "mine"}]
+
+        new = review([chapter(1), chapter(2, "Rewritten."), chapter(4), chapter(3)])
+        self.uploader.upload_book_review(copy.deepcopy(new), minimal_patch=True)
+
+        new["yourReview"] = [{"_type": "block", "_key": "mine"}]
+        self.assertEqual(self.stored(), new)
+        self.assertEqual(self.stub.stats["transactions"], 2)
+
+    def test_unchanged_patch_is_a_success_and_still_logs_the_update(self):
+        self.uploader.upload_book_review(review([chapter(1)]))
+        res, results = upload_review(self.uploader, review([chapter(1)]), {}, minimal_patch=True)
+        self.assertEqual(res, {"noop": True})
+        self.assertTrue(results and all(r["ok"] for r in results))
+        self.assertEqual([d["_type"] for d in self.stub.documents.values()].count("updateLog"), 1)
+
+    def test_stale_revision_aborts_the_whole_transaction(self):
+        self.uploader.upload_book_review(review([chapter(1)]))
+        snapshot = copy.deepcopy(self.stub.documents["book-review-stub"])
+        self.uploader.patch_document("book-review-stub", {"title": "Edited in Studio"})
+
+        self.assertIsNone(self.uploader.upload_book_review(review([chapter(1, "New.")]), existing_doc=snapshot))
+        self.assertEqual(self.stored()["title"], "Edited in Studio")
+
+    def test_stale_prefetch_is_merged_again_and_resent_once(self):
+        self.uploader.upload_book_review(review([chapter(1)]))
+        snapshot = copy.deepcopy(self.stub.documents["book-review-stub"])
+        # Rated in Studio while the book was being summarized
+        self.uploader.patch_document("book-review-stub", {"yourRating": 4.5})
+
+        res, results = upload_review(self.uploader, review([chapter(1, "New.")]), {"existing_doc": snapshot})
+
+        self.assertTrue(res)
+        self.assertTrue(all(r["ok"] for r in results))
+        self.assertEqual(self.stored()["yourRating"], 4.5)
+        self.assertIn("New.", str(self.stored()["bookStructure"]))
+        self.assertEqual(self.stub.stats["transactions"], 3)  # create, Studio edit, resend
+
+    def test_server_side_merge_keeps_editor_fields(self):
+        self.uploader.upload_book_review(review([chapter(1)], yourRating=5.0))
+        mutations = SanityUploader._merge_mutations("book-review-stub", review([chapter(1, "New.")], yourRating=0.0, title="Stub 2"))
+        self.uploader._post_mutations(mutations)
+        stored = self.stored()
+        self.assertEqual(stored["yourRating"], 5.0)
+        self.assertEqual(stored["title"], "Stub 2")
+        self.assertIn("New.", str(stored["bookStructure"]))
+
+    def test_injected_errors_are_retried(self):
+        self.uploader.upload_book_review(review([chapter(1)]))
+        uploader = SanityUploader(project_id="test", api_token="secret", api_host=self.stub.url,
+                                  timeout=5, max_retries=10, backoff_factor=0.001, asset_map_path=None)
+        self.stub.error_rate = 0.3
+        for i in range(10):
+            self.assertIsNotNone(uploader.patch_document("book-review-stub", {"n": i}))
+        self.stub.error_rate = 0.0
+        self.assertEqual(self.stored()["n"], 9)
+        self.assertGreater(self.stub.stats["errors"], 0)
+        self.assertEqual(self.stub.stats["requests"], self.stub.stats["errors"] + 12)  # initial fetch + create, then 10 patches
+
+    def test_scripted_failures_hit_only_the_chosen_endpoint(self):
+        self.uploader.upload_book_review(review([chapter(1)]))
+        self.stub.fail_next(1, status=500, endpoint="/data/mutate/")
+        self.assertIsNotNone(self.uploader.get_document("book-review-stub"))
+        self.assertIsNotNone(self.uploader.patch_document("book-review-stub", {"n": 1}))
+        self.assertEqual(self.stub.stats["errors"], 1)
+        # Both attempts of the retried patch are logged with the same body
+        self.assertEqual(self.stub.mutate_payloads[-2], self.stub.mutate_payloads[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import sys
+import os
+import tempfile
+import hashlib
+
+sys.path.append(os.getcwd())
+
+from pipeline.sanity_uploader import SanityUploader
+from scripts.sanity_stub import SanityStub
+
+
+class TestSanityUploaderSession(unittest.TestCase):
+    def setUp(self):
+        self.stub = SanityStub().start()
+        self.stub.documents["book-review-x"] = {"_id": "book-review-x", "_type": "bookReview", "_rev": "r1"}
+        self.tmp = tempfile.TemporaryDirectory()
+        self.uploader = SanityUploader(project_id="test", api_token="secret", api_host=self.stub.url,
+                                       timeout=5, max_retries=3, backoff_factor=0.01,
+                                       asset_map_path=os.path.join(self.tmp.name, "assets.json"))
+
+    def tearDown(self):
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def test_retries_429_honoring_retry_after(self):
+        self.stub.fail_next(2, status=429)
+        self.assertEqual(self.uploader.get_document("book-review-x")["_id"], "book-review-x")
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertTrue(all(auth == "Bearer secret" for _, _, auth in self.stub.requests))
+
+    def test_retries_mutations_on_5xx(self):
+        self.stub.fail_next(1, status=503)
+        result = self.uploader.patch_document("book-review-x", {"title": "X"})
+        self.assertIn(result["transactionId"], self.stub.transaction_ids)
+        self.assertEqual([m for m, _, _ in self.stub.requests], ["POST", "POST"])
+        self.assertEqual(self.stub.documents["book-review-x"]["title"], "X")
+
+    def test_retry_of_a_committed_mutation_is_not_applied_twice(self):
+        # The first POST commits but its response is lost; the session retries it
+        self.stub.fail_next(1, status=502, endpoint="/data/mutate/", after=True)
+        self.uploader.create_update_log("X", "x")
+        self.assertIsNotNone(self.uploader.patch_document("book-review-x", {"title": "X"}))
+        first, retry = self.stub.mutate_payloads[0], self.stub.mutate_payloads[1]
+        self.assertEqual(first["transactionId"], retry["transactionId"])
+        self.assertEqual(self.stub.stats["transactions"], 2)
+        self.assertEqual(sum(d.get("_type") == "updateLog" for d in self.stub.documents.values()), 1)
+
+    def test_gives_up_after_bounded_retries(self):
+        self.stub.fail_next(10)
+        self.assertIsNone(self.uploader.patch_document("book-review-x", {"title": "X"}))
+        self.assertEqual(len(self.stub.requests), 4)
+
+    def test_identical_cover_is_uploaded_once(self):
+        image = b"\xff\xd8fake-jpeg-bytes"
+        first = self.uploader.upload_image_asset(image)
+        second = self.uploader.upload_image_asset(image)
+        self.assertEqual(second["_id"], first["_id"])
+        self.assertEqual(self.stub.stats["uploads"], 1)
+        # The second call is answered from the local asset map without any request
+        self.assertEqual(len(self.stub.requests), 2)
+        # Replaced in one step: no temp files are left behind
+        self.assertEqual(os.listdir(self.tmp.name), ["assets.json"])
+
+    def test_existing_remote_asset_is_reused(self):
+        image = b"another-image"
+        sha1 = hashlib.sha1(image).hexdigest()
+        self.stub.assets[sha1] = {"_id": f"image-{sha1}-10x10-jpg", "sha1hash": sha1}
+        asset = self.uploader.upload_image_asset(image)
+        self.assertEqual(asset["_id"], f"image-{sha1}-10x10-jpg")
+        self.assertEqual(self.stub.stats["uploads"], 0)
+        self.assertIn(sha1, self.stub.requests[0][1])
+
+    def test_prefetched_document_skips_fetch_and_guards_revision(self):
+        existing = {"_id": "book-review-x", "_rev": "r1", "yourReview": [{"_type": "block"}]}
+        book = {"_id": "book-review-x", "_type": "bookReview", "title": "X", "yourReview": []}
+        self.uploader.upload_book_review(book, existing_doc=existing)
+        self.assertEqual([m for m, _, _ in self.stub.requests], ["POST"])
+        guard, replace = self.stub.mutate_payloads[0]["mutations"]
+        self.assertEqual(guard, {"patch": {"id": "book-review-x", "ifRevisionID": "r1", "set": {}}})
+        self.assertEqual(replace["createOrReplace"]["yourReview"], [{"_type": "block"}])
+
+    def test_batch_packs_many_books_into_capped_transactions(self):
+        batch = self.uploader.batch(max_mutations=5, concurrency=3)
+        for i in range(6):
+            self.stub.documents[f"book-review-b{i}"] = {"_id": f"book-review-b{i}", "_type": "bookReview"}
+            self.uploader.patch_document(f"book-review-b{i}", {"title": f"B{i}"}, batch=batch)
+            self.uploader.create_update_log(f"B{i}", f"b{i}", batch=batch)
+        self.assertEqual(len(batch), 12)
+        self.assertEqual(self.stub.mutate_payloads, [])
+
+        results = batch.flush()
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(r["ok"] for r in results))
+        transactions = [p["mutations"] for p in self.stub.mutate_payloads]
+        self.assertEqual(sorted(len(t) for t in transactions), [4, 4, 4])
+        # A review and its update log are never split across transactions
+        for t in transactions:
+            ids = [m["patch"]["id"] for m in t if "patch" in m]
+            slugs = [m["create"]["targetSlug"] for m in t if "create" in m]
+            self.assertEqual([f"book-review-{s}" for s in slugs], ids)
+
+    def test_batch_reports_failed_transactions(self):
+        batch = self.uploader.batch()
+        self.uploader.patch_document("book-review-x", {"title": "X"}, batch=batch)
+        self.stub.fail_next(10)
+        results = batch.flush()
+        self.assertFalse(results[0]["ok"])
+        self.assertEqual(results[0]["labels"], ["book-review-x"])
+        self.assertEqual(batch.flush(), [])
+
+    def test_rejected_book_does_not_take_the_rest_of_the_batch_down(self):
+        batch = self.uploader.batch()
+        for slug in ("a", "b", "c"):
+            self.stub.documents[f"book-review-{slug}"] = {"_id": f"book-review-{slug}", "_type": "bookReview", "_rev": "r1"}
+            # Book b was merged against a revision that has been edited since
+            existing = {"_id": f"book-review-{slug}", "_rev": "stale" if slug == "b" else "r1"}
+            book = {"_id": f"book-review-{slug}", "_type": "bookReview", "title": slug.upper()}
+            self.uploader.upload_book_review(book, batch=batch, existing_doc=existing)
+            self.uploader.create_update_log(slug.upper(), slug, batch=batch)
+
+        results = batch.flush()
+
+        self.assertEqual(len(self.stub.mutate_payloads), 4)
+        by_label = {r["labels"][0]: r for r in results}
+        self.assertEqual(sorted(by_label), ["book-review-a", "book-review-b", "book-review-c"])
+        self.assertTrue(by_label["book-review-a"]["ok"] and by_label["book-review-c"]["ok"])
+        self.assertEqual(by_label["book-review-b"]["status"], 409)
+        self.assertEqual(self.stub.documents["book-review-a"]["title"], "A")
+        self.assertNotIn("title", self.stub.documents["book-review-b"])
+
+    def test_writes_of_one_label_share_a_transaction_when_interleaved(self):
+        batch = self.uploader.batch(max_mutations=2)
+        for doc_id, title in (("book-review-a", "A"), ("book-review-b", "B"), ("book-review-a", "A2")):
+            self.stub.documents.setdefault(doc_id, {"_id": doc_id, "_type": "bookReview"})
+            self.uploader.patch_document(doc_id, {"title": title}, batch=batch)
+
+        results = batch.flush()
+
+        self.assertEqual(sorted(r["labels"] for r in results), [["book-review-a"], ["book-review-b"]])
+        ids = sorted([m["patch"]["id"] for m in p["mutations"]] for p in self.stub.mutate_payloads)
+        self.assertEqual(ids, [["book-review-a", "book-review-a"], ["book-review-b"]])
+        self.assertEqual(self.stub.documents["book-review-a"]["title"], "A2")
+
+
+if __name__ == '__main__':
+    unittest.main()
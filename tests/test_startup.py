@@ -0,0 +1,47 @@
+import unittest
+import sys
+import os
+import json
+import subprocess
+
+sys.path.append(os.getcwd())
+
+# Importing the CLI entry points must stay cheap: --help, --plan, job status and the
+# like never talk to the LLM or Sanity. Before lazy imports `import main` took ~1s.
+IMPORT_BUDGET_SECONDS = 0.4
+ENTRY_POINTS = ["main", "scripts.jobs", "scripts.batch_process"]
+# Loaded on first use only (Summarizer, Chunker, SanityUploader, EpiubLoader, metrics server, ...)
+HEAVY_MODULES = ["openai", "httpx", "tenacity", "langchain_text_splitters", "requests", "dotenv",
+                 "bs4", "ebooklib", "http.server", "multiprocessing"]
+
+
+def import_seconds(module):
+    """Cumulative import time of `module` in a fresh interpreter, from -X importtime (best of 3)."""
+    timings = []
+    for _ in range(3):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True, cwd=os.getcwd(), check=True)
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module and not parts[2].startswith("  "):
+                timings.append(int(parts[1]) / 1e6)
+    return min(timings)
+
+
+class TestStartup(unittest.TestCase):
+    def test_entry_points_do_not_import_heavy_dependencies(self):
+        for module in ENTRY_POINTS:
+            code = (f"import json, sys, {module}; "
+                    f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+            proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                  cwd=os.getcwd(), check=True)
+            self.assertEqual(json.loads(proc.stdout.strip().splitlines()[-1]), [], module)
+
+    def test_import_time_budget(self):
+        for module in ENTRY_POINTS:
+            seconds = import_seconds(module)
+            self.assertLess(seconds, IMPORT_BUDGET_SECONDS, f"import {module} took {seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+import contextlib
+import warnings
+
+sys.path.append(os.getcwd())
+
+from bs4 import XMLParsedAsHTMLWarning
+from pipeline.ingest import EpiubLoader
+from scripts.synthetic_epub import generate_epub
+
+
+class TestSyntheticEpub(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # The loader parses XHTML with an HTML parser on purpose; silence only that, for this test
+        catcher = warnings.catch_warnings()
+        catcher.__enter__()
+        self.addCleanup(catcher.__exit__, None, None, None)
+        warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, **shape):
+        path = os.path.join(self.tmp.name, "book.epub")
+        stats = generate_epub(path, seed=3, **shape)
+        loader = EpiubLoader(path)
+        loader.load()
+        with contextlib.redirect_stdout(io.StringIO()):
+            chapters = loader.get_chapters()
+        return stats, loader, chapters
+
+    def test_loader_sees_the_generated_shape(self):
+        stats, loader, chapters = self.load(spine_files=12, toc_depth=3, anchors_per_file=3,
+                                            blank_pages=0, target_kb=60, images=2)
+        self.assertEqual(len(chapters), stats["toc_entries"])
+        self.assertEqual(sum(1 for ch in chapters if ch["title"].startswith("Part ")), stats["parts"])
+        self.assertEqual(max(ch["level"] for ch in chapters), 3)
+        self.assertEqual(sum(1 for ch in chapters if ch["title"].startswith("Section")), stats["anchors"])
+        cover = loader.get_cover()
+        self.assertTrue(cover[0].startswith(b"\x89PNG"))
+
+    def test_blank_pages_are_merged_with_their_continuation(self):
+        stats, _, chapters = self.load(spine_files=4, toc_depth=1, anchors_per_file=1,
+                                       blank_pages=4, target_kb=20, images=0)
+        self.assertEqual(stats["spine_files"], 8)
+        self.assertEqual(len(chapters), 4)
+        self.assertTrue(all(len(ch["content"]) > 2000 for ch in chapters))
+
+    def test_same_seed_same_book(self):
+        first = self.load(spine_files=3, toc_depth=1, target_kb=10)[2]
+        second = self.load(spine_files=3, toc_depth=1, target_kb=10)[2]
+        self.assertEqual([c["content"] for c in first], [c["content"] for c in second])
+
+
+if __name__ == '__main__':
+    unittest.main()
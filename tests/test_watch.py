@@ -0,0 +1,103 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+import threading
+import contextlib
+import io
+
+sys.path.append(os.getcwd())
+
+from pipeline.jobs import JobQueue
+from pipeline.watch import FolderWatcher
+from scripts import jobs as jobs_cli
+from tests.fakes import FakeClock
+
+
+class TestFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.clock = FakeClock()
+        self.watcher = FolderWatcher(self.dir, settle=5, use_inotify=False, clock=self.clock)
+
+    def tearDown(self):
+        self.watcher.close()
+        self.tmp.cleanup()
+
+    def write(self, name, data, mtime):
+        path = os.path.join(self.dir, name)
+        with open(path, 'ab') as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_waits_for_size_and_mtime_to_settle(self):
+        path = self.write("book.epub", b"part", mtime=100)
+        self.write("notes.txt", b"ignored", mtime=100)
+        self.assertEqual(self.watcher.scan(), [])
+        self.clock.now = 4
+        self.write("book.epub", b"more", mtime=104)  # Copy still in progress
+        self.assertEqual(self.watcher.scan(), [])
+        self.clock.now = 8
+        self.assertEqual(self.watcher.scan(), [])  # Only 4s since the last change
+        self.clock.now = 9
+        self.assertEqual(self.watcher.scan(), [path])
+        self.clock.now = 20
+        self.assertEqual(self.watcher.scan(), [])  # Reported once
+
+    def test_reports_a_replaced_book_again(self):
+        path = self.write("book.epub", b"v1", mtime=100)
+        self.watcher.scan()
+        self.clock.now = 5
+        self.assertEqual(self.watcher.scan(), [path])
+        self.write("book.epub", b"v2", mtime=200)
+        self.clock.now = 6
+        self.assertEqual(self.watcher.scan(), [])
+        self.clock.now = 11
+        self.assertEqual(self.watcher.scan(), [path])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux-only")
+    def test_inotify_wakes_up_on_new_files(self):
+        watcher = FolderWatcher(self.dir, settle=0, poll=30)
+        try:
+            self.assertEqual(watcher.mode, "inotify")
+            threading.Timer(0.2, self.write, args=("new.epub", b"x", time.time())).start()
+            start = time.monotonic()
+            watcher.wait()
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            watcher.close()
+
+
+class TestWatchEnqueue(unittest.TestCase):
+    def test_enqueues_settled_books_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, "book")
+            os.makedirs(folder)
+            queue = JobQueue(os.path.join(tmp, "jobs.sqlite"))
+            done = os.path.join(folder, "done.epub")
+            with open(done, 'wb') as f:
+                f.write(b"old")
+            os.utime(done, (time.time() - 3600, time.time() - 3600))
+            done_id = queue.enqueue(done)
+            queue.complete(queue.claim("w")["id"], "w")
+            new = os.path.join(folder, "new.epub")
+            with open(new, 'wb') as f:
+                f.write(b"new")
+
+            stop = threading.Event()
+            threading.Timer(0.5, stop.set).start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                jobs_cli.watch(queue, FolderWatcher(folder, settle=0.1, poll=0.05), stop, rating=4, options=["--restart"])
+
+            jobs = queue.jobs()
+            self.assertEqual(len(jobs), 2)  # done.epub hasn't changed since it was processed
+            self.assertEqual(queue.latest(done)["id"], done_id)
+            job = queue.latest(new)
+            self.assertEqual((job["state"], job["rating"], job["options"]), ("queued", 4, '["--restart"]'))
+
+
+if __name__ == '__main__':
+    unittest.main()